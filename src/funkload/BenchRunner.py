@@ -26,13 +26,17 @@ $Id: BenchRunner.py 24746 2005-08-31 09:59:27Z bdelbosc $
 from __future__ import absolute_import
 import os
 import platform
+import random
+import re
 import sys
 import threading
 import time
 import traceback
 import unittest
 from datetime import datetime
+from multiprocessing import Pipe, Process
 from optparse import OptionParser, TitledHelpFormatter
+from Queue import Queue, Empty, Full
 from socket import error as SocketError
 from thread import error as ThreadError
 from xmlrpclib import ServerProxy, Fault
@@ -40,8 +44,14 @@ import signal
 
 from .FunkLoadTestCase import FunkLoadTestCase
 from .FunkLoadHTTPServer import FunkLoadHTTPServer
+from .InjectorMonitor import InjectorMonitor
+from .BinaryResult import read_records
+from .LoadProfile import get_load_profile
+from .ResultSink import get_result_backpressure
+from .LiveStats import get_live_stats, parse_abort_rule, AbortRule
+from .ReportStats import InjectorStat
 from .utils import mmn_encode, set_recording_flag, recording, thread_sleep, \
-                  trace, red_str, green_str, get_version
+                  trace, red_str, green_str, get_version, close_logger
 try:
     from funkload.rtfeedback import (FeedbackSender, DEFAULT_ENDPOINT,
                                      DEFAULT_PUBSUB)
@@ -49,6 +59,14 @@ try:
 except ImportError:
     LIVE_FEEDBACK = False
     DEFAULT_PUBSUB = DEFAULT_ENDPOINT = None
+try:
+    import gevent.pool
+    from gevent.monkey import is_module_patched
+except ImportError:
+    gevent = None
+
+DEFAULT_RUNNER_CLASS = "funkload.BenchRunner.BenchRunner"
+ASYNC_RUNNER_CLASS = "funkload.BenchRunner.AsyncBenchRunner"
 
 
 USAGE = """%prog [options] file class.method
@@ -69,6 +87,21 @@ Examples
       MyTestCase.testSomething
                         Bench MyTestCase.testSomething on localhost:8080
                         with 2 cycles of 10 and 20 users for a duration of 30s.
+  %prog --engine=async -c 5000 myFile.py MyTestCase.testSomething
+                        Bench with 5000 users running as greenlets,
+                        requires gevent.
+  %prog --workers=4 -c 100:200 myFile.py MyTestCase.testSomething
+                        Share the users of each cycle between 4 local
+                        processes to use more than one CPU.
+  %prog --rates 50:100:200 myFile.py MyTestCase.testSomething
+                        Start 50, 100 then 200 tests per second whatever
+                        the response time of the server.
+  %prog --find-max --max-p95 0.5 -c 10 myFile.py MyTestCase.testSomething
+                        Search the maximum number of users from 10 with
+                        a P95 of the requests under 0.5s.
+  %prog --profile ramp:1:100 -D 300 myFile.py MyTestCase.testSomething
+                        Ramp from 1 to 100 users during 300s without
+                        stopping the users between cycles.
   %prog -h
                         More options.
 
@@ -170,93 +203,229 @@ class ThreadSignaller:
         self.keep_running = val
 
 
+class ProfileWindows:
+    """Stat windows of a load profile shared by the test runners.
+
+    A window is reported as a cycle with the number of users of the
+    profile at its middle."""
+    def __init__(self, window, cycles):
+        self.window = window
+        self.cycles = cycles
+        self.start = time.time()
+
+    def current(self):
+        """Return the cycle and the number of users of the current
+        window."""
+        cycle = int((time.time() - self.start) / self.window)
+        cycle = min(max(cycle, 0), len(self.cycles) - 1)
+        return cycle, self.cycles[cycle]
+
+
 class ThreadData:
     """Container for thread related data."""
-    def __init__(self, thread, thread_id, thread_signaller):
+    def __init__(self, thread, thread_id, thread_signaller, test=None):
         self.thread = thread
         self.thread_id = thread_id
         self.thread_signaller = thread_signaller
+        self.test = test
 
 
 # ------------------------------------------------------------
 # Classes
 #
-class LoopTestRunner(threading.Thread):
-    """Run a unit test in loop."""
+class LoopTestRunner:
+    """Run a unit test in loop.
+
+    The run loop of a virtual user, started in a thread or in a greenlet
+    by the bench runner."""
 
     def __init__(self, test_module, test_class, test_name, options,
                  cycle, cvus, thread_id, thread_signaller, sleep_time,
-                 debug=False, feedback=None):
+                 debug=False, feedback=None, pacing=0, windows=None,
+                 test=None):
         meta_method_name = mmn_encode(test_name, cycle, cvus, thread_id)
-        threading.Thread.__init__(self, target=self.run, name=meta_method_name,
-                                  args=())
-        self.test = load_unittest(test_module, test_class, meta_method_name,
-                                  options)
+        self.name = meta_method_name
+        if test is None:
+            test = load_unittest(test_module, test_class, meta_method_name,
+                                 options)
+        else:
+            # a warm test case of a previous virtual user
+            test._recycle(cycle, cvus, thread_id)
+        self.test = test
         if sys.platform.lower().startswith('win'):
             self.color = False
         else:
             self.color = not options.no_color
         self.sleep_time = sleep_time
+        self.pacing = pacing
+        self.windows = windows
         self.debug = debug
         self.thread_signaller = thread_signaller
-        # this makes threads endings if main stop with a KeyboardInterupt
-        self.setDaemon(1)
         self.feedback = feedback
 
     def run(self):
-        """Run a test in loop."""
+        """Run a test in loop.
+
+        With a pacing a test starts every pacing seconds, a late test
+        records its delay from the intended start."""
+        next_start = time.time()
         while (self.thread_signaller.running()):
-            test_result = unittest.TestResult()
-            self.test.clearContext()
-            self.test(test_result)
-            feedback = {}
+            if self.pacing:
+                self.runTest(next_start)
+                next_start += self.pacing
+                thread_sleep(max(0, next_start - time.time()))
+            else:
+                self.runTest()
+                thread_sleep(self.sleep_time)
+        self.test._release_result_buffer()
+
+    def runTest(self, intended=None):
+        """Run the test once, intended is the scheduled start time."""
+        test_result = unittest.TestResult()
+        self.test.clearContext()
+        self.test._intended_start = intended
+        if self.windows is not None:
+            self.test.cycle, self.test.cvus = self.windows.current()
+        self.test(test_result)
+        feedback = {}
+
+        if test_result.wasSuccessful():
+            if recording():
+                feedback['count'] = add_cycle_result('success')
+
+            if self.color:
+                trace(green_str('.'))
+            else:
+                trace('.')
 
-            if test_result.wasSuccessful():
+            feedback['result'] = 'success'
+        else:
+            if len(test_result.errors):
                 if recording():
-                    feedback['count'] = add_cycle_result('success')
+                    feedback['count'] = add_cycle_result('error')
 
                 if self.color:
-                    trace(green_str('.'))
+                    trace(red_str('E'))
                 else:
-                    trace('.')
+                    trace('E')
+
+                feedback['result'] = 'error'
 
-                feedback['result'] = 'success'
             else:
-                if len(test_result.errors):
-                    if recording():
-                        feedback['count'] = add_cycle_result('error')
+                if recording():
+                    feedback['count'] = add_cycle_result('failure')
 
-                    if self.color:
-                        trace(red_str('E'))
-                    else:
-                        trace('E')
+                if self.color:
+                    trace(red_str('F'))
+                else:
+                    trace('F')
 
-                    feedback['result'] = 'error'
+                feedback['result'] = 'failure'
 
-                else:
-                    if recording():
-                        feedback['count'] = add_cycle_result('failure')
+            if self.debug:
+                feedback['errors'] = test_result.errors
+                feedback['failures'] = test_result.failures
 
-                    if self.color:
-                        trace(red_str('F'))
-                    else:
-                        trace('F')
+                for (test, error) in test_result.errors:
+                    trace("ERROR %s: %s" % (str(test), str(error)))
+                for (test, error) in test_result.failures:
+                    trace("FAILURE %s: %s" % (str(test), str(error)))
 
-                    feedback['result'] = 'failure'
+        if self.feedback is not None:
+            self.feedback.test_done(feedback)
 
-                if self.debug:
-                    feedback['errors'] = test_result.errors
-                    feedback['failures'] = test_result.failures
 
-                    for (test, error) in test_result.errors:
-                        trace("ERROR %s: %s" % (str(test), str(error)))
-                    for (test, error) in test_result.failures:
-                        trace("FAILURE %s: %s" % (str(test), str(error)))
+class ArrivalScheduler(threading.Thread):
+    """Issue test starts at a given rate, independent of completions.
 
-            if self.feedback is not None:
-                self.feedback.test_done(feedback)
+    Start times follow a poisson or a constant schedule, they are queued
+    for a bounded pool of ArrivalTestRunner. A start is dropped when the
+    queue is full and late when a runner picks it after LATE_DELAY."""
+    LATE_DELAY = 0.01
 
-            thread_sleep(self.sleep_time)
+    def __init__(self, rate, arrival, pool_size, seed=None):
+        threading.Thread.__init__(self, name='FunkLoadArrivalScheduler')
+        self.setDaemon(1)
+        self.rate = rate
+        self.arrival = arrival
+        self.pool_size = pool_size
+        self.queue = Queue(pool_size)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.keep_running = True
+        self.stopping = threading.Event()
+        self.scheduled = self.late = self.dropped = 0
+
+    def interval(self):
+        """Return the delay until the next start."""
+        if self.arrival == 'constant':
+            return 1.0 / self.rate
+        return self.random.expovariate(self.rate)
+
+    def run(self):
+        """Schedule test starts until stopped."""
+        next_start = time.time()
+        while self.keep_running:
+            next_start += self.interval()
+            delay = next_start - time.time()
+            if delay > 0:
+                # wake up on stop, the delay is long for low rates
+                self.stopping.wait(delay)
+            if not self.keep_running:
+                break
+            try:
+                self.queue.put_nowait(next_start)
+            except Full:
+                if recording():
+                    self.count('dropped')
+                continue
+            if recording():
+                self.count('scheduled')
+
+    def count(self, name):
+        """Increment a counter."""
+        self.lock.acquire()
+        try:
+            setattr(self, name, getattr(self, name) + 1)
+        finally:
+            self.lock.release()
+
+    def get(self, timeout=0.1):
+        """Return the next scheduled start or None."""
+        try:
+            start = self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+        if recording() and time.time() - start > self.LATE_DELAY:
+            self.count('late')
+        return start
+
+    def stop(self):
+        """Stop scheduling."""
+        self.keep_running = False
+        self.stopping.set()
+        self.join()
+
+
+class ArrivalTestRunner(LoopTestRunner):
+    """Run a unit test each time the arrival scheduler issues a start."""
+
+    def __init__(self, test_module, test_class, test_name, options,
+                 cycle, cvus, thread_id, thread_signaller, scheduler,
+                 debug=False, feedback=None, test=None):
+        LoopTestRunner.__init__(self, test_module, test_class, test_name,
+                                options, cycle, cvus, thread_id,
+                                thread_signaller, 0, debug, feedback,
+                                test=test)
+        self.scheduler = scheduler
+
+    def run(self):
+        """Run a test for each scheduled start."""
+        while (self.thread_signaller.running()):
+            start = self.scheduler.get()
+            if start is not None:
+                self.runTest(start)
+        self.test._release_result_buffer()
 
 
 class BenchRunner:
@@ -286,13 +455,89 @@ class BenchRunner:
         self.sleep_time = test.conf_getFloat('bench', 'sleep_time')
         self.sleep_time_min = test.conf_getFloat('bench', 'sleep_time_min')
         self.sleep_time_max = test.conf_getFloat('bench', 'sleep_time_max')
+        self.pacing = test.conf_getFloat('bench', 'pacing', 0, quiet=True)
         self.threads = []  # Contains list of ThreadData objects
+        self.test_pool = []  # warm test cases of stopped threads
         self.last_thread_id = -1
         self.thread_creation_lock = threading.Lock()
+        self.workers = getattr(options, 'workers', None) or 1
+        self.backpressure = 0
+        self.worker_id = getattr(options, 'worker_id', None)
+        # open model: test starts are issued at a rate
+        self.rates = [float(rate) for rate in test.conf_getList(
+            'bench', 'rates', [], quiet=True)]
+        self.arrival = test.conf_get('bench', 'arrival', 'poisson',
+                                     quiet=True)
+        self.arrival_workers = test.conf_getInt('bench', 'arrival_workers',
+                                                100, quiet=True)
+        self.scheduler = None
+        if self.rates:
+            if self.arrival not in ('poisson', 'constant'):
+                raise Exception('Invalid arrival %r, use poisson or '
+                                'constant.' % self.arrival)
+            if self.workers > 1:
+                raise Exception('Arrival rates can not be used with '
+                                '--workers.')
+            for rate in self.rates:
+                if rate < 1:
+                    raise Exception('Invalid rate %s, the arrival rates are '
+                                    'at least 1 test/s.' % rate)
+            # cycles are labelled by their rate rounded to an integer in the
+            # results, the report lists the exact rates
+            self.cycles = [int(round(rate)) for rate in self.rates]
+        # load profile: users follow the profile during duration seconds
+        self.profile = test.conf_get('bench', 'profile', '', quiet=True)
+        self.profile_window = test.conf_getFloat('bench', 'profile_window',
+                                                 10, quiet=True)
+        self.windows = None
+        # find max mode: search the maximum load that respects the SLO
+        self.find_max = getattr(options, 'find_max', False)
+        self.max_p95 = test.conf_getFloat('bench', 'max_p95', 0, quiet=True)
+        self.max_error_percent = test.conf_getFloat(
+            'bench', 'max_error_percent', 1, quiet=True)
+        self.find_max_limit = test.conf_getFloat('bench', 'find_max_limit',
+                                                 10000, quiet=True)
+        self.find_max_precision = test.conf_getFloat(
+            'bench', 'find_max_precision', 10, quiet=True)
+        self.cycle_stats = None
+        # abort rules: stop the bench when the live stats breach a limit
+        self.abort_rules = []
+        for metric in AbortRule.METRICS:
+            spec = test.conf_get('bench', 'abort_if_' + metric, '',
+                                 quiet=True)
+            if spec:
+                rule = parse_abort_rule(metric, spec)
+                get_live_stats().keepSeconds(rule.period)
+                self.abort_rules.append(rule)
+        self.abort_reason = None
+        # injector monitoring: CPU usage and lag of the virtual users
+        self.injector_interval = test.conf_getFloat(
+            'bench', 'injector_interval', 1, quiet=True)
+        self.injector_max_lag = test.conf_getFloat(
+            'bench', 'injector_max_lag', 0.05, quiet=True)
+        self.injector_monitor = None
+        if self.abort_rules and self.workers > 1:
+            raise Exception('Abort rules can not be used with --workers.')
+        if self.find_max and (self.profile or self.workers > 1):
+            raise Exception('--find-max can not be used with a load profile '
+                            'or --workers.')
+        if self.profile:
+            if self.rates:
+                raise Exception('A load profile can not be used with '
+                                'arrival rates.')
+            if self.workers > 1:
+                raise Exception('A load profile can not be used with '
+                                '--workers.')
+            if self.profile_window <= 0:
+                raise Exception('Invalid profile_window %s.' %
+                                self.profile_window)
+            self.load_profile = get_load_profile(self.profile, self.duration)
+            # stat windows are reported as cycles
+            self.cycles = self.load_profile.windows(self.profile_window)
 
         # setup monitoring
         monitor_hosts = []                  # list of (host, port, descr)
-        if not options.is_distributed:
+        if not options.is_distributed and self.worker_id is None:
             hosts = test.conf_get('monitor', 'hosts', '', quiet=True).split()
             for host in hosts:
                 name = host
@@ -316,6 +561,12 @@ class BenchRunner:
         """Run all the cycles.
 
         return 0 on success, 1 if there were some failures and -1 on errors."""
+        if self.workers > 1:
+            return self.runWorkers()
+        if self.profile:
+            return self.runProfile()
+        if self.find_max:
+            return self.runFindMax()
 
         trace(str(self))
         trace("Benching\n")
@@ -329,39 +580,387 @@ class BenchRunner:
         self.getMonitorsConfig()
         trace('\n')
         for cvus in self.cycles:
-            t_start = time.time()
-            reset_cycle_results()
+            success, failures, errors = self.runCycle(cycle, cvus)
+            total_success += success
+            total_failures += failures
+            total_errors += errors
+            if self.abort_reason is not None:
+                self.abortBench(cycle)
+                break
+            cycle += 1
+        trace("* tearDownBench hook: ...")
+        self.test.tearDownBench()
+        trace(' done.\n\n')
+        self.logr_close()
+        return self.traceResult(total_success, total_failures, total_errors)
+
+    def runCycle(self, cycle, cvus):
+        """Run a cycle, return the number of success, failures and errors.
+
+        The live stats of the cycle are kept in cycle_stats."""
+        t_start = time.time()
+        reset_cycle_results()
+        if self.rates:
+            text = "Cycle #%i with %s tests/s\n" % (cycle, self.rates[cycle])
+        else:
             text = "Cycle #%i with %s virtual users\n" % (cycle, cvus)
-            trace(text)
-            trace('-' * (len(text) - 1) + "\n\n")
-            monitor_key = '%s:%s:%s' % (self.method_name, cycle, cvus)
-            trace("* setUpCycle hook: ...")
-            self.test.setUpCycle()
-            trace(' done.\n')
-            self.startMonitors(monitor_key)
+        trace(text)
+        trace('-' * (len(text) - 1) + "\n\n")
+        monitor_key = '%s:%s:%s' % (self.method_name, cycle, cvus)
+        trace("* setUpCycle hook: ...")
+        self.test.setUpCycle()
+        trace(' done.\n')
+        self.startMonitors(monitor_key)
+        self.startInjectorMonitor(lambda: (cycle, cvus))
+        if self.rates:
+            self.startArrivals(cycle, self.rates[cycle])
+        else:
             self.startThreads(cycle, cvus)
-            self.logging(cycle, cvus)
-            #self.dumpThreads()
-            self.stopThreads()
-            self.stopMonitors(monitor_key)
-            cycle += 1
-            trace("* tearDownCycle hook: ...")
-            self.test.tearDownCycle()
-            trace(' done.\n')
-            t_stop = time.time()
-            trace("* End of cycle, %.2fs elapsed.\n" % (t_stop - t_start))
-            success, failures, errors = get_cycle_results()
-            status, code = get_status(success, failures, errors, self.color)
-            trace("* Cycle result: **%s**, "
-                  "%i success, %i failure, %i errors.\n\n" % (
-                status, success, failures, errors))
+        self.logging(cycle, cvus)
+        self.cycle_stats = get_live_stats().getStats()
+        if self.scheduler is not None:
+            self.cycle_stats['scheduled'] = self.scheduler.scheduled
+            self.cycle_stats['dropped'] = self.scheduler.dropped
+        #self.dumpThreads()
+        self.stopThreads()
+        self.stopInjectorMonitor()
+        self.stopMonitors(monitor_key)
+        trace("* tearDownCycle hook: ...")
+        self.test.tearDownCycle()
+        trace(' done.\n')
+        t_stop = time.time()
+        trace("* End of cycle, %.2fs elapsed.\n" % (t_stop - t_start))
+        self.traceBackpressure()
+        success, failures, errors = get_cycle_results()
+        status, code = get_status(success, failures, errors, self.color)
+        trace("* Cycle result: **%s**, "
+              "%i success, %i failure, %i errors.\n\n" % (
+            status, success, failures, errors))
+        return success, failures, errors
+
+    def traceResult(self, success, failures, errors):
+        """Display the bench result, return the status code.
+
+        An aborted bench is a failure."""
+        trace("Result\n")
+        trace("======\n\n")
+        trace("* Success: %s\n" % success)
+        trace("* Failures: %s\n" % failures)
+        trace("* Errors: %s\n\n" % errors)
+        status, code = get_status(success, failures, errors)
+        if self.abort_reason is not None:
+            trace("* Aborted: %s\n\n" % self.abort_reason)
+            if code == 0:
+                status, code = get_status(success, max(failures, 1), errors)
+        trace("Bench status: **%s**\n" % status)
+        return code
+
+    def checkAbort(self):
+        """Check the abort rules on the live stats.
+
+        Return True on a breach, the reason is kept in abort_reason."""
+        for rule in self.abort_rules:
+            reason = rule.check(get_live_stats())
+            if reason is not None:
+                self.abort_reason = reason
+                return True
+        return False
+
+    def abortBench(self, cycle, cycles=None):
+        """Record the abort of the bench during cycle in the result log.
+
+        The cycles are truncated so the report ignores the skipped ones."""
+        if cycles is None:
+            cycles = self.cycles[:cycle + 1]
+        trace("* Bench aborted during cycle #%i: %s, %i cycles "
+              "skipped.\n\n" % (cycle, self.abort_reason,
+                                 len(self.cycles) - len(cycles)))
+        metadata = {'abort': 'cycle #%i: %s' % (cycle, self.abort_reason),
+                    'cycles': cycles}
+        if self.rates:
+            metadata['rates'] = self.rates[:cycle + 1]
+        self.test.addMetadata(ns=None, **metadata)
+
+    def runFindMax(self):
+        """Search the maximum sustainable load.
+
+        The load of the first cycle doubles until a cycle fails, then the
+        next loads bisect the interval between the best successful load and
+        the lowest failed load until it is smaller than find_max_precision
+        percent or than 1. A cycle fails when it breaks an SLO, drops
+        arrivals or when its STPS is lower than the STPS of the best
+        successful load."""
+        trace(str(self))
+        trace("Benching\n")
+        trace("========\n\n")
+        total_success = total_failures = total_errors = 0
+        self.logr_open()
+        trace("* setUpBench hook: ...")
+        self.test.setUpBench()
+        trace(' done.\n')
+        self.getMonitorsConfig()
+        trace('\n')
+        rates_mode = bool(self.rates)
+        if rates_mode:
+            level = self.rates[0]
+            self.rates = []
+        else:
+            level = self.cycles[0]
+        self.cycles = []
+        passed = failed = best = None
+        cycle = 0
+        while level is not None:
+            if rates_mode:
+                self.rates.append(level)
+                self.cycles.append(int(round(level)))
+            else:
+                self.cycles.append(level)
+            success, failures, errors = self.runCycle(cycle,
+                                                      self.cycles[cycle])
             total_success += success
             total_failures += failures
             total_errors += errors
+            # an aborted cycle fails without stopping the search
+            reason = self.abort_reason or self.checkCycle(
+                level, self.cycle_stats, best)
+            self.abort_reason = None
+            if reason is None:
+                passed, best = level, self.cycle_stats
+                trace("* Find max: %s passed with %.3f STPS.\n\n" % (
+                    level, best['stps']))
+            else:
+                failed = level
+                trace("* Find max: %s failed, %s.\n\n" % (level, reason))
+            level = self.nextLevel(passed, failed)
+            cycle += 1
+        if passed is None:
+            result = 'no sustainable load'
+        elif self.rates:
+            result = '%s tests/s with %.3f STPS' % (passed, best['stps'])
+        else:
+            result = '%s CUs with %.3f STPS' % (passed, best['stps'])
+        # the cycles are known at the end of the search
+        metadata = {'cycles': self.cycles, 'find_max': result}
+        if self.rates:
+            metadata['rates'] = self.rates
+        self.test.addMetadata(ns=None, **metadata)
         trace("* tearDownBench hook: ...")
         self.test.tearDownBench()
         trace(' done.\n\n')
         self.logr_close()
+        trace("* Maximum sustainable load: %s\n\n" % result)
+        return self.traceResult(total_success, total_failures, total_errors)
+
+    def checkCycle(self, level, stats, best):
+        """Return why a cycle of the find max mode failed or None."""
+        if not stats['tests']:
+            return 'no test finished'
+        if stats['error_percent'] > self.max_error_percent:
+            return '%.2f%% errors > %s%%' % (stats['error_percent'],
+                                             self.max_error_percent)
+        if self.max_p95 and stats['p95'] > self.max_p95:
+            return 'P95 %.3fs > %ss' % (stats['p95'], self.max_p95)
+        if stats.get('dropped'):
+            dropped = 100.0 * stats['dropped'] / (stats['dropped'] +
+                                                  stats['scheduled'])
+            if dropped > self.max_error_percent:
+                return '%.2f%% of the arrivals dropped' % dropped
+        if best is not None and stats['stps'] < best['stps']:
+            return '%.3f STPS < %.3f STPS, the throughput drops' % (
+                stats['stps'], best['stps'])
+        return None
+
+    def nextLevel(self, passed, failed):
+        """Return the next load of the find max mode or None to stop."""
+        if failed is None:
+            if passed >= self.find_max_limit:
+                return None
+            level = min(passed * 2, self.find_max_limit)
+        else:
+            low = passed or 0
+            if failed - low <= failed * self.find_max_precision / 100.0:
+                return None
+            level = (low + failed) / 2.0
+            if not self.rates:
+                level = int(level)
+            if level <= low or level >= failed or level < 1:
+                return None
+        if self.rates:
+            return float(level)
+        return int(level)
+
+    def runProfile(self):
+        """Run the load profile.
+
+        Threads are added or removed every second to follow the profile,
+        they are stopped only at the end of the bench."""
+        trace(str(self))
+        trace("Benching\n")
+        trace("========\n\n")
+        self.logr_open()
+        trace("* setUpBench hook: ...")
+        self.test.setUpBench()
+        trace(' done.\n')
+        self.getMonitorsConfig()
+        trace('\n')
+        text = "Load profile %s for %ss\n" % (self.profile, self.duration)
+        trace(text)
+        trace('-' * (len(text) - 1) + "\n\n")
+        monitor_key = '%s:0:%s' % (self.method_name, self.cycles[0])
+        reset_cycle_results()
+        trace("* setUpCycle hook: ...")
+        self.test.setUpCycle()
+        trace(' done.\n')
+        self.startMonitors(monitor_key)
+        trace("* Current time: %s\n" % datetime.now().isoformat())
+        self.windows = ProfileWindows(self.profile_window, self.cycles)
+        self.startInjectorMonitor(self.windows.current)
+        stopping = []
+        get_live_stats().reset()
+        set_recording_flag(True)
+        elapsed = 0
+        while elapsed < self.duration and not self.checkAbort():
+            # the profile follows the wall time even when a tick is late
+            cvus = max(0, self.load_profile.cvus(elapsed))
+            delta = cvus - len(self.threads)
+            self.thread_creation_lock.acquire()
+            try:
+                if delta > 0:
+                    trace("* %4ds: %i virtual users, starting threads: " % (
+                        elapsed, cvus))
+                    cycle = self.windows.current()[0]
+                    # no startup delay, it would stall the next ticks
+                    self.threads.extend(self.createThreads(cycle, delta,
+                                                           startup_delay=0))
+                elif delta < 0:
+                    trace("* %4ds: %i virtual users.\n" % (elapsed, cvus))
+                    # stopped threads finish their test without blocking
+                    for i in range(-delta):
+                        thread_data = self.threads.pop()
+                        thread_data.thread_signaller.set_running(False)
+                        stopping.append(thread_data)
+            finally:
+                self.thread_creation_lock.release()
+            # wait for the next second of the profile
+            tick = min(int(elapsed) + 1, self.duration)
+            delay = self.windows.start + tick - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            elapsed = time.time() - self.windows.start
+        set_recording_flag(False)
+        self.threads.extend(stopping)
+        self.stopThreads()
+        self.stopInjectorMonitor()
+        self.stopMonitors(monitor_key)
+        trace("* tearDownCycle hook: ...")
+        self.test.tearDownCycle()
+        trace(' done.\n')
+        self.traceBackpressure()
+        success, failures, errors = get_cycle_results()
+        if self.abort_reason is not None:
+            window = self.windows.current()[0]
+            self.abortBench(window, self.cycles[:window + 1])
+        trace("* tearDownBench hook: ...")
+        self.test.tearDownBench()
+        trace(' done.\n\n')
+        self.logr_close()
+        return self.traceResult(success, failures, errors)
+
+    def runWorkers(self):
+        """Run all the cycles sharding the virtual users across local
+        worker processes.
+
+        The parent process runs the hooks and the monitoring, it starts
+        each cycle on all workers at the same time and merges the worker
+        results into its own result file. The logging of a cycle begins
+        once all the workers have started their threads, as in a single
+        process bench."""
+        trace(str(self))
+        trace("Benching\n")
+        trace("========\n\n")
+        cycle = total_success = total_failures = total_errors = 0
+
+        self.logr_open()
+        trace("* setUpBench hook: ...")
+        self.test.setUpBench()
+        trace(' done.\n')
+        self.getMonitorsConfig()
+        self.test._flush_result_log()
+        trace("* Starting %i worker processes: " % self.workers)
+        workers = []
+        for worker_id in range(self.workers):
+            conn, worker_conn = Pipe()
+            process = Process(target=run_worker,
+                              args=(self.module_name, self.class_name,
+                                    self.method_name, self.options,
+                                    self.cycles, self.result_path,
+                                    worker_id, worker_conn))
+            process.daemon = True
+            process.start()
+            workers.append((process, conn))
+            trace('.')
+        trace(' done.\n\n')
+        try:
+            for cvus in self.cycles:
+                t_start = time.time()
+                text = "Cycle #%i with %s virtual users on %i workers\n" % (
+                    cycle, cvus, self.workers)
+                trace(text)
+                trace('-' * (len(text) - 1) + "\n\n")
+                monitor_key = '%s:%s:%s' % (self.method_name, cycle, cvus)
+                trace("* setUpCycle hook: ...")
+                self.test.setUpCycle()
+                trace(' done.\n')
+                trace("* Waiting for workers: ...")
+                for process, conn in workers:
+                    worker_recv(conn)
+                trace(' done.\n')
+                self.startMonitors(monitor_key)
+                trace("* Current time: %s\n" % datetime.now().isoformat())
+                trace("* Starting threads on workers: ...")
+                for process, conn in workers:
+                    conn.send(cycle)
+                for process, conn in workers:
+                    worker_recv(conn)
+                trace(' done.\n')
+                self.logging(cycle, cvus)
+                trace("* Waiting end of cycle on workers: ...")
+                success = failures = errors = 0
+                for process, conn in workers:
+                    w_success, w_failures, w_errors = worker_recv(conn)
+                    success += w_success
+                    failures += w_failures
+                    errors += w_errors
+                trace(' done.\n')
+                self.stopMonitors(monitor_key)
+                cycle += 1
+                trace("* tearDownCycle hook: ...")
+                self.test.tearDownCycle()
+                trace(' done.\n')
+                t_stop = time.time()
+                trace("* End of cycle, %.2fs elapsed.\n" % (t_stop - t_start))
+                status, code = get_status(success, failures, errors,
+                                          self.color)
+                trace("* Cycle result: **%s**, "
+                      "%i success, %i failure, %i errors.\n\n" % (
+                    status, success, failures, errors))
+                total_success += success
+                total_failures += failures
+                total_errors += errors
+        except EOFError:
+            trace(red_str("\nERROR: a worker process died, aborting.\n"))
+            for process, conn in workers:
+                process.terminate()
+            total_errors += 1
+        for process, conn in workers:
+            process.join()
+        trace("* tearDownBench hook: ...")
+        self.test.tearDownBench()
+        trace(' done.\n\n')
+        trace("* Merging worker results: ...")
+        self.mergeWorkerResults()
+        trace(' done.\n\n')
+        self.logr_close()
 
         # display bench result
         trace("Result\n")
@@ -373,6 +972,121 @@ class BenchRunner:
         trace("Bench status: **%s**\n" % status)
         return code
 
+    def runWorker(self, conn):
+        """Run the cycles of a worker process.
+
+        Each cycle starts when the parent process says so, the parent is
+        told when the threads are started and the cycle results are sent
+        back to it."""
+        self.logr_open()
+        for cycle, cvus in enumerate(self.cycles):
+            reset_cycle_results()
+            conn.send('ready')
+            worker_recv(conn)
+            self.startInjectorMonitor(lambda: (cycle, cvus))
+            self.startThreads(cycle, cvus)
+            conn.send('started')
+            self.logging(cycle, cvus, mid_cycle=False)
+            self.stopThreads()
+            self.stopInjectorMonitor()
+            conn.send(get_cycle_results())
+        self.logr_close()
+
+    def mergeWorkerResults(self):
+        """Append the worker result files to the result log.
+
+        Records are rewritten with the cycle number of CUs and with thread
+        ids made unique across workers."""
+        shares = [split_cvus(cvus, self.workers) for cvus in self.cycles]
+        self.test._flush_result_log()
+        writer = self.test._result_writer
+        if writer is None:
+            output = open(self.result_path, 'a')
+        for worker_id in range(self.workers):
+            path = worker_result_path(self.result_path, worker_id)
+            if not os.path.exists(path):
+                continue
+            offsets = [sum(share[:worker_id]) for share in shares]
+
+            def remap(match):
+                cycle = int(match.group(1))
+                thread = int(match.group(3)) + offsets[cycle]
+                return 'cycle="%.3i" cvus="%.3i" thread="%.3i"' % (
+                    cycle, self.cycles[cycle], thread)
+
+            def remap_xml(text):
+                lines = [WORKER_RECORD.sub(remap, line, 1)
+                         for line in text.splitlines(True)
+                         if not (line.startswith('<funkload') or
+                                 line.startswith('<config') or
+                                 line.startswith('</funkload>'))]
+                return ''.join(lines)
+
+            if writer is None:
+                f = open(path)
+                output.write(remap_xml(f.read()))
+                f.close()
+            else:
+                for tag, values, extra in read_records(path):
+                    if tag == 'X':
+                        text = remap_xml(values).rstrip('\n')
+                        if text:
+                            writer.writeXml(text)
+                        continue
+                    cycle = values[0]
+                    values[1] = self.cycles[cycle]
+                    values[2] += offsets[cycle]
+                    writer.writeRecord(tag, values, extra)
+            os.remove(path)
+        if writer is None:
+            output.close()
+
+    def traceBackpressure(self):
+        """Report the waits of virtual users on full result buffers."""
+        backpressure = get_result_backpressure()
+        if backpressure > self.backpressure:
+            trace("* Result writer is late: %i waits on full result "
+                  "buffers.\n" % (backpressure - self.backpressure))
+        self.backpressure = backpressure
+
+    def startInjectorMonitor(self, current):
+        """Start sampling the injector.
+
+        current returns the cycle and the number of virtual users."""
+        if self.injector_interval <= 0:
+            return
+        self.injector_monitor = InjectorMonitor(self.injector_interval,
+                                                current)
+        self.injector_monitor.start()
+
+    def stopInjectorMonitor(self):
+        """Stop sampling the injector and log the samples, warn when the
+        virtual users lag behind their schedule."""
+        if self.injector_monitor is None:
+            return
+        records = self.injector_monitor.stop()
+        self.injector_monitor = None
+        if not records:
+            return
+        self.logr('\n'.join([repr(record) for record in records]))
+        stat = InjectorStat(records[0].cycle, records[0].cvus)
+        for record in records:
+            stat.add(record.cpu, record.sleeps, record.sleep_lag,
+                     record.sleep_lag_max, record.starts, record.start_lag,
+                     record.start_lag_max)
+        stat.finalize()
+        trace("* Injector: %.0f%% CPU (max %.0f%%), sleep lag %.3fs "
+              "(max %.3fs), start lag %.3fs (max %.3fs).\n" % (
+                  stat.cpu, stat.cpu_max, stat.sleep_lag, stat.sleep_lag_max,
+                  stat.start_lag, stat.start_lag_max))
+        if stat.lag() > self.injector_max_lag:
+            text = ("* WARNING: the injector lags %.3fs > %ss, response "
+                    "times include a client side delay.\n" % (
+                        stat.lag(), self.injector_max_lag))
+            if self.color:
+                text = red_str(text)
+            trace(text)
+
     def createThreadId(self):
         self.last_thread_id += 1
         return self.last_thread_id
@@ -390,6 +1104,23 @@ class BenchRunner:
             set_recording_flag(True)
             self.thread_creation_lock.release()
 
+    def startArrivals(self, cycle, rate):
+        """Starts the arrival scheduler and its pool of threads."""
+        self.thread_creation_lock.acquire()
+        try:
+            trace("* Current time: %s\n" % datetime.now().isoformat())
+            trace("* Starting %i threads for %s tests/s: " % (
+                self.arrival_workers, rate))
+            set_recording_flag(False)
+            self.scheduler = ArrivalScheduler(rate, self.arrival,
+                                              self.arrival_workers)
+            threads = self.createThreads(cycle, self.arrival_workers)
+            self.threads.extend(threads)
+            self.scheduler.start()
+        finally:
+            set_recording_flag(True)
+            self.thread_creation_lock.release()
+
     def addThreads(self, number_of_threads):
         """Adds new threads to existing list. Used to dynamically add new
            threads during a debug bench run."""
@@ -404,22 +1135,26 @@ class BenchRunner:
             set_recording_flag(True)
             self.thread_creation_lock.release()
 
-    def createThreads(self, cycle, number_of_threads):
+    def createThreads(self, cycle, number_of_threads, startup_delay=None):
         """Creates number_of_threads threads and returns as a list.
 
+        The threads are started every startup_delay seconds, the
+        startup_delay of the bench by default.
+
         NOTE: This method is not thread safe. Thread safety must be
         handled by the caller."""
+        if startup_delay is None:
+            startup_delay = self.startup_delay
         threads = []
         i = 0
         for i in range(number_of_threads):
             thread_id = self.createThreadId()
             thread_signaller = ThreadSignaller()
-            thread = LoopTestRunner(self.module_name, self.class_name,
-                                    self.method_name, self.options,
-                                    cycle, number_of_threads,
-                                    thread_id, thread_signaller,
-                                    self.sleep_time,
-                                    feedback=self.feedback)
+            runner = self.createRunner(cycle, number_of_threads, thread_id,
+                                       thread_signaller)
+            thread = threading.Thread(target=runner.run, name=runner.name)
+            # this makes threads endings if main stop with a KeyboardInterupt
+            thread.setDaemon(1)
             trace(".")
             try:
                 thread.start()
@@ -428,33 +1163,67 @@ class BenchRunner:
                       "smaller stack size using: 'ulimit -s 2048' "
                       "for example\n" % (i + 1))
                 raise
-            thread_data = ThreadData(thread, thread_id, thread_signaller)
+            thread_data = ThreadData(thread, thread_id, thread_signaller,
+                                     runner.test)
             threads.append(thread_data)
-            thread_sleep(self.startup_delay)
+            # the ramp up of the injector is not a lag of the users
+            thread_sleep(startup_delay, lag=False)
         trace(' done.\n')
         return threads
 
-    def logging(self, cycle, cvus):
+    def createRunner(self, cycle, cvus, thread_id, thread_signaller):
+        """Return the test runner of a virtual user.
+
+        The test case of a stopped virtual user is reused when possible."""
+        test = None
+        if self.test_pool:
+            test = self.test_pool.pop()
+        if self.scheduler is not None:
+            return ArrivalTestRunner(self.module_name, self.class_name,
+                                     self.method_name, self.options,
+                                     cycle, self.cycles[cycle], thread_id,
+                                     thread_signaller, self.scheduler,
+                                     feedback=self.feedback, test=test)
+        return LoopTestRunner(self.module_name, self.class_name,
+                              self.method_name, self.options,
+                              cycle, cvus, thread_id, thread_signaller,
+                              self.sleep_time, feedback=self.feedback,
+                              pacing=self.pacing, windows=self.windows,
+                              test=test)
+
+    def logging(self, cycle, cvus, mid_cycle=True):
         """Log activity during duration."""
         duration = self.duration
         end_time = time.time() + duration
         mid_time = time.time() + duration / 2
         trace("* Logging for %ds (until %s): " % (
             duration, datetime.fromtimestamp(end_time).isoformat()))
+        get_live_stats().reset()
         set_recording_flag(True)
-        while time.time() < mid_time:
+        while time.time() < mid_time and not self.checkAbort():
             time.sleep(1)
-        self.test.midCycle(cycle, cvus)
-        while time.time() < end_time:
+        if mid_cycle and self.abort_reason is None:
+            self.test.midCycle(cycle, cvus)
+        while time.time() < end_time and self.abort_reason is None:
             # wait
             time.sleep(1)
+            self.checkAbort()
         set_recording_flag(False)
-        trace(" done.\n")
+        if self.abort_reason is not None:
+            trace(" aborted.\n")
+        else:
+            trace(" done.\n")
 
     def stopThreads(self):
         """Stops all running threads."""
         self.thread_creation_lock.acquire()
         try:
+            if self.scheduler is not None:
+                self.scheduler.stop()
+                trace("* Arrivals: %i scheduled, %i late, %i dropped.\n" % (
+                    self.scheduler.scheduled, self.scheduler.late,
+                    self.scheduler.dropped))
+                self.scheduler = None
             trace("* Waiting end of threads: ")
             self.deleteThreads(len(self.threads))
             self.threads = []
@@ -491,6 +1260,8 @@ class BenchRunner:
             removed_threads.append(thread_data)
         for thread_data in removed_threads:
             thread_data.thread.join()
+            if thread_data.test is not None:
+                self.test_pool.append(thread_data.test)
             del thread_data
             trace('.')
 
@@ -606,9 +1377,27 @@ class BenchRunner:
                   'python_version': platform.python_version()}
         if self.options.label:
             config['label'] = self.options.label
+        if self.rates:
+            config['rates'] = self.rates
+            config['arrival'] = self.arrival
+            config['arrival_workers'] = self.arrival_workers
+        elif self.pacing:
+            config['pacing'] = self.pacing
+        if self.profile:
+            # a window is reported as a cycle
+            config['duration'] = self.profile_window
+            config['profile'] = self.profile
+            config['profile_duration'] = self.duration
 
         for (name, host, port, desc) in self.monitor_hosts:
             config[name] = desc
+        if self.find_max:
+            config['max_p95'] = self.max_p95
+            config['max_error_percent'] = self.max_error_percent
+        for rule in self.abort_rules:
+            config['abort_if_' + rule.metric] = str(rule)
+        if self.injector_interval > 0:
+            config['injector_max_lag'] = self.injector_max_lag
         self.test._open_result_log(**config)
 
     def logr_close(self):
@@ -631,16 +1420,139 @@ class BenchRunner:
         text.append("* Configuration file: %s" % self.config_path)
         text.append("* Log xml: %s" % self.result_path)
         text.append("* Server: %s" % self.test_url)
-        text.append("* Cycles: %s" % self.cycles)
-        text.append("* Cycle duration: %ss" % self.duration)
+        if self.rates:
+            text.append("* Arrival rates: %s tests/s (%s), %i threads" % (
+                self.rates, self.arrival, self.arrival_workers))
+        elif self.profile:
+            text.append("* Load profile: %s, stats by windows of %ss" % (
+                self.profile, self.profile_window))
+        else:
+            text.append("* Cycles: %s" % self.cycles)
+        if self.profile:
+            text.append("* Profile duration: %ss" % self.duration)
+        else:
+            text.append("* Cycle duration: %ss" % self.duration)
         text.append("* Sleeptime between request: from %ss to %ss" % (
             self.sleep_time_min, self.sleep_time_max))
-        text.append("* Sleeptime between test case: %ss" % self.sleep_time)
+        if self.find_max:
+            text.append("* Find max from %s, SLO: P95 <= %ss, errors <= %s%%" % (
+                (self.rates or self.cycles)[0], self.max_p95 or '-',
+                self.max_error_percent))
+        for rule in self.abort_rules:
+            text.append("* Abort if %s" % rule)
+        if self.pacing and not self.rates:
+            text.append("* Test case pacing: %ss" % self.pacing)
+        else:
+            text.append("* Sleeptime between test case: %ss" %
+                        self.sleep_time)
         text.append("* Startup delay between thread: %ss\n\n" %
                     self.startup_delay)
         return '\n'.join(text)
 
 
+class AsyncBenchRunner(BenchRunner):
+    """Run a unit test in bench mode using greenlets instead of threads.
+
+    Each virtual user runs the LoopTestRunner loop as a greenlet on the
+    gevent event loop, no Thread object is created per user and the
+    startup delays are timers of the event loop: the users start on a
+    fixed schedule whatever the time spent creating their test case.
+    Requires gevent, the standard library is monkey patched when funkload
+    is imported."""
+
+    def __init__(self, module_name, class_name, method_name, options):
+        if gevent is None:
+            raise Exception('The async engine requires gevent, '
+                            'try: pip install gevent')
+        for module in ('socket', 'time', 'thread'):
+            if not is_module_patched(module):
+                raise Exception('The async engine requires the %s module '
+                                'to be patched by gevent.' % module)
+        BenchRunner.__init__(self, module_name, class_name, method_name,
+                             options)
+        self.pool = gevent.pool.Group()
+
+    def createThreads(self, cycle, number_of_threads, startup_delay=None):
+        """Spawns number_of_threads greenlets and returns them as a list.
+
+        The i-th greenlet starts i * startup_delay seconds after the call,
+        the method returns startup_delay seconds after the last start.
+
+        NOTE: This method is not thread safe. Thread safety must be
+        handled by the caller."""
+        if startup_delay is None:
+            startup_delay = self.startup_delay
+        start = time.time()
+        threads = []
+        for i in range(number_of_threads):
+            thread_id = self.createThreadId()
+            thread_signaller = ThreadSignaller()
+            runner = self.createRunner(cycle, number_of_threads, thread_id,
+                                       thread_signaller)
+            trace(".")
+            greenlet = gevent.spawn_later(
+                max(0, start + i * startup_delay - time.time()), runner.run)
+            self.pool.add(greenlet)
+            threads.append(ThreadData(greenlet, thread_id, thread_signaller,
+                                      runner.test))
+        # the ramp up of the injector is not a lag of the users
+        thread_sleep(max(0, start + number_of_threads * startup_delay -
+                         time.time()), lag=False)
+        trace(' done.\n')
+        return threads
+
+    def __repr__(self):
+        """Display bench information."""
+        return BenchRunner.__repr__(self).rstrip('\n') + \
+               "\n* Engine: async (gevent)\n\n"
+
+
+# ------------------------------------------------------------
+# multi-process bench
+#
+WORKER_RECORD = re.compile(r'cycle="(\d+)" cvus="(\d+)" thread="(\d+)"')
+
+
+def split_cvus(cvus, workers):
+    """Return the number of CUs handled by each worker."""
+    return [cvus // workers + (i < cvus % workers and 1 or 0)
+            for i in range(workers)]
+
+
+def worker_result_path(result_path, worker_id):
+    """Return the result file path of a worker."""
+    root, ext = os.path.splitext(result_path)
+    return '%s-worker%i%s' % (root, worker_id, ext)
+
+
+def worker_recv(conn):
+    """Wait for a message on a worker pipe.
+
+    Polling first keeps the wait cooperative when gevent patched the
+    stdlib."""
+    while not conn.poll(1):
+        pass
+    return conn.recv()
+
+
+def run_worker(module_name, class_name, method_name, options, cycles,
+               result_path, worker_id, conn):
+    """Entry point of a worker process of a --workers bench."""
+    # the result logger of the parent process is inherited by the fork
+    close_logger("FunkLoadResult")
+    sys.stdout = open(os.devnull, 'w')
+    workers = options.workers
+    options.workers = 1
+    options.worker_id = worker_id
+    options.bench_cycles = ':'.join(
+        [str(split_cvus(cvus, workers)[worker_id]) for cvus in cycles])
+    options.bench_result_path = worker_result_path(result_path, worker_id)
+    RunnerClass = get_options_runner_class(options)
+    bench = RunnerClass(module_name, class_name, method_name, options)
+    bench.runWorker(conn)
+    conn.close()
+
+
 class BenchLoader(unittest.TestLoader):
     suiteClass = list
     def loadTestsFromTestCase(self, testCaseClass):
@@ -712,6 +1624,14 @@ def get_runner_class(class_path):
     _module = __import__(module_path, globals(), locals(), class_name, -1)
     return getattr(_module, class_name)
 
+def get_options_runner_class(options):
+    """Return the bench runner class selected by --runner-class and
+    --engine."""
+    runner_class = options.bench_runner_class
+    if options.engine == 'async' and runner_class == DEFAULT_RUNNER_CLASS:
+        runner_class = ASYNC_RUNNER_CLASS
+    return get_runner_class(runner_class)
+
 def parse_sys_args(sys_args):
     parser = get_shared_OptionParser()
     parser.add_option("", "--config",
@@ -756,8 +1676,24 @@ def get_shared_OptionParser():
     parser.add_option("-r", "--runner-class",
                       type="string",
                       dest="bench_runner_class",
-                      default="funkload.BenchRunner.BenchRunner",
+                      default=DEFAULT_RUNNER_CLASS,
                       help="Python dotted import path to BenchRunner class to use.")
+    parser.add_option("", "--engine",
+                      type="choice",
+                      choices=["thread", "async"],
+                      dest="engine",
+                      default="thread",
+                      help="Virtual user engine: 'thread' runs one OS thread "
+                           "per virtual user, 'async' runs virtual users as "
+                           "greenlets on an event loop (requires gevent), "
+                           "default is thread.")
+    parser.add_option("-w", "--workers",
+                      type="int",
+                      dest="workers",
+                      default=1,
+                      help="Number of local processes used to run the "
+                           "virtual users, the CUs of each cycle are "
+                           "shared between the workers, default is 1.")
     parser.add_option("", "--no-color",
                       action="store_true",
                       help="Monochrome output.")
@@ -777,7 +1713,10 @@ def get_shared_OptionParser():
                            "at run-time. Currently supported parameters: "
                            "/cvu?inc=<integer> to increase the number of "
                            "CVUs, /cvu?dec=<integer> to decrease the number "
-                           "of CVUs, /getcvu returns number of CVUs ")
+                           "of CVUs, /getcvu returns number of CVUs, "
+                           "/status and /metrics return the stats of the "
+                           "last 1s, 10s and 60s in JSON and OpenMetrics "
+                           "text.")
     parser.add_option("--debug-server-port",
                       type="string",
                       dest="debugport",
@@ -850,6 +1789,42 @@ def get_shared_OptionParser():
                       help="Cycles to bench, colon-separated list of "
                            "virtual concurrent users. To run a bench with 3 "
                            "cycles of 5, 10 and 20 users, use: -c 5:10:20")
+    parser.add_option("", "--rates",
+                      type="string",
+                      dest="bench_rates",
+                      help="Arrival rates to bench instead of cycles of "
+                           "concurrent users, colon-separated list of tests "
+                           "started per second. To run 3 cycles of 50, 100 "
+                           "and 200 tests/s, use: --rates 50:100:200")
+    parser.add_option("", "--arrival",
+                      type="choice",
+                      choices=["poisson", "constant"],
+                      dest="bench_arrival",
+                      help="Schedule of the test starts with --rates: "
+                           "poisson or constant, default is poisson.")
+    parser.add_option("", "--profile",
+                      type="string",
+                      dest="bench_profile",
+                      help="Load profile to follow during the duration "
+                           "instead of cycles, users are added or removed "
+                           "while running: ramp:1:100, step:10:20:30, "
+                           "spike:10:100, sine:50:40 or csv:profile.csv")
+    parser.add_option("", "--find-max",
+                      action="store_true",
+                      dest="find_max",
+                      help="Search the maximum sustainable load: start with "
+                           "the first cycle or rate, double it until the "
+                           "SLO is broken then bisect around the knee.")
+    parser.add_option("", "--max-p95",
+                      type="string",
+                      dest="bench_max_p95",
+                      help="SLO of --find-max: maximum P95 of the requests "
+                           "in seconds.")
+    parser.add_option("", "--max-error-percent",
+                      type="string",
+                      dest="bench_max_error_percent",
+                      help="SLO of --find-max: maximum percent of tests in "
+                           "error, default is 1.")
     parser.add_option("-D", "--duration",
                       type="string",
                       dest="bench_duration",
@@ -905,7 +1880,7 @@ def run_distributed(options, module_name, class_name, method_name, sys_args):
 
 def run_local(options, module_name, class_name, method_name):
     ret = None
-    RunnerClass = get_runner_class(options.bench_runner_class)
+    RunnerClass = get_options_runner_class(options)
     bench = RunnerClass(module_name, class_name, method_name, options)
     
     # Start a HTTP server optionally
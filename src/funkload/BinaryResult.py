@@ -0,0 +1,269 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+"""Binary result file, a compact alternative to the xml result lines.
+
+Used when ``result_format = binary`` is set in the bench or ftest section.
+
+The file starts with a magic string followed by records, each record
+starts with a one byte tag:
+
+* S: a string of the dictionary, (id, length) followed by the utf-8 bytes
+* R: a response, fixed width fields of RESPONSE_FIELDS
+* T: a test result, fixed width fields of TEST_RESULT_FIELDS
+* X: a chunk of xml (funkload, config, monitor, response with body...)
+
+The string fields (url, description, suite, name...) are interned, only
+their id is stored in R and T records. R and T records end with a count of
+extra (key, value) string attributes like a traceback.
+"""
+from __future__ import absolute_import
+import atexit
+import os
+import struct
+import threading
+import time
+from xml.sax.saxutils import quoteattr
+
+MAGIC = 'FLBINRES\x00\x01'
+
+# (xml attribute, kind, xml format), kind is i: int, s: string, d: float
+RESPONSE_FIELDS = (
+    ('cycle', 'i', '%.3i'), ('cvus', 'i', '%.3i'), ('thread', 'i', '%.3i'),
+    ('suite', 's', '%s'), ('name', 's', '%s'), ('step', 'i', '%.3i'),
+    ('number', 'i', '%.3i'), ('type', 's', '%s'), ('result', 's', '%s'),
+    ('url', 's', '%s'), ('code', 's', '%s'), ('description', 's', '%s'),
+    ('time', 'd', '%s'), ('duration', 'd', '%s'))
+
+TEST_RESULT_FIELDS = (
+    ('cycle', 'i', '%.3i'), ('cvus', 'i', '%.3i'), ('thread', 'i', '%.3i'),
+    ('suite', 's', '%s'), ('name', 's', '%s'), ('time', 'd', '%s'),
+    ('result', 's', '%s'), ('steps', 'i', '%s'), ('duration', 'd', '%s'),
+    ('connection_duration', 'd', '%s'), ('requests', 'i', '%s'),
+    ('pages', 'i', '%s'), ('xmlrpc', 'i', '%s'), ('redirects', 'i', '%s'),
+    ('images', 'i', '%s'), ('links', 'i', '%s'))
+
+RECORDS = {'R': ('response', RESPONSE_FIELDS),
+           'T': ('testResult', TEST_RESULT_FIELDS)}
+
+_STRUCT_KIND = {'i': 'I', 's': 'I', 'd': 'd'}
+STRUCTS = {}
+for tag, (name, fields) in RECORDS.items():
+    STRUCTS[tag] = struct.Struct(
+        '<' + ''.join([_STRUCT_KIND[kind] for attr, kind, fmt in fields]) +
+        'H')
+STRING = struct.Struct('<II')
+CHUNK = struct.Struct('<I')
+
+
+def _utf8(value):
+    """Return an utf-8 encoded str."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def is_binary_result(path):
+    """Is the file a binary result file ?"""
+    f = open(path, 'rb')
+    head = f.read(len(MAGIC))
+    f.close()
+    return head == MAGIC
+
+
+class BinaryResultWriter:
+    """Append records to a binary result file, thread safe."""
+    def __init__(self, path):
+        if os.access(path, os.F_OK):
+            os.rename(path, path + '.bak-' + str(int(time.time())))
+        self.path = path
+        self.lock = threading.Lock()
+        self.strings = {}
+        self.output = open(path, 'wb')
+        self.output.write(MAGIC)
+
+    def _intern(self, value):
+        """Return the id of a string, lock must be held."""
+        value = _utf8(value)
+        sid = self.strings.get(value)
+        if sid is None:
+            sid = len(self.strings)
+            self.strings[value] = sid
+            self.output.write('S' + STRING.pack(sid, len(value)) + value)
+        return sid
+
+    def writeRecord(self, tag, values, extra=None):
+        """Write a R or T record, values are in the order of the fields."""
+        fields = RECORDS[tag][1]
+        extra = extra or {}
+        self.lock.acquire()
+        try:
+            row = []
+            for (attr, kind, fmt), value in zip(fields, values):
+                if kind == 's':
+                    value = self._intern(value)
+                elif kind == 'i':
+                    value = int(value)
+                else:
+                    value = float(value)
+                row.append(value)
+            row.append(len(extra))
+            data = [tag, STRUCTS[tag].pack(*row)]
+            for key, value in extra.items():
+                value = _utf8(value)
+                data.append(STRING.pack(self._intern(key), len(value)))
+                data.append(value)
+            self.output.write(''.join(data))
+        finally:
+            self.lock.release()
+
+    def writeXml(self, text):
+        """Write a chunk of xml."""
+        text = _utf8(text)
+        self.lock.acquire()
+        try:
+            self.output.write('X' + CHUNK.pack(len(text)) + text)
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        """Flush the file."""
+        self.lock.acquire()
+        try:
+            self.output.flush()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Close the file."""
+        self.lock.acquire()
+        try:
+            self.output.close()
+        finally:
+            self.lock.release()
+
+
+# writers are shared by all the test cases logging into the same file
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_binary_writer(path):
+    """Return the writer of a binary result file."""
+    _writers_lock.acquire()
+    try:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = BinaryResultWriter(path)
+    finally:
+        _writers_lock.release()
+    return writer
+
+
+def close_binary_writer(path):
+    """Close the writer of a binary result file."""
+    _writers_lock.acquire()
+    try:
+        writer = _writers.pop(path, None)
+    finally:
+        _writers_lock.release()
+    if writer is not None:
+        writer.close()
+
+
+def close_binary_writers():
+    """Close all the writers."""
+    for path in _writers.keys():
+        close_binary_writer(path)
+
+atexit.register(close_binary_writers)
+
+
+def read_records(path):
+    """Iterate over the records of a binary result file.
+
+    Yield ('X', xml_text, None) or (tag, values, extra) where values are
+    in the order of the fields with strings resolved."""
+    f = open(path, 'rb')
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError('Not a FunkLoad binary result file: %s' % path)
+    strings = {}
+    read = f.read
+    try:
+        while True:
+            tag = read(1)
+            if not tag:
+                break
+            if tag == 'S':
+                sid, length = STRING.unpack(read(STRING.size))
+                strings[sid] = read(length).decode('utf-8')
+            elif tag == 'X':
+                length = CHUNK.unpack(read(CHUNK.size))[0]
+                yield 'X', read(length), None
+            elif tag in RECORDS:
+                fields = RECORDS[tag][1]
+                row = STRUCTS[tag].unpack(read(STRUCTS[tag].size))
+                values = []
+                for (attr, kind, fmt), value in zip(fields, row):
+                    if kind == 's':
+                        value = strings[value]
+                    values.append(value)
+                extra = {}
+                for i in range(row[-1]):
+                    sid, length = STRING.unpack(read(STRING.size))
+                    extra[strings[sid]] = read(length).decode('utf-8')
+                yield tag, values, extra
+            else:
+                raise ValueError('Invalid record %r in %s' % (tag, path))
+    except struct.error:
+        # truncated file, the bench was interrupted
+        pass
+    f.close()
+
+
+def record_attrs(tag, values, extra):
+    """Return the element name and the xml attributes of a record."""
+    name, fields = RECORDS[tag]
+    attrs = {}
+    for (attr, kind, fmt), value in zip(fields, values):
+        attrs[attr] = unicode(fmt % value)
+    attrs.update(extra)
+    return name, attrs
+
+
+def record_xml(tag, values, extra):
+    """Return the xml element of a record as logged in a xml result."""
+    name, fields = RECORDS[tag]
+    xml = ['<' + name]
+    for (attr, kind, fmt), value in zip(fields, values):
+        if kind == 's':
+            xml.append('%s=%s' % (attr, quoteattr(value)))
+        else:
+            xml.append('%s="%s"' % (attr, fmt % value))
+    for key, value in extra.items():
+        xml.append('%s=%s' % (key, quoteattr(value)))
+    xml.append('/>')
+    return _utf8(' '.join(xml))
+
+
+def binary_to_xml(path, xml_path):
+    """Convert a binary result file into a xml result file."""
+    output = open(xml_path, 'w')
+    for tag, values, extra in read_records(path):
+        if tag == 'X':
+            output.write(values + '\n')
+        else:
+            output.write(record_xml(tag, values, extra) + '\n')
+    output.close()
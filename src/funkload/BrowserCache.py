@@ -0,0 +1,179 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+"""HTTP cache of the patched webunit browser, see RFC 7234.
+
+The page resources of a virtual user are stored with their freshness
+lifetime and their validators. A fresh resource is not requested again, a
+stale one is revalidated with a conditional request and a 304 response
+reuses the stored body.
+"""
+from __future__ import absolute_import
+import time
+import threading
+from email.utils import parsedate_tz, mktime_tz
+
+# status codes of the stored responses
+CACHEABLE_CODES = (200, 203)
+# part of the age of a resource used as its lifetime without explicit
+# expiration, rfc 7234 section 4.2.2
+HEURISTIC_FRACTION = 0.1
+
+
+def parse_http_date(text):
+    """Return the time of an HTTP date or None when it is invalid."""
+    if not text:
+        return None
+    parsed = parsedate_tz(text)
+    if parsed is None:
+        return None
+    try:
+        return mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+
+def cache_directives(headers):
+    """Return the Cache-Control directives of response headers, a dict of
+    name -> value."""
+    directives = {}
+    for header in headers.getheaders('cache-control'):
+        for item in header.split(','):
+            name, sep, value = item.partition('=')
+            name = name.strip().lower()
+            if name:
+                directives[name] = value.strip().strip('"')
+    return directives
+
+
+def freshness_lifetime(headers, now):
+    """Return the number of seconds a response is fresh, None when it
+    must not be stored."""
+    directives = cache_directives(headers)
+    if 'no-store' in directives or headers.get('vary', '').strip() == '*':
+        return None
+    if 'no-cache' in directives:
+        return 0
+    try:
+        age = max(int(headers.get('age', 0)), 0)
+    except ValueError:
+        age = 0
+    if 'max-age' in directives:
+        try:
+            return max(int(directives['max-age']) - age, 0)
+        except ValueError:
+            return 0
+    date = parse_http_date(headers.get('date')) or now
+    if headers.get('expires') is not None:
+        expires = parse_http_date(headers['expires'])
+        if expires is None:
+            # an invalid date means already expired
+            return 0
+        return max(expires - date - age, 0)
+    last_modified = parse_http_date(headers.get('last-modified'))
+    if last_modified is not None and last_modified < date:
+        return max((date - last_modified) * HEURISTIC_FRACTION - age, 0)
+    return 0
+
+
+class CacheEntry:
+    """A stored response, fresh until expire."""
+    def __init__(self, response, expire):
+        self.response = response
+        self.expire = expire
+
+    def isFresh(self, now):
+        """Return True if the response can be used without a request."""
+        return now < self.expire
+
+    def conditionalHeaders(self):
+        """Return the headers revalidating the response."""
+        headers = []
+        etag = self.response.headers.get('etag')
+        if etag:
+            headers.append(('If-None-Match', etag))
+        last_modified = self.response.headers.get('last-modified')
+        if last_modified:
+            headers.append(('If-Modified-Since', last_modified))
+        return headers
+
+
+class BrowserCache(dict):
+    """Responses of a browser, a dict of url -> CacheEntry.
+
+    The changes are serialized by a lock, the page resources can be
+    fetched by concurrent threads sharing the cache."""
+    def __init__(self):
+        dict.__init__(self)
+        self.lock = threading.RLock()
+
+    def getFresh(self, url, now=None):
+        """Return the fresh stored response of url or None."""
+        entry = self.get(url)
+        if entry is None:
+            return None
+        if now is None:
+            now = time.time()
+        if entry.isFresh(now):
+            return entry.response
+        return None
+
+    def store(self, url, response, now=None):
+        """Store a response, one that can not be reused removes the stored
+        response of the url."""
+        if now is None:
+            now = time.time()
+        entry = None
+        if response.code in CACHEABLE_CODES and response.headers is not None:
+            lifetime = freshness_lifetime(response.headers, now)
+            if lifetime is not None:
+                entry = CacheEntry(response, now + lifetime)
+                if not lifetime and not entry.conditionalHeaders():
+                    entry = None
+        self.lock.acquire()
+        try:
+            if entry is None:
+                self.pop(url, None)
+            else:
+                self[url] = entry
+        finally:
+            self.lock.release()
+
+    def refresh(self, url, response, now=None):
+        """Update the stored response of url with the headers of a 304
+        response, see rfc 7234 section 4.3.4."""
+        if now is None:
+            now = time.time()
+        self.lock.acquire()
+        try:
+            entry = self.get(url)
+            if entry is None:
+                # dropped by a concurrent store
+                return
+            headers = entry.response.headers
+            for name in ('cache-control', 'expires', 'date', 'etag',
+                         'last-modified', 'age'):
+                if response.headers.get(name) is not None:
+                    headers[name] = response.headers[name]
+                elif name == 'age' and name in headers:
+                    # the stored age is not the age of the revalidated
+                    # response
+                    del headers[name]
+            lifetime = freshness_lifetime(headers, now)
+            if lifetime is None:
+                del self[url]
+            else:
+                entry.expire = now + lifetime
+        finally:
+            self.lock.release()
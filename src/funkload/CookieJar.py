@@ -0,0 +1,282 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+"""Cookie jar of the patched webunit browser, see RFC 6265.
+
+Cookies are stored by domain, path and name like the webunit cookies
+dict. A host looks up its own domain and its parent domains instead of
+walking the whole jar, and the Cookie header of a host, path and scheme
+is built once then cached until the jar changes or a cookie expires.
+"""
+from __future__ import absolute_import
+import re
+import time
+import calendar
+import threading
+import urlparse
+from Cookie import Morsel, CookieError, _unquote
+
+# cookie values that are never sent back
+DELETED_VALUES = ('"deleted"', 'null', 'deleted')
+# maximum number of cached Cookie headers
+MAX_HEADERS = 256
+
+MONTHS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep',
+          'oct', 'nov', 'dec')
+# rfc 6265 section 5.1.1
+DATE_DELIMITERS = re.compile(r'[\x09\x20-\x2f\x3b-\x40\x5b-\x60\x7b-\x7e]+')
+DATE_TIME = re.compile(r'(\d{1,2}):(\d{1,2}):(\d{1,2})(?:\D|$)')
+DATE_DAY = re.compile(r'(\d{1,2})(?:\D|$)')
+DATE_YEAR = re.compile(r'(\d{2,4})(?:\D|$)')
+MAX_AGE = re.compile(r'-?\d+$')
+IP_ADDRESS = re.compile(r'^[\d.]+$|:')
+
+
+def parse_cookie_date(text):
+    """Return the time of a cookie date or None when it is invalid.
+
+    Use the algorithm of rfc 6265 section 5.1.1 which accepts the
+    rfc 1123, rfc 850 and asctime formats and their common variants."""
+    hour = day = month = year = None
+    for token in DATE_DELIMITERS.split(text):
+        if not token:
+            continue
+        if hour is None:
+            match = DATE_TIME.match(token)
+            if match:
+                hour, minute, second = [int(value)
+                                        for value in match.groups()]
+                continue
+        if day is None:
+            match = DATE_DAY.match(token)
+            if match:
+                day = int(match.group(1))
+                continue
+        if month is None and token[:3].lower() in MONTHS:
+            month = MONTHS.index(token[:3].lower()) + 1
+            continue
+        if year is None:
+            match = DATE_YEAR.match(token)
+            if match:
+                year = int(match.group(1))
+                continue
+    if None in (hour, day, month, year):
+        return None
+    if 70 <= year <= 99:
+        year += 1900
+    elif year <= 69:
+        year += 2000
+    if (not 1 <= day <= 31 or year < 1601 or hour > 23 or minute > 59 or
+        second > 59):
+        return None
+    return calendar.timegm((year, month, day, hour, minute, second))
+
+
+def host_domains(host):
+    """Return the host and its parent domains."""
+    if IP_ADDRESS.search(host):
+        return [host]
+    labels = host.split('.')
+    return ['.'.join(labels[i:]) for i in range(len(labels))]
+
+
+def path_match(path, cookie_path):
+    """Return True if a request path matches a cookie path."""
+    if not path.startswith(cookie_path):
+        return False
+    return (len(path) == len(cookie_path) or cookie_path.endswith('/') or
+            path[len(cookie_path)] == '/')
+
+
+def default_path(request_path):
+    """Return the path of a cookie without a valid Path attribute."""
+    if not request_path.startswith('/'):
+        return '/'
+    index = request_path.rfind('/')
+    if index == 0:
+        return '/'
+    return request_path[:index]
+
+
+class CookieJar(dict):
+    """Cookies of a browser, a dict of domain -> path -> name -> Morsel.
+
+    Change the cookies with the methods of the jar, not with the dict
+    methods, so the cached Cookie headers are dropped. The methods are
+    serialized by a lock, the page resources can be fetched by concurrent
+    threads sharing the jar."""
+
+    def __init__(self, cookies=None):
+        dict.__init__(self)
+        self.headers = {}               # (host, path, secure) -> header
+        self.next_expire = None
+        self.lock = threading.RLock()
+        for domain, paths in (cookies or {}).items():
+            for path, morsels in paths.items():
+                for morsel in morsels.values():
+                    self.addMorsel(domain.lstrip('.'), path, morsel,
+                                   getattr(morsel, 'expire', None))
+
+    def addMorsel(self, domain, path, morsel, expire=None):
+        """Store a cookie, expire is its expiration time or None for a
+        session cookie."""
+        self.lock.acquire()
+        try:
+            morsel.expire = expire
+            self.setdefault(domain, {}).setdefault(path, {})[morsel.key] = \
+                morsel
+            if expire is not None and (self.next_expire is None or
+                                       expire < self.next_expire):
+                self.next_expire = expire
+            self.headers.clear()
+        finally:
+            self.lock.release()
+
+    def deleteCookie(self, domain, path, name):
+        """Remove a cookie."""
+        self.lock.acquire()
+        try:
+            morsels = self.get(domain, {}).get(path)
+            if morsels and name in morsels:
+                del morsels[name]
+                self.headers.clear()
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """Remove all the cookies."""
+        self.lock.acquire()
+        try:
+            dict.clear(self)
+            self.headers.clear()
+            self.next_expire = None
+        finally:
+            self.lock.release()
+
+    def setCookie(self, server, request_path, text, now=None):
+        """Store the cookie of a Set-Cookie header received from the
+        server for the request path, see rfc 6265 section 5.2 and 5.3."""
+        parts = text.split(';')
+        name, sep, value = parts[0].partition('=')
+        name = name.strip()
+        value = value.strip()
+        if not sep or not name:
+            return
+        attrs = {}
+        for part in parts[1:]:
+            key, sep, attr_value = part.partition('=')
+            attrs[key.strip().lower()] = attr_value.strip()
+        if now is None:
+            now = time.time()
+        expire = None
+        max_age = attrs.get('max-age', '')
+        if MAX_AGE.match(max_age):
+            expire = now + max(int(max_age), 0)
+        elif attrs.get('expires'):
+            expire = parse_cookie_date(attrs['expires'])
+        server = server.lower()
+        domain = attrs.get('domain', '').lstrip('.').lower()
+        if not domain:
+            domain = server
+        elif server != domain and not server.endswith('.' + domain):
+            return
+        path = attrs.get('path', '')
+        if not path.startswith('/'):
+            path = default_path(request_path)
+        if expire is not None and expire <= now:
+            self.deleteCookie(domain, path, name)
+            return
+        morsel = Morsel()
+        try:
+            morsel.set(name, _unquote(value), value)
+        except CookieError:
+            return
+        morsel['domain'] = domain
+        morsel['path'] = path
+        morsel['expires'] = attrs.get('expires', '')
+        morsel['max-age'] = max_age
+        morsel['secure'] = 'secure' in attrs
+        morsel['httponly'] = 'httponly' in attrs
+        self.addMorsel(domain, path, morsel, expire)
+
+    def decodeCookies(self, url, server, headers):
+        """Store the cookies of a response headers."""
+        if headers is None:
+            return
+        request_path = urlparse.urlparse(url)[2]
+        now = time.time()
+        for text in headers.getheaders('set-cookie'):
+            self.setCookie(server, request_path, text, now)
+
+    def purge(self, now):
+        """Remove the expired cookies."""
+        self.lock.acquire()
+        try:
+            self.next_expire = None
+            for paths in self.values():
+                for morsels in paths.values():
+                    for name, morsel in morsels.items():
+                        expire = morsel.expire
+                        if expire is None:
+                            continue
+                        if expire <= now:
+                            del morsels[name]
+                        elif (self.next_expire is None or
+                              expire < self.next_expire):
+                            self.next_expire = expire
+            self.headers.clear()
+        finally:
+            self.lock.release()
+
+    def getCookieHeader(self, server, path, secure, now=None):
+        """Return the Cookie header value to send to a server path or None,
+        with the names of the cookies sent."""
+        if now is None:
+            now = time.time()
+        self.lock.acquire()
+        try:
+            if self.next_expire is not None and self.next_expire <= now:
+                self.purge(now)
+            key = (server, path, secure)
+            header = self.headers.get(key)
+            if header is None:
+                if len(self.headers) >= MAX_HEADERS:
+                    self.headers.clear()
+                header = self.headers[key] = self.buildHeader(server, path,
+                                                              secure)
+            return header
+        finally:
+            self.lock.release()
+
+    def buildHeader(self, server, path, secure):
+        """Build the Cookie header of a server path, the cookies with the
+        longest paths are first then sorted by name."""
+        cookies = []
+        for domain in host_domains(server.lower()):
+            for cookie_path, morsels in self.get(domain, {}).items():
+                if not path_match(path or '/', cookie_path):
+                    continue
+                for morsel in morsels.values():
+                    if morsel['secure'] and not secure:
+                        continue
+                    if morsel.coded_value in DELETED_VALUES:
+                        continue
+                    cookies.append((-len(cookie_path), morsel.key,
+                                    morsel.coded_value))
+        if not cookies:
+            return None, []
+        cookies.sort()
+        return ('; '.join(['%s=%s' % (name, value)
+                           for length, name, value in cookies]),
+                [name for length, name, value in cookies])
@@ -20,9 +20,67 @@
 from __future__ import absolute_import
 
 import BaseHTTPServer
+import json
 import threading
 import urlparse
-from .utils import trace
+from .LiveStats import get_live_stats, QUANTILES
+from .utils import recording, trace
+
+OPENMETRICS_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+def escape_label(value):
+    """Escape an OpenMetrics label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def window_samples(values, labels):
+    """Return the (name, labels, value) samples of a window."""
+    samples = []
+    for name, key in (('requests_per_second', 'rps'), ('errors', 'errors'),
+                      ('error_percent', 'error_percent'),
+                      ('tests_per_second', 'tps'),
+                      ('test_errors', 'test_errors')):
+        if key in values:
+            samples.append((name, labels, values[key]))
+    for q in QUANTILES:
+        value = values['p%g' % (q * 100)]
+        if value is not None:
+            samples.append(('response_seconds',
+                            labels + [('quantile', '%g' % q)], value))
+    return samples
+
+
+def render_metrics(cvus, windows):
+    """Return the rolling windows in the OpenMetrics text format."""
+    families = {}
+    names = []
+    samples = [('virtual_users', [], cvus)]
+    for window in sorted(windows.keys(), key=lambda w: int(w[:-1])):
+        values = windows[window]
+        samples.extend(window_samples(values, [('window', window)]))
+        for step in sorted(values['steps'].keys()):
+            samples.extend(
+                ('step_' + name, labels, value) for name, labels, value in
+                window_samples(values['steps'][step],
+                               [('window', window), ('step', step)]))
+    for name, labels, value in samples:
+        if name not in families:
+            families[name] = []
+            names.append(name)
+        labels = ','.join('%s="%s"' % (key, escape_label(label))
+                          for key, label in labels)
+        if labels:
+            labels = '{%s}' % labels
+        families[name].append('funkload_%s%s %s' % (name, labels, value))
+    lines = []
+    for name in names:
+        lines.append('# TYPE funkload_%s gauge' % name)
+        lines.extend(families[name])
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
 
 class FunkLoadHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
     """Handles HTTP requests from client in debug bench mode.
@@ -30,6 +88,9 @@ class FunkLoadHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
     These are the requests currently supported:
     /cvu?inc=<INTEGER> :: Increments number of CVU by given value.
     /cvu?dec=<INTEGER> :: Decrements number of CVU by given value.
+    /getcvu :: Returns the number of CVU.
+    /status :: Returns the rolling windows of the live stats in JSON.
+    /metrics :: Returns the rolling windows in the OpenMetrics format.
     """
     benchrunner = None
     def do_GET(self):
@@ -52,10 +113,22 @@ class FunkLoadHTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
                                  (old_num_threads, new_num_threads))
         elif parsed_url.path == '/getcvu':
             self.respond('CVU = %d' % benchrunner.getNumberOfThreads())
+        elif parsed_url.path == '/status':
+            status = {'cvus': benchrunner.getNumberOfThreads(),
+                      'recording': recording(),
+                      'windows': get_live_stats().getWindows()}
+            self.respond(json.dumps(status, sort_keys=True),
+                         'application/json')
+        elif parsed_url.path == '/metrics':
+            self.respond(render_metrics(benchrunner.getNumberOfThreads(),
+                                        get_live_stats().getWindows()),
+                         OPENMETRICS_TYPE)
+        else:
+            self.send_error(404)
 
-    def respond(self, message):
+    def respond(self, message, content_type='text/html'):
         self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+        self.send_header('Content-type', content_type)
         self.end_headers()
         self.wfile.write(message)
 
@@ -28,9 +28,8 @@ import time
 import string
 import re
 import logging
-import gzip
+import hashlib
 import threading
-from StringIO import StringIO
 from warnings import warn
 from socket import error as SocketError
 from types import DictType, ListType, TupleType
@@ -47,12 +46,55 @@ from ConfigParser import ConfigParser, NoSectionError, NoOptionError
 from webunit.webunittest import WebTestCase, HTTPError
 
 from . import PatchWebunit
-from .utils import get_default_logger, mmn_is_bench, mmn_decode, Data
+from .BrowserCache import BrowserCache
+from .BinaryResult import get_binary_writer, close_binary_writer
+from .LiveStats import get_live_stats
+from .ResultSink import get_result_sink, flush_result_sink, close_result_sink
+from .utils import get_default_logger, mmn_is_bench, mmn_decode, \
+                  mmn_encode, Data
 from .utils import recording, thread_sleep, is_html, get_version, trace
+from .utils import get_start_lag, Stopwatch
 from xmlrpclib import ServerProxy
 
 _marker = []
 
+# ------------------------------------------------------------
+# configuration shared by the test cases
+#
+class ConfigSnapshot(ConfigParser):
+    """A parsed configuration file shared by the test cases, read only."""
+
+    def _read_only(self, *args):
+        raise TypeError('The configuration is shared by all the test cases, '
+                        'it can not be modified.')
+
+    set = add_section = remove_option = remove_section = _read_only
+
+
+_configs = {}
+_configs_lock = threading.Lock()
+
+
+def get_config(config_path):
+    """Return the configuration snapshot of a file.
+
+    The file is parsed once, again only if it has been modified."""
+    try:
+        mtime = os.path.getmtime(config_path)
+    except OSError:
+        mtime = None
+    _configs_lock.acquire()
+    try:
+        cached = _configs.get(config_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        config = ConfigSnapshot()
+        config.read(config_path)
+        _configs[config_path] = (mtime, config)
+        return config
+    finally:
+        _configs_lock.release()
+
 # ------------------------------------------------------------
 # Classes
 #
@@ -110,7 +152,6 @@ class FunkLoadTestCase(unittest.TestCase):
         self._pause = getattr(options, 'pause', False)
         self._keyfile_path = None
         self._certfile_path = None
-        self._accept_gzip = False
         if self._viewing and not self._dumping:
             # viewing requires dumping contents
             self._dumping = True
@@ -140,9 +181,7 @@ class FunkLoadTestCase(unittest.TestCase):
         config_path = os.path.abspath(os.path.expanduser(config_path))
         if not os.path.exists(config_path):
             config_path = "Missing: "+ config_path
-        config = ConfigParser()
-        config.read(config_path)
-        self._config = config
+        self._config = get_config(config_path)
         self._config_path = config_path
         self.conf = ConfSectionFinder(self)
         self.default_user_agent = self.conf_get('main', 'user_agent',
@@ -159,10 +198,25 @@ class FunkLoadTestCase(unittest.TestCase):
         self.sleep_time_max = self.conf_getFloat(section, 'sleep_time_max', 0)
         self._simple_fetch = self.conf_getInt(section, 'simple_fetch', 0,
                                               quiet=True)
+        self._resource_concurrency = self.conf_getInt(
+            section, 'resource_concurrency', 1, quiet=True)
+        self._body_retention = self.conf_getInt(section, 'body_retention',
+                                                -1, quiet=True)
+        self._body_digest = self.conf_get(section, 'body_digest', '',
+                                          quiet=True)
+        self._accept_encoding = PatchWebunit.accept_encoding(
+            self.conf_get(section, 'accept_encoding', '', quiet=True))
+        self._browser_cache = self.conf_get(section, 'browser_cache', 'off',
+                                            quiet=True)
+        if self._browser_cache not in ('off', 'session', 'iteration'):
+            raise ValueError('Invalid browser_cache %r, expecting off, '
+                             'session or iteration' % self._browser_cache)
         self.log_to = self.conf_get(section, 'log_to', 'console file')
         self.log_path = self.conf_get(section, 'log_path', 'funkload.log')
         self.result_path = os.path.abspath(
             self.conf_get(section, 'result_path', 'funkload.xml'))
+        self.result_format = self.conf_get(section, 'result_format', 'xml',
+                                           quiet=True)
 
         # init loggers
         if self.in_bench_mode:
@@ -171,20 +225,59 @@ class FunkLoadTestCase(unittest.TestCase):
             level = logging.DEBUG
         self.logger = get_default_logger(self.log_to, self.log_path,
                                          level=level)
-        self.logger_result = get_default_logger(log_to="xml",
-                                                log_path=self.result_path,
-                                                name="FunkLoadResult")
+        if self.result_format == 'binary':
+            self._result_writer = get_binary_writer(self.result_path)
+            self.logger_result = get_default_logger(log_to="",
+                                                    name="FunkLoadResult")
+        else:
+            self._result_writer = None
+            self.logger_result = get_default_logger(log_to="xml",
+                                                    log_path=self.result_path,
+                                                    name="FunkLoadResult")
+        self._result_buffer = None
+        if self.in_bench_mode:
+            size = self.conf_getInt('bench', 'result_buffer_size', 1000,
+                                    quiet=True)
+            if size > 0:
+                self._result_sink = get_result_sink(self._write_results, size)
+                self._result_buffer = self._result_sink.buffer()
+        # intended start of the next test, set by the bench runner
+        self._intended_start = None
+        self._start_lag = None
         #self.logd('_funkload_init config [%s], log_to [%s],'
         #          ' log_path [%s], result [%s].' % (
         #    self._config_path, self.log_to, self.log_path, self.result_path))
 
         # init webunit browser (passing a fake methodName)
         self._browser = WebTestCase(methodName='log')
+        if self.conf_getInt(section, 'keep_alive', 0, quiet=True):
+            self._browser.connection_pool = PatchWebunit.ConnectionPool(
+                self.conf_getFloat(section, 'keep_alive_max_idle', 10.0,
+                                   quiet=True))
+        if self._browser_cache != 'off':
+            self._browser.browser_cache = BrowserCache()
         self.clearContext()
 
         #self.logd('# FunkLoadTestCase._funkload_init done')
 
 
+    def _recycle(self, cycle, cvus, thread_id):
+        """Reuse the test case for another virtual user.
+
+        The browser is reset and a new result buffer is used, the
+        configuration is already parsed."""
+        self.cycle, self.cvus, self.thread_id = cycle, cvus, thread_id
+        self.meta_method_name = mmn_encode(self.test_name, cycle, cvus,
+                                           thread_id)
+        if self._result_buffer is not None:
+            self._result_buffer = self._result_sink.buffer()
+        pool = getattr(self._browser, 'connection_pool', None)
+        if pool is not None:
+            pool.close()
+        # a new virtual user starts with an empty cache
+        self.clearBrowserCache()
+        self.clearContext()
+
     def setOkCodes(self, ok_codes):
         """Set ok codes."""
         self.ok_codes = map(int, ok_codes)
@@ -211,8 +304,13 @@ class FunkLoadTestCase(unittest.TestCase):
         self.total_xmlrpc = 0
         self.clearBasicAuth()
         self.clearHeaders()
+        if self._browser_cache == 'iteration':
+            self.clearBrowserCache()
         self.clearKeyAndCertificateFile()
         self.setUserAgent(self.default_user_agent)
+        if self._accept_encoding:
+            self.setHeader('Accept-Encoding', self._accept_encoding)
+        self.setBodyRetention()
 
         self.logdd('FunkLoadTestCase.clearContext done')
 
@@ -226,14 +324,15 @@ class FunkLoadTestCase(unittest.TestCase):
         if params is None and rtype in ('post','put'):
             # enable empty put/post
             params = []
-        t_start = time.time()
+        watch = Stopwatch()
+        t_start = watch.start
         try:
             response = self._browser.fetch(url, params, ok_codes=ok_codes,
                                            key_file=self._keyfile_path,
                                            cert_file=self._certfile_path, method=rtype, consumer=consumer)
         except:
             etype, value, tback = sys.exc_info()
-            t_stop = time.time()
+            t_stop = watch.stop()
             t_delta = t_stop - t_start
             self.total_time += t_delta
             self.step_success = False
@@ -251,7 +350,7 @@ class FunkLoadTestCase(unittest.TestCase):
                 if etype is SocketError:
                     raise SocketError("Can't load %s." % url)
                 raise
-        t_stop = time.time()
+        t_stop = watch.stop()
         # Log response
         t_delta = t_stop - t_start
         self.total_time += t_delta
@@ -267,10 +366,6 @@ class FunkLoadTestCase(unittest.TestCase):
             self.setHeader('Referer', url)
         self._browser.history.append((rtype, url))
         self.logd(' Done in %.3fs' % t_delta)
-        if self._accept_gzip:
-            if response.headers is not None and response.headers.get('Content-Encoding') == 'gzip':
-                buf = StringIO(response.body)
-                response.body = gzip.GzipFile(fileobj=buf).read()
         self._log_response(response, rtype, description, t_start, t_stop)
         if self._dumping:
             self._dump_content(response, description)
@@ -362,17 +457,19 @@ class FunkLoadTestCase(unittest.TestCase):
         if load_auto_links and response.is_html and not self._simple_fetch:
             self.logd(' Load css and images...')
             page = response.body
-            t_start = time.time()
+            watch = Stopwatch()
+            t_start = watch.start
             c_start = self.total_time
             try:
                 # pageImages is patched to call _log_response on all links
-                self._browser.pageImages(url, page, self)
+                self._browser.pageImages(url, page, self,
+                                         response.getLinks())
             except HTTPError as error:
                 if self._accept_invalid_links:
                     if not self.in_bench_mode:
                         self.logd('  ' + str(error))
                 else:
-                    t_stop = time.time()
+                    t_stop = watch.stop()
                     t_delta = t_stop - t_start
                     self.step_success = False
                     self.test_status = 'Failure'
@@ -499,7 +596,8 @@ class FunkLoadTestCase(unittest.TestCase):
                                                          self.steps,
                                                          description or ''))
         response = None
-        t_start = time.time()
+        watch = Stopwatch()
+        t_start = watch.start
         if self._authinfo is not None:
             url = url_in.replace('//', '//'+self._authinfo)
         else:
@@ -513,7 +611,7 @@ class FunkLoadTestCase(unittest.TestCase):
                 response = method()
         except:
             etype, value, tback = sys.exc_info()
-            t_stop = time.time()
+            t_stop = watch.stop()
             t_delta = t_stop - t_start
             self.total_time += t_delta
             self.step_success = False
@@ -524,7 +622,7 @@ class FunkLoadTestCase(unittest.TestCase):
             if etype is SocketError:
                 raise SocketError("Can't access %s." % url)
             raise
-        t_stop = time.time()
+        t_stop = watch.stop()
         t_delta = t_stop - t_start
         self.total_time += t_delta
         self.total_xmlrpc += 1
@@ -605,10 +703,8 @@ class FunkLoadTestCase(unittest.TestCase):
             if value is not None:
                 headers.append((key, value))
         if key.lower() == 'accept-encoding':
-            if value and value.lower() == 'gzip':
-                self._accept_gzip = True
-            else:
-                self._accept_gzip = False
+            # the browser decodes the bodies it asked to be encoded
+            self._browser.decode_content = bool(value)
 
     def delHeader(self, key):
         """Remove an http header key."""
@@ -619,6 +715,7 @@ class FunkLoadTestCase(unittest.TestCase):
 
         Note that the Referer is also removed."""
         self._browser.extra_headers = []
+        self._browser.decode_content = False
 
     def debugHeaders(self, debug_headers=True):
         """Print request headers."""
@@ -647,6 +744,28 @@ class FunkLoadTestCase(unittest.TestCase):
         # we should always sleep something
         thread_sleep(s_val)
 
+    def setBodyRetention(self, kbytes=None, digest=None):
+        """Keep at most kbytes KB of the next response bodies.
+
+        The body is streamed and only its size is counted, 0 keeps
+        nothing and -1 the whole body. digest is a hashlib algorithm
+        name like md5 or sha1 to log the digest of the bodies. HTML pages
+        and error responses are always kept whole, getBody returns the
+        kept bytes only. Without argument the body_retention and
+        body_digest of the configuration are used."""
+        if kbytes is None:
+            kbytes = self._body_retention
+        if digest is None:
+            digest = self._body_digest
+        if digest:
+            # raise a ValueError on an unknown algorithm
+            hashlib.new(digest)
+        if kbytes < 0:
+            self._browser.body_retention = None
+        else:
+            self._browser.body_retention = int(kbytes * 1024)
+        self._browser.body_digest = digest or None
+
     def setKeyAndCertificateFile(self, keyfile_path, certfile_path):
         """Set the paths to a key file and a certificate file that will be
         used by a https (ssl/tls) connection when calling the post or get
@@ -659,6 +778,16 @@ class FunkLoadTestCase(unittest.TestCase):
         self._keyfile_path = keyfile_path
         self._certfile_path = certfile_path
 
+    def clearBrowserCache(self):
+        """Empty the HTTP cache of the browser.
+
+        With browser_cache set to session the cache is kept between the
+        tests of a virtual user, with iteration it is emptied by
+        clearContext."""
+        cache = getattr(self._browser, 'browser_cache', None)
+        if cache is not None:
+            cache.clear()
+
     def clearKeyAndCertificateFile(self):
         """Clear any key file or certificate file paths set by calls to
         setKeyAndCertificateFile.
@@ -677,7 +806,10 @@ class FunkLoadTestCase(unittest.TestCase):
         return ''
 
     def getBody(self):
-        """Return the last response content."""
+        """Return the last response content.
+
+        Only the kept bytes are returned when setBodyRetention limits
+        the body."""
         response = self._response
         if response is not None:
             return response.body
@@ -686,17 +818,12 @@ class FunkLoadTestCase(unittest.TestCase):
     def listHref(self, url_pattern=None, content_pattern=None):
         """Return a list of href anchor url present in the last html response.
 
-        Filtering href with url pattern or link text pattern."""
+        Filtering href with url pattern or link text pattern, the link text
+        is the HTML content of the anchor."""
         response = self._response
         ret = []
         if response is not None:
-            a_links = response.getDOM().getByName('a')
-            if a_links:
-                for link in a_links:
-                    try:
-                        ret.append((link.getContentString(), link.href))
-                    except AttributeError:
-                        pass
+            ret = response.getLinks().anchors
             if url_pattern is not None:
                 pat = re.compile(url_pattern)
                 ret = [link for link in ret
@@ -711,9 +838,9 @@ class FunkLoadTestCase(unittest.TestCase):
         """Return the base href url."""
         response = self._response
         if response is not None:
-            base = response.getDOM().getByName('base')
-            if base:
-                return base[0].href
+            base = response.getLinks().base
+            if base is not None:
+                return base
         return ''
 
     #------------------------------------------------------------
@@ -817,7 +944,46 @@ class FunkLoadTestCase(unittest.TestCase):
     def _logr(self, message, force=False):
         """Log a result."""
         if force or not self.in_bench_mode or recording():
-            self.logger_result.info(message)
+            if self._result_buffer is not None and not force:
+                self._result_sink.append(self._result_buffer, ('X', message))
+            elif self._result_writer is not None:
+                self._result_writer.writeXml(message)
+            else:
+                self.logger_result.info(message)
+
+    def _logb(self, tag, values, extra=None):
+        """Log a result record into the binary result file."""
+        if not self.in_bench_mode or recording():
+            if self._result_buffer is not None:
+                self._result_sink.append(self._result_buffer,
+                                         (tag, values, extra))
+            else:
+                self._result_writer.writeRecord(tag, values, extra)
+
+    def _write_results(self, records):
+        """Write records of the result buffers, called by the sink."""
+        if self._result_writer is not None:
+            for record in records:
+                if record[0] == 'X':
+                    self._result_writer.writeXml(record[1])
+                else:
+                    self._result_writer.writeRecord(*record)
+        else:
+            self.logger_result.info('\n'.join([record[1]
+                                               for record in records]))
+
+    def _release_result_buffer(self):
+        """No more results will be logged by this test case."""
+        if self._result_buffer is not None:
+            self._result_sink.release(self._result_buffer)
+
+    def _flush_result_log(self):
+        """Flush the pending results."""
+        flush_result_sink()
+        if self._result_writer is not None:
+            self._result_writer.flush()
+        for handler in self.logger_result.handlers:
+            handler.flush()
 
     def _open_result_log(self, **kw):
         """Open the result log."""
@@ -839,7 +1005,34 @@ class FunkLoadTestCase(unittest.TestCase):
 
     def _close_result_log(self):
         """Close the result log."""
+        close_result_sink()
         self._logr('</funkload>', force=True)
+        if self._result_writer is not None:
+            close_binary_writer(self.result_path)
+
+    def _live_request(self, info):
+        """Add a recorded request to the live statistics."""
+        if self.in_bench_mode and recording():
+            get_live_stats().addRequest(
+                info['duration'], info['result'] == 'Successful',
+                '%s:%s' % (info['test_name'], info['step']))
+
+    def _intended_time(self, time_start):
+        """Return the intended start of a record.
+
+        This is the actual start minus the lag of the test behind its
+        schedule, None when the test is not scheduled."""
+        if self._start_lag is None:
+            return None
+        return time_start - self._start_lag
+
+    def _response_values(self, info, url, description):
+        """Return the fields of a binary response record."""
+        return [info['cycle'], info['cvus'], info['thread_id'],
+                info['suite_name'], info['test_name'], info['step'],
+                info['number'], info['type'], info['result'], url,
+                info['code'], description or '', info['time_start'],
+                info['duration']]
 
     def _log_response_error(self, url, rtype, description, time_start,
                             time_stop):
@@ -855,20 +1048,35 @@ class FunkLoadTestCase(unittest.TestCase):
         info['step'] = self.steps
         info['number'] = self.page_responses
         info['type'] = rtype
-        info['url'] = quoteattr(url)
         info['code'] = -1
-        info['description'] = description and quoteattr(description) or '""'
         info['time_start'] = time_start
         info['duration'] = time_stop - time_start
         info['result'] = 'Error'
-        info['traceback'] = quoteattr(' '.join(
-            traceback.format_exception(*sys.exc_info())))
-        message = '''<response cycle="%(cycle).3i" cvus="%(cvus).3i" thread="%(thread_id).3i" suite="%(suite_name)s" name="%(test_name)s" step="%(step).3i" number="%(number).3i" type="%(type)s" result="%(result)s" url=%(url)s code="%(code)s" description=%(description)s time="%(time_start)s" duration="%(duration)s" traceback=%(traceback)s />''' % info
+        self._live_request(info)
+        intended = self._intended_time(time_start)
+        tback = ' '.join(traceback.format_exception(*sys.exc_info()))
+        if self._result_writer is not None:
+            extra = {'traceback': tback}
+            if intended is not None:
+                extra['intended'] = str(intended)
+            self._logb('R', self._response_values(info, url, description),
+                       extra)
+            return
+        info['url'] = quoteattr(url)
+        info['description'] = description and quoteattr(description) or '""'
+        info['traceback'] = quoteattr(tback)
+        info['intended'] = ''
+        if intended is not None:
+            info['intended'] = ' intended="%s"' % intended
+        message = '''<response cycle="%(cycle).3i" cvus="%(cvus).3i" thread="%(thread_id).3i" suite="%(suite_name)s" name="%(test_name)s" step="%(step).3i" number="%(number).3i" type="%(type)s" result="%(result)s" url=%(url)s code="%(code)s" description=%(description)s time="%(time_start)s" duration="%(duration)s"%(intended)s traceback=%(traceback)s />''' % info
         self._logr(message)
 
     def _log_response(self, response, rtype, description, time_start,
-                      time_stop, log_body=False):
-        """Log a response."""
+                      time_stop, log_body=False, batch_duration=None):
+        """Log a response.
+
+        batch_duration is the wall time of the batch of resources fetched
+        in parallel with this response."""
         self.total_responses += 1
         self.page_responses += 1
         info = {}
@@ -880,13 +1088,54 @@ class FunkLoadTestCase(unittest.TestCase):
         info['step'] = self.steps
         info['number'] = self.page_responses
         info['type'] = rtype
-        info['url'] = quoteattr(response.url)
         info['code'] = response.code
-        info['description'] = description and quoteattr(description) or '""'
         info['time_start'] = time_start
         info['duration'] = time_stop - time_start
         info['result'] = self.step_success and 'Successful' or 'Failure'
+        self._live_request(info)
+        intended = self._intended_time(time_start)
+        phases = getattr(response, 'phases', None)
+        sizes = None
+        if getattr(response, 'received', None) is not None:
+            decoded = getattr(response, 'decoded_size', None)
+            if decoded is None:
+                decoded = len(response.body or '')
+            sizes = (('sent', response.sent),
+                     ('received', response.received),
+                     ('decoded', decoded))
+        digest = getattr(response, 'body_digest', None)
+        if self._result_writer is not None and not log_body:
+            extra = {}
+            if batch_duration is not None:
+                extra['batch_duration'] = str(batch_duration)
+            if intended is not None:
+                extra['intended'] = str(intended)
+            if phases:
+                for phase in PatchWebunit.PHASES:
+                    extra[phase] = '%.6f' % phases[phase]
+            if sizes:
+                for key, value in sizes:
+                    extra[key] = str(value)
+            if digest:
+                extra['digest'] = digest
+            self._logb('R', self._response_values(info, response.url,
+                                                  description), extra)
+            return
+        info['url'] = quoteattr(response.url)
+        info['description'] = description and quoteattr(description) or '""'
         response_start = '''<response cycle="%(cycle).3i" cvus="%(cvus).3i" thread="%(thread_id).3i" suite="%(suite_name)s" name="%(test_name)s" step="%(step).3i" number="%(number).3i" type="%(type)s" result="%(result)s" url=%(url)s code="%(code)s" description=%(description)s time="%(time_start)s" duration="%(duration)s"''' % info
+        if batch_duration is not None:
+            response_start += ' batch_duration="%s"' % batch_duration
+        if intended is not None:
+            response_start += ' intended="%s"' % intended
+        if phases:
+            for phase in PatchWebunit.PHASES:
+                response_start += ' %s="%.6f"' % (phase, phases[phase])
+        if sizes:
+            for key, value in sizes:
+                response_start += ' %s="%d"' % (key, value)
+        if digest:
+            response_start += ' digest="%s"' % digest
 
         if not log_body:
             message = response_start + ' />'
@@ -919,13 +1168,25 @@ class FunkLoadTestCase(unittest.TestCase):
         info['step'] = self.steps
         info['number'] = self.page_responses
         info['type'] = 'xmlrpc'
-        info['url'] = quoteattr(url + '#' + method)
         info['code'] = code
-        info['description'] = description and quoteattr(description) or '""'
         info['time_start'] = time_start
         info['duration'] = time_stop - time_start
         info['result'] = self.step_success and 'Successful' or 'Failure'
-        message = '''<response cycle="%(cycle).3i" cvus="%(cvus).3i" thread="%(thread_id).3i" suite="%(suite_name)s" name="%(test_name)s" step="%(step).3i" number="%(number).3i" type="%(type)s" result="%(result)s" url=%(url)s code="%(code)s" description=%(description)s time="%(time_start)s" duration="%(duration)s" />"''' % info
+        self._live_request(info)
+        intended = self._intended_time(time_start)
+        if self._result_writer is not None:
+            extra = None
+            if intended is not None:
+                extra = {'intended': str(intended)}
+            self._logb('R', self._response_values(info, url + '#' + method,
+                                                  description), extra)
+            return
+        info['url'] = quoteattr(url + '#' + method)
+        info['description'] = description and quoteattr(description) or '""'
+        info['intended'] = ''
+        if intended is not None:
+            info['intended'] = ' intended="%s"' % intended
+        message = '''<response cycle="%(cycle).3i" cvus="%(cvus).3i" thread="%(thread_id).3i" suite="%(suite_name)s" name="%(test_name)s" step="%(step).3i" number="%(number).3i" type="%(type)s" result="%(result)s" url=%(url)s code="%(code)s" description=%(description)s time="%(time_start)s" duration="%(duration)s"%(intended)s />"''' % info
         self._logr(message)
 
     def _log_result(self, time_start, time_stop):
@@ -947,11 +1208,31 @@ class FunkLoadTestCase(unittest.TestCase):
         info['images'] = self.total_images
         info['links'] = self.total_links
         info['result'] = self.test_status
+        if self.in_bench_mode and recording():
+            get_live_stats().addTest(self.test_status == 'Successful')
         if self.test_status != 'Successful':
-            info['traceback'] = 'traceback=' + quoteattr(' '.join(
-                traceback.format_exception(*sys.exc_info()))) + ' '
+            tback = ' '.join(traceback.format_exception(*sys.exc_info()))
+        else:
+            tback = None
+        intended = self._intended_time(time_start)
+        if self._result_writer is not None:
+            extra = {}
+            if tback is not None:
+                extra['traceback'] = tback
+            if intended is not None:
+                extra['intended'] = str(intended)
+            self._logb('T', [info[key] for key in (
+                'cycle', 'cvus', 'thread_id', 'suite_name', 'test_name',
+                'time_start', 'result', 'steps', 'duration',
+                'connection_duration', 'requests', 'pages', 'xmlrpc',
+                'redirects', 'images', 'links')], extra or None)
+            return
+        if tback is not None:
+            info['traceback'] = 'traceback=' + quoteattr(tback) + ' '
         else:
             info['traceback'] = ''
+        if intended is not None:
+            info['traceback'] = 'intended="%s" ' % intended + info['traceback']
         text = '''<testResult cycle="%(cycle).3i" cvus="%(cvus).3i" thread="%(thread_id).3i" suite="%(suite_name)s" name="%(test_name)s"  time="%(time_start)s" result="%(result)s" steps="%(steps)s" duration="%(duration)s" connection_duration="%(connection_duration)s" requests="%(requests)s" pages="%(pages)s" xmlrpc="%(xmlrpc)s" redirects="%(redirects)s" images="%(images)s" links="%(links)s" %(traceback)s/>''' % info
         self._logr(text)
 
@@ -995,7 +1276,14 @@ class FunkLoadTestCase(unittest.TestCase):
         """Run the test method.
 
         Override to log test result."""
-        t_start = time.time()
+        watch = Stopwatch()
+        t_start = watch.start
+        if self._intended_start is not None:
+            # coordinated omission: the test may start late
+            self._start_lag = max(0.0, t_start - self._intended_start)
+            get_start_lag().add(self._start_lag)
+        else:
+            self._start_lag = None
         if result is None:
             result = self.defaultTestResult()
         result.startTest(self)
@@ -1015,7 +1303,7 @@ class FunkLoadTestCase(unittest.TestCase):
             except:
                 result.addError(self, self.__exc_info())
                 self.test_status = 'Error'
-                self._log_result(t_start, time.time())
+                self._log_result(t_start, watch.stop())
                 return
             try:
                 testMethod()
@@ -1039,7 +1327,7 @@ class FunkLoadTestCase(unittest.TestCase):
             if ok:
                 result.addSuccess(self)
         finally:
-            self._log_result(t_start, time.time())
+            self._log_result(t_start, watch.stop())
             if not ok and self._stop_on_fail:
                 result.stop()
             result.stopTest(self)
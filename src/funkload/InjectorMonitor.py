@@ -0,0 +1,87 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+"""Monitoring of the injector running a bench.
+
+A CPU or GIL bound injector wakes up its virtual users late, the response
+times it reports include this client side lag. The bench process samples
+its CPU usage and the lag of the sleeps and of the scheduled test starts,
+the samples are written as <injector> records of the result file.
+"""
+from __future__ import absolute_import
+import os
+from time import time
+from threading import Thread, Event
+
+from .utils import get_sleep_lag, get_start_lag, recording
+
+
+class InjectorInfo:
+    """A sample of the injector activity."""
+    def __init__(self, cycle, cvus, cpu, sleep_lag, start_lag):
+        self.time = time()
+        self.cycle = cycle
+        self.cvus = cvus
+        self.cpu = cpu
+        self.sleeps, self.sleep_lag, self.sleep_lag_max = sleep_lag
+        self.starts, self.start_lag, self.start_lag_max = start_lag
+
+    def __repr__(self):
+        return ('<injector cycle="%3.3i" cvus="%3.3i" time="%.3f" '
+                'cpu="%.1f" sleeps="%i" sleep_lag="%.6f" sleep_lag_max="%.6f" '
+                'starts="%i" start_lag="%.6f" start_lag_max="%.6f" />' % (
+                    self.cycle, self.cvus, self.time, self.cpu,
+                    self.sleeps, self.sleep_lag, self.sleep_lag_max,
+                    self.starts, self.start_lag, self.start_lag_max))
+
+
+class InjectorMonitor(Thread):
+    """Sample the injector every interval seconds while recording.
+
+    current returns the cycle and the number of virtual users, the CPU
+    usage is in percent of one core."""
+    def __init__(self, interval, current):
+        Thread.__init__(self)
+        self.setDaemon(1)
+        self.interval = interval
+        self.current = current
+        self.records = []
+        self.stopping = Event()
+
+    def cpuTime(self):
+        """Return the user and system CPU time of the process."""
+        times = os.times()
+        return times[0] + times[1]
+
+    def run(self):
+        """Thread jobs."""
+        get_sleep_lag().pop()
+        get_start_lag().pop()
+        last_time, last_cpu = time(), self.cpuTime()
+        while not self.stopping.wait(self.interval):
+            now, cpu = time(), self.cpuTime()
+            sleep_lag = get_sleep_lag().pop()
+            start_lag = get_start_lag().pop()
+            if recording() and now > last_time:
+                cycle, cvus = self.current()
+                self.records.append(InjectorInfo(
+                    cycle, cvus, 100.0 * (cpu - last_cpu) / (now - last_time),
+                    sleep_lag, start_lag))
+            last_time, last_cpu = now, cpu
+
+    def stop(self):
+        """Stop the thread and return the samples."""
+        self.stopping.set()
+        self.join()
+        return self.records
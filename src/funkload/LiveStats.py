@@ -0,0 +1,267 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+"""Live statistics of a running bench.
+
+The test cases of the bench process add their recorded results, the
+bench runner reads the statistics of the current cycle without waiting
+for the report. Request durations are kept in a histogram so the memory
+does not grow with the cycle duration.
+
+Results are also counted by second to give rolling windows of the last
+WINDOWS seconds, they are exposed by the debug HTTP server and checked
+by the abort rules of the bench.
+"""
+from __future__ import absolute_import
+import threading
+import time
+
+from .ReportStats import Histogram, HistogramPercentiles
+
+# rolling windows in seconds
+WINDOWS = (1, 10, 60)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class SecondStats:
+    """Results of one second by step."""
+    def __init__(self):
+        self.tests = self.test_errors = 0
+        # step -> [requests, errors, histogram]
+        self.steps = {}
+
+    def addRequest(self, step, duration, success):
+        """Add a request result of a step."""
+        stat = self.steps.get(step)
+        if stat is None:
+            stat = self.steps[step] = [0, 0, Histogram()]
+        stat[0] += 1
+        if not success:
+            stat[1] += 1
+        stat[2].add(duration)
+
+
+def window_values(requests, errors, histogram, window):
+    """Return the values of a window as a dict."""
+    values = {'requests': requests,
+              'rps': requests / float(window),
+              'errors': errors,
+              'error_percent': 0.0}
+    if requests:
+        values['error_percent'] = 100.0 * errors / requests
+    ranks = [min(int(q * histogram.count), histogram.count - 1)
+             for q in QUANTILES]
+    for q, value in zip(QUANTILES, histogram.getValues(ranks)):
+        values['p%g' % (q * 100)] = value
+    return values
+
+
+class LiveStats:
+    """Statistics of the results added since the last reset."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds = {}
+        self.keep = WINDOWS[-1]
+        self.reset()
+
+    def reset(self):
+        """Start a new period."""
+        self.lock.acquire()
+        try:
+            self.start = time.time()
+            self.tests = self.test_errors = 0
+            self.requests = self.request_errors = 0
+            self.percentiles = HistogramPercentiles(stepsize=5,
+                                                    name='requests')
+        finally:
+            self.lock.release()
+
+    def _second(self):
+        """Return the stats of the current second, the lock is held."""
+        second = int(time.time())
+        stats = self.seconds.get(second)
+        if stats is None:
+            stats = self.seconds[second] = SecondStats()
+            for key in self.seconds.keys():
+                if key <= second - self.keep - 1:
+                    del self.seconds[key]
+        return stats
+
+    def addRequest(self, duration, success, step=None):
+        """Add a request result."""
+        self.lock.acquire()
+        try:
+            self.requests += 1
+            if not success:
+                self.request_errors += 1
+            self.percentiles.addResult(duration)
+            self._second().addRequest(step, duration, success)
+        finally:
+            self.lock.release()
+
+    def addTest(self, success):
+        """Add a test result."""
+        self.lock.acquire()
+        try:
+            self.tests += 1
+            if not success:
+                self.test_errors += 1
+            second = self._second()
+            second.tests += 1
+            if not success:
+                second.test_errors += 1
+        finally:
+            self.lock.release()
+
+    def keepSeconds(self, seconds):
+        """Keep the results of at least the last seconds."""
+        self.keep = max(self.keep, int(seconds))
+
+    def getElapsed(self):
+        """Return the duration of the period."""
+        return time.time() - self.start
+
+    def getStats(self):
+        """Return the statistics of the period as a dict."""
+        self.lock.acquire()
+        try:
+            elapsed = max(time.time() - self.start, 1e-6)
+            self.percentiles.calcPercentiles()
+            stats = {'elapsed': elapsed,
+                     'tests': self.tests,
+                     'stps': (self.tests - self.test_errors) / elapsed,
+                     'requests': self.requests,
+                     'rps': self.requests / elapsed,
+                     'p95': self.percentiles.perc95,
+                     'error_percent': 0.0}
+            if self.tests:
+                stats['error_percent'] = (100.0 * self.test_errors /
+                                          self.tests)
+            return stats
+        finally:
+            self.lock.release()
+
+    def getWindow(self, window):
+        """Return the stats of the last window seconds as a dict.
+
+        A window covers the last complete seconds, the values of each
+        step are under the steps key."""
+        now = int(time.time())
+        tests = test_errors = requests = errors = 0
+        histogram = Histogram()
+        steps = {}
+        self.lock.acquire()
+        try:
+            for key, stats in self.seconds.items():
+                if not now - window <= key < now:
+                    continue
+                tests += stats.tests
+                test_errors += stats.test_errors
+                for step, (count, failed, hist) in stats.steps.items():
+                    step_stat = steps.get(step)
+                    if step_stat is None:
+                        step_stat = steps[step] = [0, 0, Histogram()]
+                    step_stat[0] += count
+                    step_stat[1] += failed
+                    step_stat[2].merge(hist)
+                    requests += count
+                    errors += failed
+                    histogram.merge(hist)
+        finally:
+            self.lock.release()
+        values = window_values(requests, errors, histogram, window)
+        values['tests'] = tests
+        values['tps'] = tests / float(window)
+        values['test_errors'] = test_errors
+        values['steps'] = dict(
+            (step, window_values(count, failed, hist, window))
+            for step, (count, failed, hist) in steps.items())
+        return values
+
+    def getWindows(self):
+        """Return the stats of the rolling WINDOWS as a dict."""
+        return dict(('%ds' % window, self.getWindow(window))
+                    for window in WINDOWS)
+
+
+class AbortRule:
+    """Abort a bench when a metric of the live stats is over a threshold
+    during period seconds.
+
+    error_percent is the percent of failed tests, p95 and p99 are the
+    percentiles of the request response times in seconds."""
+    METRICS = ('error_percent', 'p95', 'p99')
+
+    def __init__(self, metric, threshold, period=10):
+        if metric not in self.METRICS:
+            raise ValueError('Unknown abort metric %r, use one of %s.' % (
+                metric, ', '.join(self.METRICS)))
+        self.metric = metric
+        self.threshold = threshold
+        self.period = period
+
+    def value(self, stats):
+        """Return the metric of the last period or None."""
+        window = stats.getWindow(self.period)
+        if self.metric == 'error_percent':
+            if not window['tests']:
+                return None
+            return 100.0 * window['test_errors'] / window['tests']
+        return window[self.metric]
+
+    def check(self, stats):
+        """Return the reason of a breach or None.
+
+        The rule is checked once the period has been recorded."""
+        if stats.getElapsed() < self.period:
+            return None
+        value = self.value(stats)
+        if value is None or value <= self.threshold:
+            return None
+        return '%s %.3f > %s for %ss' % (self.metric, value, self.threshold,
+                                       self.period)
+
+    def __str__(self):
+        return '%s > %s for %ss' % (self.metric, self.threshold, self.period)
+
+
+def parse_abort_rule(metric, spec):
+    """Return the AbortRule of a [bench] abort_if_METRIC value.
+
+    spec is a threshold optionally followed by a period: ``> 50 for 30s``,
+    ``10s`` or ``50``, the default period is 10s."""
+    words = spec.replace('>', ' ').split()
+    try:
+        if len(words) == 1:
+            threshold, period = words[0], '10'
+        elif len(words) == 3 and words[1] == 'for':
+            threshold, period = words[0], words[2]
+        else:
+            raise ValueError
+        threshold = float(threshold.rstrip('s%'))
+        period = int(period.rstrip('s'))
+    except ValueError:
+        raise ValueError('Invalid abort_if_%s %r, use THRESHOLD '
+                         '[for SECONDS].' % (metric, spec))
+    if period < 1:
+        raise ValueError('Invalid abort_if_%s period %r.' % (metric, spec))
+    return AbortRule(metric, threshold, period)
+
+
+_live_stats = LiveStats()
+
+
+def get_live_stats():
+    """Return the live statistics of the process."""
+    return _live_stats
@@ -0,0 +1,189 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+"""Load profiles, the number of concurrent users over the bench time.
+
+A profile replaces the cycles of a bench: virtual users are added or
+removed while running to follow it. A profile is described by a string
+like ``ramp:1:100``, see get_load_profile.
+"""
+from __future__ import absolute_import
+import math
+
+
+class LoadProfile:
+    """Base class of a load profile lasting duration seconds."""
+    def __init__(self, duration):
+        self.duration = float(duration)
+
+    def cvus(self, elapsed):
+        """Return the number of concurrent users after elapsed seconds."""
+        raise NotImplementedError
+
+    def levels(self):
+        """Return the numbers of users given by the profile description."""
+        raise NotImplementedError
+
+    def windows(self, window):
+        """Return the number of concurrent users of each window, taken at
+        the middle of the window."""
+        count = int(math.ceil(self.duration / window))
+        return [self.cvus(min((i + 0.5) * window, self.duration))
+                for i in range(count)]
+
+
+class RampProfile(LoadProfile):
+    """Linear ramp from start to end users: ramp:START:END"""
+    def __init__(self, duration, start, end):
+        LoadProfile.__init__(self, duration)
+        self.start = start
+        self.end = end
+
+    def cvus(self, elapsed):
+        elapsed = min(max(elapsed, 0), self.duration)
+        return int(round(self.start + (self.end - self.start) *
+                         elapsed / self.duration))
+
+    def levels(self):
+        return [self.start, self.end]
+
+
+class StepProfile(LoadProfile):
+    """Levels of users of the same duration: step:10:20:30"""
+    def __init__(self, duration, *levels):
+        LoadProfile.__init__(self, duration)
+        if not levels:
+            raise ValueError('A step profile needs at least one level.')
+        self.steps = levels
+
+    def cvus(self, elapsed):
+        step = int(elapsed * len(self.steps) / self.duration)
+        step = min(max(step, 0), len(self.steps) - 1)
+        return int(self.steps[step])
+
+    def levels(self):
+        return list(self.steps)
+
+
+class SpikeProfile(LoadProfile):
+    """A peak of users during width seconds starting at seconds:
+    spike:BASE:PEAK[:AT[:WIDTH]], default is a peak at the middle of
+    the bench lasting a tenth of it."""
+    def __init__(self, duration, base, peak, at=None, width=None):
+        LoadProfile.__init__(self, duration)
+        self.base = base
+        self.peak = peak
+        if at is None:
+            at = self.duration / 2
+        if width is None:
+            width = self.duration / 10
+        self.at = at
+        self.width = width
+
+    def cvus(self, elapsed):
+        if self.at <= elapsed < self.at + self.width:
+            return int(self.peak)
+        return int(self.base)
+
+    def levels(self):
+        return [self.base, self.peak]
+
+
+class SineProfile(LoadProfile):
+    """Users oscillating around base: sine:BASE:AMPLITUDE[:PERIOD],
+    default period is the bench duration."""
+    def __init__(self, duration, base, amplitude, period=None):
+        LoadProfile.__init__(self, duration)
+        self.base = base
+        self.amplitude = amplitude
+        self.period = period or self.duration
+
+    def cvus(self, elapsed):
+        value = self.base + self.amplitude * math.sin(
+            2 * math.pi * elapsed / self.period)
+        return max(0, int(round(value)))
+
+    def levels(self):
+        return [self.base]
+
+
+class CsvProfile(LoadProfile):
+    """Users interpolated between the points of a csv file: csv:PATH
+
+    Each line of the file contains a time in seconds and a number of
+    users separated by a comma."""
+    def __init__(self, duration, path):
+        LoadProfile.__init__(self, duration)
+        self.path = path
+        points = []
+        f = open(path)
+        try:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                elapsed, cvus = line.split(',')[:2]
+                points.append((float(elapsed), float(cvus)))
+        finally:
+            f.close()
+        if not points:
+            raise ValueError('No point found in load profile %s.' % path)
+        points.sort()
+        self.points = points
+
+    def cvus(self, elapsed):
+        points = self.points
+        if elapsed <= points[0][0]:
+            return int(round(points[0][1]))
+        for (t0, v0), (t1, v1) in zip(points, points[1:]):
+            if elapsed < t1:
+                return int(round(v0 + (v1 - v0) * (elapsed - t0) / (t1 - t0)))
+        return int(round(points[-1][1]))
+
+    def levels(self):
+        return [cvus for elapsed, cvus in self.points]
+
+
+PROFILES = {'ramp': RampProfile,
+            'step': StepProfile,
+            'spike': SpikeProfile,
+            'sine': SineProfile,
+            'csv': CsvProfile}
+
+
+def get_load_profile(spec, duration):
+    """Return the load profile described by spec lasting duration seconds.
+
+    spec is a profile name followed by colon-separated parameters:
+    ramp:1:100, step:10:20:30, spike:10:100, sine:50:40:60 or
+    csv:profile.csv."""
+    parts = spec.strip().split(':')
+    name = parts[0]
+    klass = PROFILES.get(name)
+    if klass is None:
+        raise ValueError('Unknown load profile %r, use one of %s.' % (
+            spec, ', '.join(sorted(PROFILES.keys()))))
+    if klass is CsvProfile:
+        profile = CsvProfile(duration, ':'.join(parts[1:]))
+    else:
+        try:
+            args = [float(arg) for arg in parts[1:]]
+            profile = klass(duration, *args)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid load profile %r: %s' % (
+                spec, klass.__doc__))
+    if min(profile.levels()) < 0:
+        raise ValueError('Invalid load profile %r: a number of users can '
+                         'not be negative.' % spec)
+    return profile
@@ -19,8 +19,11 @@
 reports."""
 from __future__ import print_function
 from __future__ import absolute_import
+import os
 import xml.parsers.expat
+from tempfile import NamedTemporaryFile
 from .utils import trace
+from .BinaryResult import is_binary_result, binary_to_xml
 
 class EndOfConfig(Exception):
     pass
@@ -98,6 +101,27 @@ def replace_all(text, dic):
 
 class MergeResultFiles:
     def __init__(self, input_files, output_file):
+        # binary result files are merged using a xml conversion
+        tmp_files = []
+        xml_files = []
+        for input_file in input_files:
+            if is_binary_result(input_file):
+                f = NamedTemporaryFile(prefix='fl-bin-', suffix='.xml')
+                xml_file = f.name
+                f.close()
+                binary_to_xml(input_file, xml_file)
+                tmp_files.append(xml_file)
+                xml_files.append(xml_file)
+            else:
+                xml_files.append(input_file)
+        try:
+            self.merge(xml_files, output_file)
+        finally:
+            for tmp_file in tmp_files:
+                os.remove(tmp_file)
+
+    def merge(self, input_files, output_file):
+        """Merge xml result files."""
         xml_parser = FunkLoadConfigXmlParser()
         for input_file in input_files:
             trace (".")
@@ -0,0 +1,120 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+"""Links of an HTML page found in a single pass.
+
+The page is scanned with precompiled regular expressions for the img,
+link, script, iframe, a and base tags instead of being parsed by sgmllib
+or into a DOM. Comments and the content of the scripts are skipped.
+"""
+from __future__ import absolute_import
+import re
+from HTMLParser import HTMLParser
+
+# attributes of a tag, the quoted values may contain a >
+ATTRIBUTES = r'''([^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)'''
+# a comment, a script with its content or a tag with a link
+TAGS = re.compile(r'<(?:!--.*?-->|script\b%s>.*?</script\s*>|'
+                  r'(img|link|script|iframe|a|base)\b%s>)' % (
+                      ATTRIBUTES, ATTRIBUTES), re.I | re.S)
+ATTRIBUTE = re.compile(r'''([^\s=/>"']+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|'''
+                       r'''([^\s>"']+)))?''')
+ANCHOR_END = re.compile(r'</?a\b', re.I)
+# tag -> attribute holding its url
+URL_ATTRIBUTES = {'img': 'src', 'link': 'href', 'script': 'src',
+                  'iframe': 'src', 'a': 'href', 'base': 'href'}
+
+_unescape = HTMLParser().unescape
+
+
+def unescape(value):
+    """Return an attribute value with its character references replaced."""
+    if '&' not in value:
+        return value
+    value = _unescape(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return value
+
+
+def parse_attributes(text):
+    """Return the attributes of a tag as a dict, the first one wins."""
+    attributes = {}
+    for name, double, single, bare in ATTRIBUTE.findall(text):
+        name = name.lower()
+        if name not in attributes:
+            attributes[name] = unescape(double or single or bare)
+    return attributes
+
+
+class PageLinks:
+    """Links of an HTML page in the page order.
+
+    base is the href of the first base tag or None, resources the
+    ('image', src) and ('link', href) loaded with the page, anchors the
+    (text, href) of the a tags where text is the raw HTML content of the
+    tag. The values are not joined to the page url."""
+    def __init__(self, page):
+        self.base = None
+        self.resources = []
+        self.images = []
+        self.links = []
+        self.scripts = []
+        self.iframes = []
+        self.anchors = []
+        if page:
+            self.parse(page)
+
+    def parse(self, page):
+        """Scan a page."""
+        for match in TAGS.finditer(page):
+            script, tag, attributes = match.groups()
+            if script is not None:
+                self.addScript(script)
+                continue
+            if tag is None:
+                # a comment
+                continue
+            tag = tag.lower()
+            if tag == 'script':
+                # a script without end tag
+                self.addScript(attributes)
+                continue
+            url = parse_attributes(attributes).get(URL_ATTRIBUTES[tag])
+            if url is None:
+                continue
+            url = url.strip()
+            if tag == 'img':
+                self.images.append(url)
+                self.resources.append(('image', url))
+            elif tag == 'link':
+                self.links.append(url)
+                self.resources.append(('link', url))
+            elif tag == 'iframe':
+                self.iframes.append(url)
+            elif tag == 'a':
+                end = ANCHOR_END.search(page, match.end())
+                if end is None:
+                    text = page[match.end():]
+                else:
+                    text = page[match.end():end.start()]
+                self.anchors.append((text, url))
+            elif self.base is None:
+                self.base = url
+
+    def addScript(self, attributes):
+        """Add the src of a script tag."""
+        url = parse_attributes(attributes).get('src')
+        if url is not None:
+            self.scripts.append(url.strip())
@@ -29,31 +29,52 @@
 * patching to have application/x-www-form-urlencoded by default and only
   multipart when a file is posted
 * patch fetch postdata must be [(key, value) ...] no more dict or list value
+* reuse HTTP/1.1 keep-alive connections when the browser has a pool
+* fetch page resources in parallel when resource_concurrency is set
+* time the dns, connect, tls, ttfb and transfer phases of a request
+* count the bytes sent and received by a request
+* store the cookies in an indexed CookieJar
+* stream a body keeping at most body_retention bytes of it
+* decode the gzip, deflate and br content codings while reading a body
+* fetch the page resources through the browser cache when there is one
+* find the page resources with PageLinks instead of the sgmllib IMGSucker
 
 $Id: PatchWebunit.py 24649 2005-08-29 14:20:19Z bdelbosc $
 """
 from __future__ import print_function
 from __future__ import absolute_import
 import os
+import socket
 import sys
+import threading
 import time
 import urlparse
 from urllib import urlencode
 import httplib
 import cStringIO
+import hashlib
+import zlib
 from mimetypes import guess_type
-import datetime
-import Cookie
 
-from webunit import cookie
-from webunit.IMGSucker import IMGSucker
 from webunit.webunittest import WebTestCase, WebFetcher
 from webunit.webunittest import HTTPResponse, HTTPError, VERBOSE
 from webunit.utility import Upload
 
-from .utils import thread_sleep, Data
+from .utils import thread_sleep, Data, monotonic, Stopwatch, PHASES
+from .CookieJar import CookieJar
+from .PageLinks import PageLinks
 import re
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# content codings the browser can decode
+CONTENT_CODINGS = ['gzip', 'x-gzip', 'deflate']
+if brotli is not None:
+    CONTENT_CODINGS.append('br')
+
 valid_url = re.compile(r'^(http|https)://[a-z0-9\.\-\:]+(\/[^\ \t\<\>]*)?$',
                        re.I)
 
@@ -99,161 +120,540 @@ def mimeEncode(data, sep_boundary=SEP_BOUNDARY, end_boundary=END_BOUNDARY):
     return ret.getvalue()
 
 
-class FKLIMGSucker(IMGSucker):
-    """Image and links loader, patched to log response stats."""
-    def __init__(self, url, session, ftestcase=None):
-        IMGSucker.__init__(self, url, session)
-        self.ftestcase = ftestcase
-
-    def do_img(self, attributes):
-        """Process img tag."""
-        newattributes = []
-        for name, value in attributes:
-            if name == 'src':
-                # construct full url
-                url = urlparse.urljoin(self.base, value)
-                # make sure it's syntactically valid
-                if not valid_url.match(url):
-                    continue
-                # TODO: figure the re-write path
-                # newattributes.append((name, path))
-                if url not in self.session.images:
-                    self.ftestcase.logdd('    img: %s ...' % url)
-                    t_start = time.time()
-                    self.session.images[url] = self.session.fetch(url)
-                    t_stop = time.time()
-                    self.ftestcase.logdd('     Done in %.3fs' %
-                                         (t_stop - t_start))
-                    self.session.history.append(('image', url))
-                    self.ftestcase.total_time += (t_stop - t_start)
-                    self.ftestcase.total_images += 1
-                    self.ftestcase._log_response(self.session.images[url],
-                                                 'image', None, t_start,
-                                                 t_stop)
-                    thread_sleep()      # give a chance to other threads
+class ConnectionPool:
+    """Idle keep-alive connections of a browser.
+
+    Connections are keyed by (protocol, server, port, proxy), a connection
+    idle for more than max_idle seconds is closed instead of reused."""
+    def __init__(self, max_idle=10.0):
+        self.max_idle = max_idle
+        self.idle = {}
+
+    def get(self, key):
+        """Return an idle connection for key or None."""
+        connections = self.idle.get(key)
+        now = time.time()
+        while connections:
+            try:
+                connection, last_used = connections.pop()
+            except IndexError:
+                # taken by a concurrent resource fetch
+                break
+            if now - last_used <= self.max_idle:
+                return connection
+            connection.close()
+        return None
+
+    def put(self, key, connection):
+        """Keep a connection for a next request."""
+        self.idle.setdefault(key, []).append((connection, time.time()))
+
+    def close(self):
+        """Close all the idle connections."""
+        for connections in self.idle.values():
+            for connection, last_used in connections:
+                connection.close()
+        self.idle = {}
+
+
+def timed_connect(connection):
+    """Open the socket of an httplib connection like its connect method,
+    the durations of the DNS lookup and of the TCP connect are set in the
+    phases of the connection."""
+    connection.phases = phases = {}
+    start = monotonic()
+    addresses = socket.getaddrinfo(connection.host, connection.port, 0,
+                                   socket.SOCK_STREAM)
+    resolved = monotonic()
+    phases['dns'] = resolved - start
+    error = socket.error('getaddrinfo returns an empty list')
+    for family, socktype, proto, canonname, address in addresses:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            if connection.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(connection.timeout)
+            if connection.source_address:
+                sock.bind(connection.source_address)
+            sock.connect(address)
+            break
+        except socket.error as exc:
+            error = exc
+            if sock is not None:
+                sock.close()
+            sock = None
+    if sock is None:
+        raise error
+    connection.sock = sock
+    if connection._tunnel_host:
+        connection._tunnel()
+    phases['connect'] = monotonic() - resolved
+
+
+class TimedHTTPConnection(httplib.HTTPConnection):
+    """HTTP connection timing its DNS lookup and TCP connect, and counting
+    the bytes it sends."""
+    phases = None
+    bytes_sent = 0
+
+    def connect(self):
+        timed_connect(self)
+
+    def send(self, data):
+        self.bytes_sent += len(data)
+        httplib.HTTPConnection.send(self, data)
+
+
+class TimedHTTP(httplib.HTTP):
+    _connection_class = TimedHTTPConnection
+
+
+if hasattr(httplib, 'HTTPSConnection'):
+    import ssl
+
+    class TimedHTTPSConnection(httplib.HTTPSConnection):
+        """HTTPS connection timing its DNS lookup, TCP connect and TLS
+        handshake, and counting the bytes it sends."""
+        phases = None
+        bytes_sent = 0
+
+        def send(self, data):
+            self.bytes_sent += len(data)
+            httplib.HTTPSConnection.send(self, data)
+
+        def connect(self):
+            timed_connect(self)
+            start = monotonic()
+            context = getattr(self, '_context', None)
+            if context is not None:
+                self.sock = context.wrap_socket(
+                    self.sock, server_hostname=self._tunnel_host or self.host)
+            else:
+                self.sock = ssl.wrap_socket(self.sock, self.key_file,
+                                            self.cert_file)
+            self.phases['tls'] = monotonic() - start
+
+    class TimedHTTPS(httplib.HTTPS):
+        _connection_class = TimedHTTPSConnection
+
+
+def request_phases(connection, start, first_byte, stop):
+    """Return the phases of a request as a dict.
+
+    The setup phases of a connection are counted by its first request,
+    ttfb is the time to the response headers after the setup and
+    transfer is the time to read the body."""
+    phases = dict.fromkeys(PHASES, 0.0)
+    if connection is not None and connection.phases:
+        phases.update(connection.phases)
+        connection.phases = None
+    setup = phases['dns'] + phases['connect'] + phases['tls']
+    phases['ttfb'] = max(first_byte - start - setup, 0.0)
+    phases['transfer'] = stop - first_byte
+    return phases
+
+
+def response_size(code, reason, headers, body_size):
+    """Return the size of a response on the wire: the status line, the
+    headers and the body before its content decoding.
+
+    The framing of a chunked transfer encoding is not counted."""
+    size = len('HTTP/1.1 %s %s\r\n\r\n' % (code, reason)) + body_size
+    if headers is not None:
+        size += sum([len(line) for line in headers.headers])
+    return size
+
+
+class DeflateDecoder:
+    """Decoder of the deflate coding.
+
+    Some servers send a raw deflate stream instead of the zlib format,
+    the stream is raw when it does not start with a zlib header."""
+    def __init__(self):
+        self.decompressor = None
+        self.head = ''
+
+    def decompress(self, data):
+        if self.decompressor is None:
+            data = self.head + data
+            if len(data) < 2:
+                self.head = data
+                return ''
+            header = ord(data[0]) * 256 + ord(data[1])
+            if ord(data[0]) & 0x0f == 8 and header % 31 == 0:
+                self.decompressor = zlib.decompressobj()
+            else:
+                self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.decompressor.decompress(data)
+
+    def flush(self):
+        if self.decompressor is None:
+            return ''
+        return self.decompressor.flush()
+
+
+class BrotliDecoder:
+    """Decoder of the br coding using the brotli module."""
+    def __init__(self):
+        decompressor = brotli.Decompressor()
+        self.decompress = getattr(decompressor, 'process', None) or \
+                          decompressor.decompress
+
+    def flush(self):
+        return ''
+
+
+class ContentDecoder:
+    """Incremental decoder of the content codings of a response.
+
+    The codings are listed in the order the server applied them, they are
+    removed in the reverse order."""
+    def __init__(self, codings):
+        self.decoders = []
+        for coding in reversed(codings):
+            if coding in ('gzip', 'x-gzip'):
+                decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            elif coding == 'deflate':
+                decoder = DeflateDecoder()
             else:
-                newattributes.append((name, value))
-        # Write the img tag to file (with revised paths)
-        self.unknown_starttag('img', newattributes)
-
-    def do_link(self, attributes):
-        """Process link tag."""
-        newattributes = [('rel', 'stylesheet'), ('type', 'text/css')]
-        for name, value in attributes:
-            if name == 'href':
-                # construct full url
-                url = urlparse.urljoin(self.base, value)
-                # make sure it's syntactically valid
-                if not valid_url.match(url):
-                    continue
-                # TODO: figure the re-write path
-                # newattributes.append((name, path))
-                if url not in self.session.css:
-                    self.ftestcase.logdd('    link: %s ...' % url)
-                    t_start = time.time()
-                    self.session.css[url] = self.session.fetch(url)
-                    t_stop = time.time()
-                    self.ftestcase.logdd('     Done in %.3fs' %
-                                         (t_stop - t_start))
-                    self.session.history.append(('link', url))
-                    self.ftestcase.total_time += (t_stop - t_start)
-                    self.ftestcase.total_links += 1
-                    self.ftestcase._log_response(self.session.css[url],
-                                                 'link', None, t_start, t_stop)
-                    thread_sleep()      # give a chance to other threads
+                decoder = BrotliDecoder()
+            self.decoders.append(decoder)
+
+    def decode(self, data):
+        """Return the decoded bytes of a chunk."""
+        for decoder in self.decoders:
+            if not data:
+                break
+            data = decoder.decompress(data)
+        return data
+
+    def flush(self):
+        """Return the last decoded bytes once the body is read."""
+        data = ''
+        for decoder in self.decoders:
+            if data:
+                data = decoder.decompress(data)
+            data += decoder.flush()
+        return data
+
+
+def content_decoder(headers):
+    """Return the ContentDecoder of a response or None when its body is
+    not encoded or uses a coding that can not be decoded."""
+    if headers is None:
+        return None
+    codings = [coding.strip().lower() for coding in
+               headers.get('content-encoding', '').split(',')]
+    codings = [coding for coding in codings
+               if coding and coding != 'identity']
+    if not codings:
+        return None
+    for coding in codings:
+        if coding not in CONTENT_CODINGS:
+            return None
+    return ContentDecoder(codings)
+
+
+def accept_encoding(value):
+    """Return an Accept-Encoding value without the codings that can not
+    be decoded, br is only kept when the brotli module is installed."""
+    codings = []
+    for item in value.split(','):
+        coding = item.split(';')[0].strip().lower()
+        if coding in CONTENT_CODINGS or coding == 'identity':
+            codings.append(item.strip())
+    return ', '.join(codings)
+
+
+class BodyReader:
+    """Read a response body in chunks keeping at most limit bytes of it.
+
+    The body is decoded chunk by chunk when decode is set, the wire size
+    and the decoded size of the body are counted and the hex digest of
+    the decoded body computed when digest is a hashlib algorithm name.
+    HTML pages and error responses are kept whole, the browser parses the
+    pages and the errors are logged with their body."""
+    chunk_size = 65536
+
+    def __init__(self, limit, digest, ok_codes, decode=False):
+        self.limit = limit
+        self.digest = digest
+        self.ok_codes = ok_codes
+        self.decode = decode
+        self.size = 0
+        self.decoded_size = 0
+        self.hexdigest = None
+        self.truncated = False
+
+    def keepAll(self, code, headers):
+        """Return True if the whole body must be kept."""
+        if self.limit is None or code not in self.ok_codes:
+            return True
+        return headers is not None and 'html' in headers.get(
+            'content-type', '')
+
+    def read(self, fileobj, code, headers):
+        """Read the body of a file object and return the kept bytes."""
+        keep_all = self.keepAll(code, headers)
+        hasher = self.digest and hashlib.new(self.digest)
+        decoder = self.decode and content_decoder(headers)
+        if keep_all and not hasher and not decoder:
+            data = fileobj.read()
+            self.size = self.decoded_size = len(data)
+            return data
+        kept = []
+        kept_size = size = decoded_size = 0
+        while True:
+            chunk = fileobj.read(self.chunk_size)
+            if chunk:
+                size += len(chunk)
+                if decoder:
+                    chunk = decoder.decode(chunk)
+            elif decoder:
+                chunk = decoder.flush()
+                decoder = None
             else:
-                newattributes.append((name, value))
-        # Write the link tag to file (with revised paths)
-        self.unknown_starttag('link', newattributes)
+                break
+            decoded_size += len(chunk)
+            if hasher:
+                hasher.update(chunk)
+            if not keep_all:
+                chunk = chunk[:self.limit - kept_size]
+            if chunk:
+                kept.append(chunk)
+                kept_size += len(chunk)
+        self.size = size
+        self.decoded_size = decoded_size
+        self.truncated = kept_size < decoded_size
+        if hasher:
+            self.hexdigest = hasher.hexdigest()
+        return ''.join(kept)
+
+
+def pooled_request(pool, key, connect, method, url, headers, params,
+                   skip_host, reader=None):
+    """Send a request using a keep-alive connection of the pool.
+
+    A reused connection that was dropped by the server is retried once on
+    a new connection, the body is read by the BodyReader when there is
+    one. Return the httplib response with its body, the phases of the
+    request and the number of bytes sent."""
+    connection = pool.get(key)
+    reused = connection is not None
+    while True:
+        if connection is None:
+            connection = connect()
+        connection.bytes_sent = 0
+        start = monotonic()
+        try:
+            connection.putrequest(method, url, skip_host=skip_host)
+            for header in headers:
+                connection.putheader(*header)
+            connection.endheaders()
+            if params is not None:
+                connection.send(params)
+            response = connection.getresponse()
+        except (httplib.BadStatusLine, httplib.CannotSendRequest,
+                socket.error):
+            connection.close()
+            if not reused:
+                raise
+            connection = None
+            reused = False
+            continue
+        break
+    first_byte = monotonic()
+    if reader is not None:
+        data = reader.read(response, response.status, response.msg)
+    else:
+        data = response.read()
+    phases = request_phases(connection, start, first_byte, monotonic())
+    if response.will_close:
+        connection.close()
+    else:
+        pool.put(key, connection)
+    return response, data, phases, connection.bytes_sent
+
+
+def fetch_resource(session, url):
+    """Fetch a page resource through the browser cache of the session
+    when there is one.
+
+    A stored response is revalidated with a conditional request, a 304
+    response gets the stored body."""
+    cache = getattr(session, 'browser_cache', None)
+    if cache is None:
+        return session.fetch(url)
+    now = time.time()
+    entry = cache.get(url)
+    headers = entry is not None and entry.conditionalHeaders()
+    if not headers:
+        response = session.fetch(url)
+    else:
+        response = session.fetch(url, ok_codes=list(session.expect_codes) +
+                                 [304], extra_headers=headers)
+    if response.code == 304 and entry is not None:
+        cache.refresh(url, response, now)
+        response.body = entry.response.body
+        # no body was decoded, the bytes come from the cache
+        response.decoded_size = 0
+    else:
+        cache.store(url, response, now)
+    return response
 
-# remove webunit logging
-def WTC_log(self, message, content):
-    """Remove webunit logging."""
-    pass
-WebTestCase.log = WTC_log
 
-def decodeCookies(url, server, headers, cookies):
-    """Decode cookies into the supplied cookies dictionary,
-    according to RFC 6265.
-
-    Relevant specs:
-    http://www.ietf.org/rfc/rfc2109.txt (obsolete)
-    http://www.ietf.org/rfc/rfc2965.txt (obsolete)
-    http://www.ietf.org/rfc/rfc6265.txt (proposed standard)
-    """
-    # see rfc 6265, section 5.1.4
-    # empty path => '/'
-    # path must begin with '/', so we only weed out the rightmost '/'
-    request_path = urlparse.urlparse(url)[2]
-    if len(request_path) > 2 and request_path[-1] == '/':
-        request_path = request_path[:-1]
-    else:
-        request_path = '/'
-
-    # XXX - tried slurping all the set-cookie and joining them on
-    # '\n', some cookies were not parsed. This below worked flawlessly.
-    for ch in headers.getallmatchingheaders('set-cookie'):
-        cookie = Cookie.SimpleCookie(ch.strip()).values()[0]
-
-        # see rfc 6265, section 5.3, step 7
-        path = cookie['path'] or request_path
-
-        # see rfc 6265, section 5.3, step 4 to 6
-        # XXX - we don't bother with cookie persistence
-        # XXX - we don't check for public suffixes
-        if cookie['domain']:
-            domain = cookie['domain']
-            # see rfc6265, section 5.2.3
-            if domain[0] == '.':
-               domain = domain[1:]
-            if not server.endswith(domain):
-               continue
+def load_resources(session, base, links, ftestcase, concurrency=1):
+    """Load the images and css of the PageLinks of a page.
+
+    The resources already loaded or fresh in the browser cache are not
+    requested, with a concurrency greater than 1 the others are fetched in
+    parallel by fetch_resources."""
+    cache = getattr(session, 'browser_cache', None)
+    resources = []
+    collected = set()
+    for rtype, value in links.resources:
+        url = urlparse.urljoin(base, value)
+        # make sure it's syntactically valid
+        if not valid_url.match(url):
+            continue
+        if rtype == 'image':
+            responses = session.images
         else:
-            domain = server
-
-        # all date handling is done is UTC
-        # XXX - need reviewing by someone familiar with python datetime objects
-        now = datetime.datetime.utcnow()
-        expire = datetime.datetime.min
-        maxage = cookie['max-age']
-        # see rfc 6265, section 5.3, step 3
-        if maxage != '':
-            timedelta = int(maxage)
-            if timedelta > 0:
-                expire = now + datetime.timedelta(seconds=timedelta)
+            responses = session.css
+        if url in responses or (rtype, url) in collected:
+            continue
+        response = cache is not None and cache.getFresh(url)
+        if response:
+            ftestcase.logdd('    %s: %s from cache' % (rtype, url))
+            responses[url] = response
+            continue
+        if concurrency > 1:
+            resources.append((rtype, url))
+            collected.add((rtype, url))
+            continue
+        ftestcase.logdd('    %s: %s ...' % (rtype, url))
+        watch = Stopwatch()
+        t_start = watch.start
+        responses[url] = fetch_resource(session, url)
+        t_stop = watch.stop()
+        ftestcase.logdd('     Done in %.3fs' % (t_stop - t_start))
+        session.history.append((rtype, url))
+        ftestcase.total_time += (t_stop - t_start)
+        if rtype == 'image':
+            ftestcase.total_images += 1
         else:
-            if cookie['expires'] == '':
-                expire = datetime.datetime.max
+            ftestcase.total_links += 1
+        ftestcase._log_response(responses[url], rtype, None, t_start, t_stop)
+        thread_sleep()      # give a chance to other threads
+    if resources:
+        fetch_resources(session, resources, ftestcase, concurrency)
+
+
+def fetch_resources(session, resources, ftestcase, concurrency):
+    """Fetch page resources using up to concurrency threads.
+
+    Responses are logged in the page order once the whole batch is done,
+    each one with the wall time of the batch. The first error is raised
+    after logging the successful responses and the responses of the later
+    HTTPErrors, the caller logs the raised one as in the serial path.
+
+    The threads share the session: its cookie jar and browser cache are
+    serialized by their lock, the connection pool only uses atomic list
+    operations and the history and responses are updated here once the
+    threads are joined."""
+    results = [None] * len(resources)
+    pending = range(len(resources))
+    pending.reverse()
+
+    def fetch():
+        while True:
+            try:
+                index = pending.pop()
+            except IndexError:
+                return
+            rtype, url = resources[index]
+            ftestcase.logdd('    %s: %s ...' % (rtype, url))
+            watch = Stopwatch()
+            try:
+                response = fetch_resource(session, url)
+                error = None
+            except HTTPError as error:
+                response = error.response
+            except:
+                response = None
+                error = sys.exc_info()[1]
+            results[index] = (response, error, watch.start, watch.stop())
+
+    watch = Stopwatch()
+    threads = [threading.Thread(target=fetch)
+               for i in range(min(concurrency, len(resources)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batch_duration = watch.elapsed()
+    ftestcase.total_time += batch_duration
+    ftestcase.logdd('     Batch of %i done in %.3fs' % (len(resources),
+                                                       batch_duration))
+    first_error = None
+    for (rtype, url), (response, error, t_start, t_stop) in zip(resources,
+                                                                results):
+        if error is not None:
+            if first_error is None:
+                first_error = error
+            elif response is None or ftestcase._accept_invalid_links:
+                if not ftestcase.in_bench_mode:
+                    ftestcase.logd('  %s: %s %s' % (rtype, url, error))
             else:
-                expire = datetime.datetime.strptime(cookie['expires'],"%a, %d-%b-%Y %H:%M:%S %Z")
-
-        cookie['expires'] = expire
-        bydom = cookies.setdefault(domain, {})
-        bypath = bydom.setdefault(path, {})
+                ftestcase.step_success = False
+                ftestcase.test_status = 'Failure'
+                ftestcase._log_response(response, rtype, None, t_start,
+                                        t_stop, log_body=True,
+                                        batch_duration=batch_duration)
+            continue
+        if rtype == 'image':
+            session.images[url] = response
+            ftestcase.total_images += 1
+        else:
+            session.css[url] = response
+            ftestcase.total_links += 1
+        session.history.append((rtype, url))
+        ftestcase._log_response(response, rtype, None, t_start, t_stop,
+                                batch_duration=batch_duration)
+    if first_error is not None:
+        raise first_error
 
-        if expire > now:
-            bypath[cookie.key] = cookie
-        elif cookie.key in bypath:
-            del bypath[cookie.key]
 
+# remove webunit logging
+def WTC_log(self, message, content):
+    """Remove webunit logging."""
+    pass
+WebTestCase.log = WTC_log
 
 # use fl img sucker
-def WTC_pageImages(self, url, page, testcase=None):
+def WTC_pageImages(self, url, page, testcase=None, links=None):
     '''Given the HTML page that was loaded from url, grab all the images.
+
+    links are the PageLinks of the page when it is already scanned.
     '''
-    sucker = FKLIMGSucker(url, self, testcase)
-    sucker.feed(page)
-    sucker.close()
+    concurrency = getattr(testcase, '_resource_concurrency', 1)
+    if links is None:
+        links = PageLinks(page)
+    base = url
+    if links.base:
+        base = urlparse.urljoin(url, links.base)
+    load_resources(self, base, links, testcase, concurrency)
 
 WebTestCase.pageImages = WTC_pageImages
 
 
 # WebFetcher fetch
 def WF_fetch(self, url, postdata=None, server=None, port=None, protocol=None,
-             ok_codes=None, key_file=None, cert_file=None, method="GET", consumer=None):
+             ok_codes=None, key_file=None, cert_file=None, method="GET", consumer=None,
+             extra_headers=None):
     '''Run a single test request to the indicated url. Use the POST data
     if supplied. Accepts key and certificate file paths for https (ssl/tls)
-    connections.
+    connections. extra_headers are added to this request only.
 
     Raises failureException if the returned data contains any of the
     strings indicated to be Error Content.
@@ -300,6 +700,8 @@ def WF_fetch(self, url, postdata=None, server=None, port=None, protocol=None,
     if ok_codes is None:
         ok_codes = self.expect_codes
     webproxy = {}
+    # streamed responses are never kept alive
+    pool = consumer is None and getattr(self, 'connection_pool', None)
 
     if protocol == 'http':
         try:
@@ -309,10 +711,16 @@ def WF_fetch(self, url, postdata=None, server=None, port=None, protocol=None,
         except (KeyError, IndexError, ValueError):
             webproxy = False
 
-        if webproxy:
-            h = httplib.HTTPConnection(webproxy['host'], webproxy['port'])
+        if pool:
+            if webproxy:
+                connect = lambda: TimedHTTPConnection(webproxy['host'],
+                                                      webproxy['port'])
+            else:
+                connect = lambda: TimedHTTPConnection(server, int(port))
+        elif webproxy:
+            h = TimedHTTPConnection(webproxy['host'], webproxy['port'])
         else:
-            h = httplib.HTTP(server, int(port))
+            h = TimedHTTP(server, int(port))
         if int(port) == 80:
             host_header = server
         else:
@@ -330,11 +738,18 @@ def WF_fetch(self, url, postdata=None, server=None, port=None, protocol=None,
             webproxy = False
 
         # patched to use the given key and cert file
-        if webproxy:
-            h = httplib.HTTPSConnection(webproxy['host'], webproxy['port'],
-                                        key_file, cert_file)
+        if pool:
+            if webproxy:
+                connect = lambda: TimedHTTPSConnection(
+                    webproxy['host'], webproxy['port'], key_file, cert_file)
+            else:
+                connect = lambda: TimedHTTPSConnection(
+                    server, int(port), key_file, cert_file)
+        elif webproxy:
+            h = TimedHTTPSConnection(webproxy['host'], webproxy['port'],
+                                     key_file, cert_file)
         else:
-            h = httplib.HTTPS(server, int(port), key_file, cert_file)
+            h = TimedHTTPS(server, int(port), key_file, cert_file)
 
         # FL Patch end  -------------------------
 
@@ -347,13 +762,14 @@ def WF_fetch(self, url, postdata=None, server=None, port=None, protocol=None,
 
     headers = []
     params = None
+    if webproxy:
+        request_url = "%s://%s%s" % (protocol, host_header, url)
+    else:
+        request_url = url
+    start = monotonic()
+    if not pool:
+        h.putrequest(method.upper(), request_url)
     if postdata is not None:
-        if webproxy:
-            h.putrequest(method.upper(), "%s://%s%s" % (protocol,
-                                                        host_header, url))
-        else:
-            # Normal post
-            h.putrequest(method.upper(), url)
         if postdata:
             if isinstance(postdata, Data):
                 # User data and content_type
@@ -376,12 +792,6 @@ def WF_fetch(self, url, postdata=None, server=None, port=None, protocol=None,
                     params = urlencode(postdata)
                     headers.append(('Content-type', 'application/x-www-form-urlencoded'))
             headers.append(('Content-length', str(len(params))))
-    else:
-        if webproxy:
-            h.putrequest(method.upper(), "%s://%s%s" % (protocol,
-                                                        host_header, url))
-        else:
-            h.putrequest(method.upper(), url)
 
     # Other Full Request headers
     if self.authinfo:
@@ -396,69 +806,92 @@ def WF_fetch(self, url, postdata=None, server=None, port=None, protocol=None,
     # FL Patch -------------------------
     for key, value in self.extra_headers:
         headers.append((key, value))
+    if extra_headers:
+        headers.extend(extra_headers)
 
     # FL Patch end ---------------------
 
     # Send cookies
-    #  - check the domain, max-age (seconds), path and secure
-    #    (http://www.ietf.org/rfc/rfc2109.txt)
-    cookies_used = []
-    cookie_list = []
-    for domain, cookies in self.cookies.items():
-        # check cookie domain
-        if not server.endswith(domain) and domain[1:] != server:
-            continue
-        for path, cookies in cookies.items():
-            # check that the path matches
-            urlpath = urlparse.urlparse(url)[2]
-            if not urlpath.startswith(path) and not (path == '/' and
-                    urlpath == ''):
-                continue
-            for sendcookie in cookies.values():
-                # and that the cookie is or isn't secure
-                if sendcookie['secure'] and protocol != 'https':
-                    continue
-                # TODO: check for expires (max-age is working)
-                # hard coded value that application can use to work
-                # around expires
-                if sendcookie.coded_value in ('"deleted"', "null", "deleted"):
-                    continue
-                cookie_list.append("%s=%s;"%(sendcookie.key,
-                                            sendcookie.coded_value))
-                cookies_used.append(sendcookie.key)
-
-    if cookie_list:
-        headers.append(('Cookie', ' '.join(cookie_list)))
+    #  - check the domain, expiration, path and secure
+    #    (http://www.ietf.org/rfc/rfc6265.txt)
+    if not isinstance(self.cookies, CookieJar):
+        # webunit and tests may set a plain dict
+        self.cookies = CookieJar(self.cookies)
+    cookie_header, cookies_used = self.cookies.getCookieHeader(
+        server, urlparse.urlparse(url)[2], protocol == 'https')
+    if cookie_header:
+        headers.append(('Cookie', cookie_header))
 
     # check that we sent the cookies we expected to
     if self.expect_cookies is not None:
+        cookies_used = sorted(cookies_used)
         assert cookies_used == self.expect_cookies, \
             "Didn't use all cookies (%s expected, %s used)"%(
             self.expect_cookies, cookies_used)
 
 
-    # write and finish the headers
-    for header in headers:
-        h.putheader(*header)
-    h.endheaders()
-
     if self.debug_headers:
         for header in headers:
             print("Putting header -- %s: %s" % header)
 
-    if params is not None:
-        h.send(params)
+    if not pool:
+        # write and finish the headers
+        for header in headers:
+            h.putheader(*header)
+        h.endheaders()
+        if params is not None:
+            h.send(params)
 
     # handle the reply
-    if webproxy:
+    reader = None
+    body_retention = getattr(self, 'body_retention', None)
+    body_digest = getattr(self, 'body_digest', None)
+    decode_content = getattr(self, 'decode_content', False)
+    if consumer is None and (body_retention is not None or body_digest or
+                             decode_content):
+        reader = BodyReader(body_retention, body_digest, ok_codes,
+                            decode_content)
+    if pool:
+        # send the request on a keep-alive connection
+        if webproxy:
+            pool_key = (protocol, server, port,
+                        (webproxy['host'], webproxy['port']))
+        else:
+            pool_key = (protocol, server, port, None)
+        r, data, phases, sent = pooled_request(
+            pool, pool_key, connect, method.upper(), request_url, headers,
+            params, skip_host=not webproxy, reader=reader)
+        errcode = r.status
+        errmsg = r.reason
+        headers = r.msg
+        if reader is not None:
+            body_size = reader.size
+        else:
+            body_size = len(data)
+        received = response_size(errcode, errmsg, headers, body_size)
+        if headers is None or 'content-length' in headers and headers['content-length'] == "0":
+            data = None
+        response = HTTPResponse(self.cookies, protocol, server, port, url,
+                                errcode, errmsg, headers, data,
+                                self.error_content)
+    elif webproxy:
         r = h.getresponse()
+        first_byte = monotonic()
         errcode = r.status
         errmsg = r.reason
         headers = r.msg
         if headers is None or 'content-length' in headers and headers['content-length'] == "0":
             data = None
+            body_size = 0
+        elif reader is not None:
+            data = reader.read(r, errcode, headers)
+            body_size = reader.size
         else:
             data = r.read()
+            body_size = len(data)
+        phases = request_phases(h, start, first_byte, monotonic())
+        sent = h.bytes_sent
+        received = response_size(errcode, errmsg, headers, body_size)
         response = HTTPResponse(self.cookies, protocol, server, port, url,
                                 errcode, errmsg, headers, data,
                                 self.error_content)
@@ -466,32 +899,48 @@ def WF_fetch(self, url, postdata=None, server=None, port=None, protocol=None,
     else:
         # get the body and save it
         errcode, errmsg, headers = h.getreply()
+        first_byte = monotonic()
         if headers is None or 'content-length' in headers and headers['content-length'] == "0":
             response = HTTPResponse(self.cookies, protocol, server, port, url,
                                     errcode, errmsg, headers, None,
                                     self.error_content)
         else:
             f = h.getfile()
-            g = cStringIO.StringIO()
-            if consumer is None:
-                d = f.read()
+            if reader is not None:
+                data = reader.read(f, errcode, headers)
+            elif consumer is None:
+                data = f.read()
             else:
+                g = cStringIO.StringIO()
                 d = f.readline(1)
-            while d:
-                g.write(d)
-                if consumer is None:
-                    d = f.read()
-                else:
+                while d:
+                    g.write(d)
                     ret = consumer(d)
                     if ret == 0:
                         # consumer close connection
                         d = None
                     else:
                         d = f.readline(1)
+                data = g.getvalue()
             response = HTTPResponse(self.cookies, protocol, server, port, url,
-                                    errcode, errmsg, headers, g.getvalue(),
+                                    errcode, errmsg, headers, data,
                                     self.error_content)
             f.close()
+        if reader is not None:
+            body_size = reader.size
+        else:
+            body_size = len(response.body or '')
+        phases = request_phases(h._conn, start, first_byte, monotonic())
+        sent = h._conn.bytes_sent
+        received = response_size(errcode, errmsg, headers, body_size)
+    response.phases = phases
+    response.sent = sent
+    response.received = received
+    if reader is not None:
+        response.body_size = reader.size
+        response.decoded_size = reader.decoded_size
+        response.body_digest = reader.hexdigest
+        response.body_truncated = reader.truncated
 
     if errcode not in ok_codes:
         if VERBOSE:
@@ -503,7 +952,7 @@ def WF_fetch(self, url, postdata=None, server=None, port=None, protocol=None,
     if self.accept_cookies:
         try:
             # decode the cookies and update the cookies store
-            decodeCookies(url, server, headers, self.cookies)
+            self.cookies.decodeCookies(url, server, headers)
         except:
             if VERBOSE:
                 sys.stdout.write('c')
@@ -532,6 +981,13 @@ def WF_fetch(self, url, postdata=None, server=None, port=None, protocol=None,
 WebFetcher.fetch = WF_fetch
 
 
+def WF_clearCookies(self):
+    """Clear all currently received cookies."""
+    self.cookies = CookieJar()
+
+WebFetcher.clearCookies = WF_clearCookies
+
+
 def HR___repr__(self):
     """fix HTTPResponse rendering."""
     return """<response url="%s://%s:%s%s" code="%s" message="%s" />""" % (
@@ -540,3 +996,13 @@ def HR___repr__(self):
 
 HTTPResponse.__repr__ = HR___repr__
 
+
+def HR_getLinks(self):
+    """Return the PageLinks of the body, the body is scanned once."""
+    links = getattr(self, 'page_links', None)
+    if links is None:
+        links = self.page_links = PageLinks(self.body)
+    return links
+
+HTTPResponse.getLinks = HR_getLinks
+
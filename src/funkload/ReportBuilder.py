@@ -33,7 +33,8 @@ or
   %prog --diff REPORT_PATH1 REPORT_PATH2
 
 %prog analyze a FunkLoad bench xml result file and output a report.
-If there are more than one file the xml results are merged.
+If there are more than one file the xml results are parsed in parallel
+and merged.
 
 See http://funkload.nuxeo.org/ for more information.
 
@@ -45,6 +46,12 @@ Examples
                         Build an HTML report in /tmp
   %prog --html node1.xml node2.xml node3.xml
                         Build an HTML report merging test results from 3 nodes.
+  %prog --streaming --html funkload.xml
+                        Build an HTML report of a large result file using a
+                        constant memory.
+  %prog --numpy --html funkload.xml
+                        Build an HTML report computing the response stats
+                        with numpy.
   %prog --diff /path/to/report-reference /path/to/report-challenger
                         Build a differential report to compare 2 bench reports,
                         requires gnuplot.
@@ -60,16 +67,18 @@ except ImportError:
     pass
 import os
 import xml.parsers.expat
+import traceback
+from multiprocessing import Pipe, Process, cpu_count
 from optparse import OptionParser, TitledHelpFormatter
-from tempfile import NamedTemporaryFile
 
 from .ReportStats import AllResponseStat, PageStat, ResponseStat, TestStat
-from .ReportStats import MonitorStat, ErrorStat
+from .ReportStats import MonitorStat, ErrorStat, set_streaming_mode
+from .ReportStats import is_streaming_mode, InjectorStat
 from .ReportRenderRst import RenderRst
 from .ReportRenderHtml import RenderHtml
 from .ReportRenderDiff import RenderDiff
 from .ReportRenderTrend import RenderTrend
-from .MergeResultFiles import MergeResultFiles
+from .BinaryResult import is_binary_result, read_records, record_attrs
 from .utils import trace, get_version
 from .apdex import Apdex
 
@@ -103,7 +112,10 @@ class FunkLoadXmlParser:
     def parse(self, xml_file):
         """Do the parsing."""
         try:
-            self.parser.ParseFile(file(xml_file))
+            if is_binary_result(xml_file):
+                self.parseBinary(xml_file)
+            else:
+                self.parser.ParseFile(file(xml_file))
         except xml.parsers.expat.ExpatError as msg:
             if (self.current_element[-1]['name'] == 'funkload'
                 and str(msg).startswith('no element found')):
@@ -123,6 +135,21 @@ class FunkLoadXmlParser:
                     x['name'] for x in self.current_element])
                 raise
 
+    def parseBinary(self, path):
+        """Parse a binary result file.
+
+        Xml chunks are fed to expat, response and test result records
+        are handled as if they were parsed."""
+        parser = self.parser
+        for tag, values, extra in read_records(path):
+            if tag == 'X':
+                parser.Parse(values + '\n', False)
+            else:
+                name, attrs = record_attrs(tag, values, extra)
+                self.handleStartElement(name, attrs)
+                self.handleEndElement(name)
+        parser.Parse('', True)
+
     def handleStartElement(self, name, attrs):
         """Called by expat parser on start element."""
         if name == 'funkload':
@@ -151,37 +178,19 @@ class FunkLoadXmlParser:
                                  attrs['cvus']))
             stat.add(attrs['result'], attrs['pages'], attrs.get('xmlrpc', 0),
                      attrs['redirects'], attrs['images'], attrs['links'],
-                     attrs['connection_duration'], attrs.get('traceback'))
+                     attrs['connection_duration'], attrs.get('traceback'),
+                     attrs.get('time'), attrs.get('intended'))
             stats['test'] = stat
         elif name == 'response':
+            self.handleResponse(attrs)
+        elif name == 'injector':
             cycle = attrs['cycle']
-            stats = self.stats.setdefault(cycle, {'response_step':{}})
-            stat = stats.setdefault(
-                'response', AllResponseStat(cycle, self.cycle_duration,
-                                            attrs['cvus']))
-            stat.add(attrs['time'], attrs['result'], attrs['duration'])
-            stats['response'] = stat
-
-            stat = stats.setdefault(
-                'page', PageStat(cycle, self.cycle_duration, attrs['cvus']))
-            stat.add(attrs['thread'], attrs['step'], attrs['time'],
-                     attrs['result'], attrs['duration'], attrs['type'])
-            stats['page'] = stat
-
-            step = '%s.%s' % (attrs['step'], attrs['number'])
-            stat = stats['response_step'].setdefault(
-                step, ResponseStat(attrs['step'], attrs['number'],
-                                   attrs['cvus']))
-            stat.add(attrs['type'], attrs['result'], attrs['url'],
-                     attrs['duration'], attrs.get('description'))
-            stats['response_step'][step] = stat
-            if attrs['result'] != 'Successful':
-                result = str(attrs['result'])
-                stats = self.error.setdefault(result, [])
-                stats.append(ErrorStat(
-                    attrs['cycle'], attrs['step'], attrs['number'],
-                    attrs.get('code'), attrs.get('headers'),
-                    attrs.get('body'), attrs.get('traceback')))
+            stats = self.stats.setdefault(cycle, {'response_step': {}})
+            stat = stats.setdefault('injector',
+                                    InjectorStat(cycle, attrs['cvus']))
+            stat.add(attrs['cpu'], attrs['sleeps'], attrs['sleep_lag'],
+                     attrs['sleep_lag_max'], attrs['starts'],
+                     attrs['start_lag'], attrs['start_lag_max'])
         elif name == 'monitor':
             host = attrs.get('host')
             stats = self.monitor.setdefault(host, [])
@@ -191,6 +200,47 @@ class FunkLoadXmlParser:
             config = self.monitorconfig.setdefault(host, {})
             config[attrs.get('key')]=attrs.get('value')
 
+    def handleResponse(self, attrs):
+        """Add a response to the cycle stats."""
+        cycle = attrs['cycle']
+        stats = self.stats.setdefault(cycle, {'response_step':{}})
+        stat = stats.setdefault(
+            'response', AllResponseStat(cycle, self.cycle_duration,
+                                        attrs['cvus']))
+        stat.add(attrs['time'], attrs['result'], attrs['duration'],
+                 attrs.get('intended'))
+        stat.addBytes(attrs)
+        stats['response'] = stat
+
+        stat = stats.setdefault(
+            'page', PageStat(cycle, self.cycle_duration, attrs['cvus']))
+        stat.add(attrs['thread'], attrs['step'], attrs['time'],
+                 attrs['result'], attrs['duration'], attrs['type'],
+                 attrs.get('batch_duration'), attrs.get('intended'))
+        stats['page'] = stat
+
+        step = '%s.%s' % (attrs['step'], attrs['number'])
+        stat = stats['response_step'].setdefault(
+            step, ResponseStat(attrs['step'], attrs['number'],
+                               attrs['cvus']))
+        stat.add(attrs['type'], attrs['result'], attrs['url'],
+                 attrs['duration'], attrs.get('description'), attrs['time'],
+                 attrs.get('intended'))
+        stat.addPhases(attrs)
+        stat.addBytes(attrs)
+        stats['response_step'][step] = stat
+        if attrs['result'] != 'Successful':
+            self.handleError(attrs)
+
+    def handleError(self, attrs):
+        """Add a response in error."""
+        result = str(attrs['result'])
+        stats = self.error.setdefault(result, [])
+        stats.append(ErrorStat(
+            attrs['cycle'], attrs['step'], attrs['number'],
+            attrs.get('code'), attrs.get('headers'),
+            attrs.get('body'), attrs.get('traceback')))
+
 
     def handleStartCdataSection(self):
         """Start recording cdata."""
@@ -211,6 +261,175 @@ class FunkLoadXmlParser:
             self.current_cdata += data
 
 
+class FunkLoadNumpyXmlParser(FunkLoadXmlParser):
+    """Parse a funkload xml results, response stats are computed with
+    numpy."""
+    def __init__(self):
+        from .ReportStatsNumpy import ResponseColumns
+        FunkLoadXmlParser.__init__(self)
+        self.response_columns = ResponseColumns
+        self.columns = {}               # cycle response columns
+
+    def parse(self, xml_file):
+        """Do the parsing then compute the response stats."""
+        FunkLoadXmlParser.parse(self, xml_file)
+        for cycle, columns in self.columns.items():
+            self.stats[cycle].update(columns.getStats())
+        self.columns = {}
+
+    def handleResponse(self, attrs):
+        """Store a response into the columns of its cycle."""
+        cycle = attrs['cycle']
+        self.stats.setdefault(cycle, {'response_step':{}})
+        columns = self.columns.get(cycle)
+        if columns is None:
+            columns = self.columns[cycle] = self.response_columns(
+                cycle, self.cycle_duration, attrs['cvus'])
+        columns.add(attrs)
+        if attrs['result'] != 'Successful':
+            self.handleError(attrs)
+
+
+def parse_result_file(args):
+    """Parse a result file in a pool process, return the parsed data."""
+    xml_file, numpy_mode, streaming, apdex_t = args
+    set_streaming_mode(streaming)
+    Apdex.T = apdex_t
+    if numpy_mode:
+        parser = FunkLoadNumpyXmlParser()
+    else:
+        parser = FunkLoadXmlParser()
+    parser.parse(xml_file)
+    for stats in parser.stats.values():
+        if 'page' in stats:
+            # send aggregated stats instead of the pages
+            stats['page'].closePages()
+    return (parser.config, parser.stats, parser.error, parser.monitor,
+            parser.monitorconfig)
+
+
+def parse_result_worker(args, conn):
+    """Entry point of a process parsing a result file."""
+    try:
+        conn.send(('ok', parse_result_file(args)))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    conn.close()
+
+
+class FunkLoadParallelParser:
+    """Parse the result files of a distributed bench in parallel processes,
+    the stats of each file are merged as MergeResultFiles would do."""
+    def __init__(self, jobs=None, numpy_mode=False):
+        self.jobs = jobs or cpu_count()
+        self.numpy_mode = numpy_mode
+        self.stats = {}
+        self.monitor = {}
+        self.monitorconfig = {}
+        self.config = {}
+        self.error = {}
+
+    def parse(self, xml_files):
+        """Parse and merge the result files."""
+        results = self.parseFiles(xml_files)
+        node_names = []
+        cvus = {}
+        for i, (config, stats, error, monitor, monitorconfig) in enumerate(
+            results):
+            if self.config and (
+                config.get('duration') != self.config.get('duration') or
+                config.get('cycles') != self.config.get('cycles')):
+                trace('Skipping file %s with different cycles or cycle '
+                      'duration\n' % xml_files[i])
+                continue
+            node_name = config.get('node', 'node-' + str(i))
+            node_names.append(node_name)
+            if not self.config:
+                self.config = config
+            self.mergeStats(stats, cvus)
+            for result, errors in error.items():
+                self.error.setdefault(result, []).extend(errors)
+            for host, monitor_stats in monitor.items():
+                if host == 'localhost':
+                    host = node_name
+                    for stat in monitor_stats:
+                        stat.host = host
+                self.monitor.setdefault(host, []).extend(monitor_stats)
+            for host, host_config in monitorconfig.items():
+                if host == 'localhost':
+                    host = node_name
+                self.monitorconfig.setdefault(host, {}).update(host_config)
+        if 'node' in self.config:
+            self.config['node'] = ', '.join(node_names)
+        if self.config.get('cycles'):
+            cycles = [int(item) * len(node_names) for item in
+                      self.config['cycles'][1:-1].split(',')]
+            self.config['cycles'] = str(cycles)
+        # the concurrent users of a cycle are the sum of all nodes
+        for cycle, stats in self.stats.items():
+            for stat in [stats.get('response'), stats.get('page'),
+                         stats.get('test')] + stats['response_step'].values():
+                if stat is not None:
+                    stat.cvus = cvus[cycle]
+
+    def parseFiles(self, xml_files):
+        """Parse the files using at most jobs processes.
+
+        Processes and pipes are used instead of a multiprocessing pool
+        that does not work once gevent patched the stdlib."""
+        results = [None] * len(xml_files)
+        pending = list(enumerate(xml_files))
+        running = {}
+        while pending or running:
+            while pending and len(running) < self.jobs:
+                i, xml_file = pending.pop(0)
+                conn, child_conn = Pipe(False)
+                process = Process(target=parse_result_worker, args=(
+                    (xml_file, self.numpy_mode, is_streaming_mode(),
+                     Apdex.T), child_conn))
+                process.start()
+                child_conn.close()
+                running[i] = (process, conn)
+            for i, (process, conn) in running.items():
+                if not conn.poll(0.1):
+                    continue
+                try:
+                    status, data = conn.recv()
+                except EOFError:
+                    status, data = 'error', 'process exited unexpectedly'
+                conn.close()
+                process.join()
+                del running[i]
+                if status == 'error':
+                    for process, conn in running.values():
+                        process.terminate()
+                    raise RuntimeError('Failed to parse %s:\n%s' % (
+                        xml_files[i], data))
+                results[i] = data
+        return results
+
+    def mergeStats(self, stats, cvus):
+        """Merge the cycle stats of a node."""
+        for cycle, node_stats in stats.items():
+            for key in ('test', 'response', 'page'):
+                if key in node_stats:
+                    cvus[cycle] = cvus.get(cycle, 0) + node_stats[key].cvus
+                    break
+            cycle_stats = self.stats.setdefault(cycle, {'response_step': {}})
+            for key, stat in node_stats.items():
+                if key == 'response_step':
+                    continue
+                if key in cycle_stats:
+                    cycle_stats[key].merge(stat)
+                else:
+                    cycle_stats[key] = stat
+            steps = cycle_stats['response_step']
+            for step, stat in node_stats['response_step'].items():
+                if step in steps:
+                    steps[step].merge(stat)
+                else:
+                    steps[step] = stat
+
 
 # ------------------------------------------------------------
 # main
@@ -259,6 +478,20 @@ def main():
     parser.add_option("", "--skip-definitions", action="store_true",
                       default=False, dest="skip_definitions",
                       help="If True, will skip the definitions")
+    parser.add_option("", "--streaming", action="store_true",
+                      default=False, dest="streaming",
+                      help=("Use a constant memory to build the report of "
+                            "large result files, percentiles are computed "
+                            "with a relative error below 0.4%."))
+    parser.add_option("", "--numpy", action="store_true",
+                      default=False, dest="numpy",
+                      help=("Compute the response stats with numpy, faster "
+                            "on large result files, requires numpy."))
+    parser.add_option("-j", "--jobs", type="int",
+                      dest="jobs",
+                      help=("Number of processes used to parse multiple "
+                            "results files, default is the number of CPUs."),
+                      default=None)
     parser.add_option("-q", "--quiet", action="store_true",
                       default=False, dest="quiet",
                       help=("Report no system messages when generating"
@@ -285,18 +518,29 @@ def main():
     else:
         if len(args) < 1:
             parser.error("incorrect number of arguments")
-        if len(args) > 1:
-            trace("Merging results files: ")
-            f = NamedTemporaryFile(prefix='fl-mrg-', suffix='.xml')
-            tmp_file = f.name
-            f.close()
-            MergeResultFiles(args, tmp_file)
-            trace("Results merged in tmp file: %s\n" % os.path.abspath(tmp_file))
-            args = [tmp_file]
+        if options.numpy:
+            if options.streaming:
+                parser.error("--numpy and --streaming are exclusive")
+            try:
+                from . import ReportStatsNumpy
+            except ImportError:
+                parser.error("--numpy requires numpy")
+        options.xml_files = args
         options.xml_file = args[0]
         Apdex.T = options.apdex_t
-        xml_parser = FunkLoadXmlParser()
-        xml_parser.parse(options.xml_file)
+        set_streaming_mode(options.streaming)
+        if len(args) > 1:
+            xml_parser = FunkLoadParallelParser(options.jobs, options.numpy)
+            trace("Parsing %i results files using %i jobs ... " % (
+                len(args), min(xml_parser.jobs, len(args))))
+            xml_parser.parse(args)
+            trace("done.\n")
+        else:
+            if options.numpy:
+                xml_parser = FunkLoadNumpyXmlParser()
+            else:
+                xml_parser = FunkLoadXmlParser()
+            xml_parser.parse(options.xml_file)
         if options.html:
             trace("Creating html report: ...")
             html_path = RenderHtml(xml_parser.config, xml_parser.stats,
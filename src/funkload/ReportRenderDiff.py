@@ -159,11 +159,17 @@ class RenderDiff(RenderHtmlBase):
                 continue
             if delim == 1:
                 self.header = line.strip().split()
+                # the gnuplot script uses fixed columns, skip tail percentiles
+                width = len(self.header)
+                if 'P99' in self.header:
+                    width = self.header.index('P99')
+                self.header = self.header[:width]
             if delim < 2:
                 continue
             if delim == 3:
                 break
-            ret.append([x.replace("%","") for x in line.strip().split()])
+            ret.append([x.replace("%","")
+                        for x in line.strip().split()][:width])
         return ret
 
     def createGnuplotData(self):
@@ -27,6 +27,7 @@ from __future__ import absolute_import
 import os
 from shutil import copyfile
 from .ReportRenderRst import RenderRst, rst_title
+from .BinaryResult import is_binary_result, binary_to_xml
 
 
 class RenderHtmlBase(RenderRst):
@@ -109,10 +110,19 @@ class RenderHtmlBase(RenderRst):
         self.css_path = css_dest_path
 
     def copyXmlResult(self):
-        """Make a copy of the xml result."""
-        xml_src_path = self.options.xml_file
-        xml_dest_path = os.path.join(self.report_dir, 'funkload.xml')
-        copyfile(xml_src_path, xml_dest_path)
+        """Make a copy of the xml results."""
+        xml_src_paths = getattr(self.options, 'xml_files', None) or [
+            self.options.xml_file]
+        for i, xml_src_path in enumerate(xml_src_paths):
+            if len(xml_src_paths) == 1:
+                xml_dest_path = os.path.join(self.report_dir, 'funkload.xml')
+            else:
+                xml_dest_path = os.path.join(self.report_dir,
+                                             'funkload-%i.xml' % i)
+            if is_binary_result(xml_src_path):
+                binary_to_xml(xml_src_path, xml_dest_path)
+            else:
+                copyfile(xml_src_path, xml_dest_path)
 
     def generateHtml(self):
         """Ask docutils to convert our rst file into html."""
@@ -148,9 +158,13 @@ class RenderHtmlBase(RenderRst):
         """Create all charts."""
         self.createTestChart()
         self.createPageChart()
+        if self.config.get('profile'):
+            self.createLoadProfileChart()
         self.createAllResponseChart()
+        self.createNetworkChart()
         for step_name in self.steps:
             self.createResponseChart(step_name)
+            self.createResponsePhasesChart(step_name)
 
     # monitoring charts
     def createMonitorCharts(self):
@@ -169,12 +183,21 @@ class RenderHtmlBase(RenderRst):
     def createPageChart(self):
         """Create the page chart."""
 
+    def createLoadProfileChart(self):
+        """Create the load profile chart."""
+
     def createAllResponseChart(self):
         """Create global responses chart."""
 
     def createResponseChart(self, step):
         """Create responses chart."""
 
+    def createNetworkChart(self):
+        """Create the network throughput chart."""
+
+    def createResponsePhasesChart(self, step):
+        """Create the chart of the request phases."""
+
     def createMonitorChart(self, host):
         """Create monitrored server charts."""
 
@@ -30,6 +30,7 @@ from commands import getstatusoutput
 from .apdex import Apdex
 from .ReportRenderRst import rst_title
 from .ReportRenderHtmlBase import RenderHtmlBase
+from .ReportStats import PHASES
 from datetime import datetime
 from .MonitorPlugins import MonitorPlugins
 from .MonitorPluginsDefault import MonitorCPU, MonitorMemFree, MonitorNetwork, MonitorCUs
@@ -204,7 +205,8 @@ class RenderHtmlGnuPlot(RenderHtmlBase):
         data_path = gnuplot_scriptpath(self.report_dir, 'pages.data')
         stats = self.stats
         # data
-        lines = ["CUs SPPS ERROR MIN AVG MAX P10 P50 P90 P95 APDEX E G F P U"]
+        lines = ["CUs SPPS ERROR MIN AVG MAX P10 P50 P90 P95 APDEX E G F P U "
+                 "P99 P999 P9999"]
         cvus = []
         has_error = False
         for cycle in self.cycles:
@@ -238,6 +240,9 @@ class RenderHtmlGnuPlot(RenderHtmlBase):
             apdex[index] = str(score)
 
             values = values + apdex
+            values.append(str(page.percentiles.perc99))
+            values.append(str(page.percentiles.perc999))
+            values.append(str(page.percentiles.perc9999))
             lines.append(' '.join(values))
         if len(lines) == 1:
             # No pages finished during a cycle
@@ -313,6 +318,47 @@ class RenderHtmlGnuPlot(RenderHtmlBase):
         f.close()
         gnuplot(gplot_path)
 
+    def createLoadProfileChart(self):
+        """Create the CUs and page response time over time chart."""
+        image_path = gnuplot_scriptpath(self.report_dir, 'load_profile.png')
+        gplot_path = str(os.path.join(self.report_dir, 'load_profile.gplot'))
+        data_path = gnuplot_scriptpath(self.report_dir, 'load_profile.data')
+        stats = self.stats
+        window = float(self.config['duration'])
+        # data
+        lines = ["TIME CUs SPPS AVG P95"]
+        for cycle in self.cycles:
+            if 'page' not in stats[cycle]:
+                continue
+            page = stats[cycle]['page']
+            page.finalize()
+            lines.append(' '.join([str(int(cycle) * window), str(page.cvus),
+                                   str(page.rps), str(page.avg),
+                                   str(page.percentiles.perc95)]))
+        if len(lines) == 1:
+            return
+        f = open(data_path, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+        # script
+        lines = ['set output "' + image_path + '"']
+        lines.append('set title "Load profile"')
+        lines.append('set terminal png size ' + self.getChartSizeTmp(None))
+        lines.append('set xlabel "Time (s)"')
+        lines.append('set ylabel "Duration (s)"')
+        lines.append('set y2label "Concurrent Users"')
+        lines.append('set ytics nomirror')
+        lines.append('set y2tics')
+        lines.append('set grid back')
+        lines.append('set key inside top left')
+        lines.append('plot "%s" u 1:2 axes x1y2 w steps lw 2 lt 3 t "CUs", '
+                     '"" u 1:4 w linespoints lw 2 lt 2 t "avg", '
+                     '"" u 1:5 w linespoints lw 1 lt 1 t "p95"' % data_path)
+        f = open(gplot_path, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+        gnuplot(gplot_path)
+
     def createRPSTimeChart(self):
         """Create a RPS chart where X-axis represent the time in seconds."""
         img_path = gnuplot_scriptpath(self.report_dir, 'time_rps.png')
@@ -422,7 +468,8 @@ class RenderHtmlGnuPlot(RenderHtmlBase):
         data_path = gnuplot_scriptpath(self.report_dir, 'requests.data')
         stats = self.stats
         # data
-        lines = ["CUs RPS ERROR MIN AVG MAX P10 P50 P90 P95 APDEX"]
+        lines = ["CUs RPS ERROR MIN AVG MAX P10 P50 P90 P95 APDEX "
+                 "P99 P999 P9999"]
         cvus = []
         has_error = False
         for cycle in self.cycles:
@@ -445,6 +492,9 @@ class RenderHtmlGnuPlot(RenderHtmlBase):
             values.append(str(resp.percentiles.perc90))
             values.append(str(resp.percentiles.perc95))
             values.append(str(resp.apdex_score))
+            values.append(str(resp.percentiles.perc99))
+            values.append(str(resp.percentiles.perc999))
+            values.append(str(resp.percentiles.perc9999))
             lines.append(' '.join(values))
         if len(lines) == 1:
             # No result during a cycle
@@ -511,7 +561,8 @@ class RenderHtmlGnuPlot(RenderHtmlBase):
                                        'request_%s.data' % step)
         stats = self.stats
         # data
-        lines = ["CUs STEP ERROR MIN AVG MAX P10 P50 P90 P95 APDEX"]
+        lines = ["CUs STEP ERROR MIN AVG MAX P10 P50 P90 P95 APDEX "
+                 "P99 P999 P9999"]
         cvus = []
         has_error = False
         for cycle in self.cycles:
@@ -534,6 +585,9 @@ class RenderHtmlGnuPlot(RenderHtmlBase):
             values.append(str(resp.percentiles.perc90))
             values.append(str(resp.percentiles.perc95))
             values.append(str(resp.apdex_score))
+            values.append(str(resp.percentiles.perc99))
+            values.append(str(resp.percentiles.perc999))
+            values.append(str(resp.percentiles.perc9999))
             lines.append(' '.join(values))
         if len(lines) == 1:
             # No result during a cycle
@@ -585,6 +639,100 @@ class RenderHtmlGnuPlot(RenderHtmlBase):
         gnuplot(gplot_path)
         return
 
+    def createNetworkChart(self):
+        """Create the MB/s chart where X-axis represent the time."""
+        image_path = gnuplot_scriptpath(self.report_dir, 'time_bytes.png')
+        gplot_path = str(os.path.join(self.report_dir, 'time_bytes.gplot'))
+        data_path = gnuplot_scriptpath(self.report_dir, 'time_bytes.data')
+        stats = self.stats
+        # data
+        lines = ["TIME SENT RECEIVED"]
+        mb = 1024.0 * 1024.0
+        for cycle in self.cycles:
+            if 'response' not in stats[cycle]:
+                continue
+            resp = stats[cycle]['response']
+            if not resp.hasBytes():
+                continue
+            for second in sorted(resp.bytes_per_second.keys()):
+                sent, received = resp.bytes_per_second[second]
+                lines.append('%s %s %s' % (second, sent / mb, received / mb))
+            # a blank line splits the cycles
+            lines.append('')
+        if len(lines) == 1:
+            # No sizes recorded
+            return
+        f = open(data_path, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+        # script
+        lines = []
+        lines.append('set output "%s"' % image_path)
+        lines.append('set terminal png size ' + self.getChartSizeTmp([]))
+        lines.append('set title "Network throughput over time"')
+        lines.append('set xlabel "Time line"')
+        lines.append('set xdata time')
+        lines.append('set timefmt "%s"')
+        lines.append('set format x "%H:%M"')
+        lines.append('set ylabel "MB/s"')
+        lines.append('set grid')
+        lines.append('plot "%s" u 1:3 w linespoints lw 1 lt 1 t "received", '
+                     '"" u 1:2 w linespoints lw 1 lt 2 t "sent"' % data_path)
+        f = open(gplot_path, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+        gnuplot(gplot_path)
+        return
+
+    def createResponsePhasesChart(self, step):
+        """Create the stacked chart of the request phases."""
+        image_path = gnuplot_scriptpath(self.report_dir,
+                                        'request_%s_phases.png' % step)
+        gplot_path = str(os.path.join(self.report_dir,
+                                      'request_%s_phases.gplot' % step))
+        data_path = gnuplot_scriptpath(self.report_dir,
+                                       'request_%s_phases.data' % step)
+        stats = self.stats
+        # data
+        lines = ["CUs " + " ".join([phase.upper() for phase in PHASES])]
+        cvus = []
+        for cycle in self.cycles:
+            resp = stats[cycle]['response_step'].get(step)
+            if resp is None or resp.getPhases() is None:
+                continue
+            phases = resp.getPhases()
+            cvus.append(str(resp.cvus))
+            lines.append(' '.join([str(resp.cvus)] +
+                                  [str(phases[phase]) for phase in PHASES]))
+        if len(lines) == 1:
+            # No phases recorded
+            return
+        f = open(data_path, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+        # script
+        lines = []
+        lines.append('set output "%s"' % image_path)
+        lines.append('set terminal png size ' + self.getChartSizeTmp(cvus))
+        lines.append('set grid back')
+        lines.append('set title "Request %s Phases"' % step)
+        lines.append('set xlabel "Concurrent Users"')
+        lines.append('set ylabel "Average duration (s)"')
+        lines.append('set key left top')
+        lines.append('set style data histograms')
+        lines.append('set style histogram rowstacked')
+        lines.append('set style fill solid .5 border -1')
+        lines.append('set boxwidth 0.75')
+        plots = ['"%s" u 2:xtic(1) t "dns"' % data_path]
+        for column, phase in enumerate(PHASES[1:]):
+            plots.append('"" u %d t "%s"' % (column + 3, phase))
+        lines.append('plot ' + ', '.join(plots))
+        f = open(gplot_path, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+        gnuplot(gplot_path)
+        return
+
     def createMonitorChart(self, host):
         """Create monitrored server charts."""
         stats = self.monitor[host]
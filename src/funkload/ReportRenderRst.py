@@ -23,9 +23,12 @@ from __future__ import absolute_import
 import os
 from .utils import get_version
 from .apdex import Apdex
+from .ReportStats import PHASES
 from .MonitorPluginsDefault import MonitorCPU, MonitorMemFree, MonitorNetwork, MonitorCUs
 
 LI = '*'
+# bytes in a MB of the throughput
+MB = 1024.0 * 1024.0
 # ------------------------------------------------------------
 # ReST rendering
 #
@@ -59,6 +62,7 @@ class BaseRst:
     indent = 0
     image_names = []
     with_percentiles = False
+    with_corrected = False
     with_apdex = False
 
     def __init__(self, stats):
@@ -100,7 +104,9 @@ class BaseRst:
     def _attach_percentiles_header(self, headers):
         """ Attach percentile headers. """
         headers.extend(
-            ["P10", "MED", "P90", "P95"])
+            ["P10", "MED", "P90", "P95", "P99", "P99.9", "P99.99"])
+        if self.with_corrected:
+            headers.extend(["cP95", "cP99", "cP99.9"])
 
     def _attach_percentiles(self, ret):
         """ Attach percentiles, if this is wanted. """
@@ -110,8 +116,18 @@ class BaseRst:
             fmt % percentiles.perc10,
             fmt % percentiles.perc50,
             fmt % percentiles.perc90,
-            fmt % percentiles.perc95
+            fmt % percentiles.perc95,
+            fmt % percentiles.perc99,
+            fmt % percentiles.perc999,
+            fmt % percentiles.perc9999
         ])
+        if self.with_corrected:
+            corrected = self.stats.corrected
+            if corrected is None:
+                ret.extend([fmt % -1] * 3)
+            else:
+                ret.extend([fmt % corrected.perc95, fmt % corrected.perc99,
+                            fmt % corrected.perc999])
 
     def render_footer(self):
         """Render rst footer."""
@@ -233,18 +249,28 @@ class RenderRst:
         self.monitorconfig = monitorconfig
         self.options = options
         self.rst = []
+        self.with_phases = False
 
         cycles = stats.keys()
         cycles.sort()
         self.cycles = cycles
         if options.with_percentiles:
             BaseRst.with_percentiles = True
+            BaseRst.with_corrected = self.hasCorrected()
         if options.html:
             self.with_chart = True
         else:
             self.with_chart = False
         self.date = config['time'][:19].replace('T', ' ')
 
+    def hasCorrected(self):
+        """True if the bench recorded the intended start of responses."""
+        for cycle in self.cycles:
+            stat = self.stats[cycle].get('response')
+            if stat is not None and stat.corrected is not None:
+                return True
+        return False
+
     def getRepresentativeCycleStat(self):
         """Return the cycle stat with the maximum number of steps."""
         stats = self.stats
@@ -330,8 +356,34 @@ class RenderRst:
         if config.get('label'):
             self.append(LI + " Label: %s" % config['label'])
         self.append(LI + " Target server: %s" % config['server_url'])
-        self.append(LI + " Cycles of concurrent users: %s" % config['cycles'])
-        self.append(LI + " Cycle duration: %ss" % config['duration'])
+        if config.get('rates'):
+            self.append(LI + " Arrival rates: %s tests/s (%s), %s threads" % (
+                config['rates'], config['arrival'],
+                config['arrival_workers']))
+        elif config.get('profile'):
+            self.append(LI + " Load profile: %s during %ss" % (
+                config['profile'], config['profile_duration']))
+        else:
+            self.append(LI + " Cycles of concurrent users: %s" %
+                        config['cycles'])
+        if config.get('find_max'):
+            self.append(LI + " Maximum sustainable load: %s" %
+                        config['find_max'])
+            self.append(LI + " SLO: P95 of requests <= %ss, errors <= %s%%" % (
+                config.get('max_p95', '-'),
+                config.get('max_error_percent', '-')))
+        rules = [config[key] for key in sorted(config.keys())
+                 if key.startswith('abort_if_')]
+        if rules:
+            self.append(LI + " Abort if: %s" % ', '.join(rules))
+        if config.get('abort'):
+            self.append(LI + " **Aborted** during %s, the next cycles "
+                        "were skipped" % config['abort'])
+        if config.get('profile'):
+            self.append(LI + " Stat window duration: %ss" %
+                        config['duration'])
+        else:
+            self.append(LI + " Cycle duration: %ss" % config['duration'])
         self.append(LI + " Sleeptime between requests: from %ss to %ss" % (
             config['sleep_time_min'], config['sleep_time_max']))
         self.append(LI + " Sleeptime between test cases: %ss" %
@@ -431,6 +483,126 @@ class RenderRst:
                         'the cycle duration is too short.\n' % key)
 
 
+    def renderLoadProfile(self):
+        """Render the page stats of each window of a load profile."""
+        stats = self.stats
+        window = float(self.config['duration'])
+        self.append(rst_title("Load profile", 2))
+        self.append('The Concurrent Users (CUs) and the page response times '
+                    'over the time of the bench, a cycle is a window of '
+                    '%ss.' % self.config['duration'])
+        self.append('')
+        headers = ["TIME", "CUs", "SPPS", "ERROR", "AVG", "P95"]
+        deco = ' ' + " ".join([BaseRst.fmt_deco] * len(headers))
+        if self.with_chart:
+            self.append(" .. image:: load_profile.png")
+            self.append('')
+        self.append(deco)
+        self.append(" " + " ".join(["%18s" % h for h in headers]))
+        self.append(deco)
+        for cycle in self.cycles:
+            if 'page' not in stats[cycle]:
+                continue
+            stat = stats[cycle]['page']
+            stat.finalize()
+            self.append(' ' + ' '.join([
+                BaseRst.fmt_int % (int(cycle) * window),
+                BaseRst.fmt_int % stat.cvus,
+                BaseRst.fmt_float % stat.rps,
+                BaseRst.fmt_percent % stat.error_percent,
+                BaseRst.fmt_float % stat.avg,
+                BaseRst.fmt_float % stat.percentiles.perc95]))
+        self.append(deco)
+        self.append('')
+
+    def renderNetwork(self):
+        """Render the bytes sent and received of each cycle."""
+        stats = self.stats
+        cycles = [cycle for cycle in self.cycles
+                  if 'response' in stats[cycle] and
+                  stats[cycle]['response'].hasBytes()]
+        if not cycles:
+            return
+        self.append(rst_title("Network throughput", 2))
+        self.append('The bytes sent and received per second in MB/s over '
+                    'Concurrent Users (CUs), and the percentiles of the '
+                    'response sizes in bytes. A throughput plateau close to '
+                    'the bandwidth of the injector network is not a limit '
+                    'of the application.')
+        self.append('')
+        headers = ["CUs", "SENT MB/s", "RECEIVED MB/s", "maxRECEIVED MB/s",
+                   "DECODED MB/s", "AVG SIZE", "MED SIZE", "P95 SIZE",
+                   "P99 SIZE", "304"]
+        deco = ' ' + " ".join([BaseRst.fmt_deco] * len(headers))
+        if self.with_chart:
+            self.append(" .. image:: time_bytes.png")
+            self.append('')
+        self.append(deco)
+        self.append(" " + " ".join(["%18s" % h for h in headers]))
+        self.append(deco)
+        for cycle in cycles:
+            stat = stats[cycle]['response']
+            sizes = stat.getSizes()
+            duration = float(stat.cycle_duration or 1) * MB
+            received_max = max([received for sent, received
+                                in stat.bytes_per_second.values()])
+            self.append(' ' + ' '.join([
+                BaseRst.fmt_int % stat.cvus,
+                BaseRst.fmt_float % (stat.sent / duration),
+                BaseRst.fmt_float % (stat.received / duration),
+                BaseRst.fmt_float % (received_max / MB),
+                BaseRst.fmt_float % (stat.decoded / duration),
+                BaseRst.fmt_int % (stat.received / stat.bytes_count),
+                BaseRst.fmt_int % sizes.perc50,
+                BaseRst.fmt_int % sizes.perc95,
+                BaseRst.fmt_int % sizes.perc99,
+                BaseRst.fmt_int % stat.not_modified]))
+        self.append(deco)
+        self.append('')
+
+    def renderInjector(self):
+        """Render the injector samples of each cycle."""
+        stats = self.stats
+        cycles = [cycle for cycle in self.cycles
+                  if 'injector' in stats[cycle]]
+        if not cycles:
+            return
+        max_lag = float(self.config.get('injector_max_lag', 0.05))
+        self.append(rst_title("Injector", 2))
+        self.append('The CPU usage of the injector in percent of a core and '
+                    'the lag of its virtual users behind their schedule, a '
+                    'cycle lagging more than %ss has a warning: its response '
+                    'times include a client side delay.' % max_lag)
+        self.append('')
+        headers = ["CUs", "CPU", "maxCPU", "SLEEP LAG", "maxSLEEP LAG",
+                   "START LAG", "maxSTART LAG", "STATUS"]
+        deco = ' ' + " ".join([BaseRst.fmt_deco] * len(headers))
+        self.append(deco)
+        self.append(" " + " ".join(["%18s" % h for h in headers]))
+        self.append(deco)
+        for cycle in cycles:
+            stat = stats[cycle]['injector']
+            stat.finalize()
+            cvus = stat.cvus
+            for key in ('test', 'page', 'response'):
+                if key in stats[cycle]:
+                    cvus = stats[cycle][key].cvus
+                    break
+            status = 'OK'
+            if stat.lag() > max_lag:
+                status = 'WARNING'
+            self.append(' ' + ' '.join([
+                BaseRst.fmt_int % int(cvus),
+                BaseRst.fmt_percent % stat.cpu,
+                BaseRst.fmt_percent % stat.cpu_max,
+                BaseRst.fmt_float % stat.sleep_lag,
+                BaseRst.fmt_float % stat.sleep_lag_max,
+                BaseRst.fmt_float % stat.start_lag,
+                BaseRst.fmt_float % stat.start_lag_max,
+                BaseRst.fmt_str % status]))
+        self.append(deco)
+        self.append('')
+
     def renderCyclesStepStat(self, step):
         """Render a step stats for all cycle."""
         stats = self.stats
@@ -447,6 +619,74 @@ class RenderRst:
             self.append(renderer.render_stat())
         if renderer is not None:
             self.append(renderer.render_footer())
+        self.renderCyclesStepPhases(step)
+        self.renderCyclesStepBytes(step)
+
+    def renderCyclesStepPhases(self, step):
+        """Render the average phases of a step for all cycle."""
+        stats = self.stats
+        rows = []
+        for cycle in self.cycles:
+            stat = stats[cycle]['response_step'].get(step)
+            if stat is not None and stat.getPhases() is not None:
+                rows.append((stat.cvus, stat.getPhases()))
+        if not rows:
+            return
+        self.with_phases = True
+        indent = ' ' * (ResponseRst.indent + 1)
+        self.append('')
+        self.append(indent + 'Average duration of the request phases:')
+        self.append('')
+        if self.with_chart:
+            self.append(indent + ".. image:: request_%s_phases.png" % step)
+            self.append('')
+        headers = ["CUs"] + [phase.upper() for phase in PHASES]
+        deco = indent + " ".join([BaseRst.fmt_deco] * len(headers))
+        self.append(deco)
+        self.append(indent + " ".join(["%18s" % h for h in headers]))
+        self.append(deco)
+        for cvus, phases in rows:
+            self.append(indent + ' '.join(
+                [BaseRst.fmt_int % cvus] +
+                [BaseRst.fmt_float % phases[phase] for phase in PHASES]))
+        self.append(deco)
+        self.append('')
+
+    def renderCyclesStepBytes(self, step):
+        """Render the sizes of a step for all cycle."""
+        stats = self.stats
+        rows = []
+        for cycle in self.cycles:
+            stat = stats[cycle]['response_step'].get(step)
+            if stat is not None and stat.hasBytes():
+                rows.append(stat)
+        if not rows:
+            return
+        indent = ' ' * (ResponseRst.indent + 1)
+        self.append('')
+        self.append(indent + 'Sizes of the request in bytes:')
+        self.append('')
+        headers = ["CUs", "SENT", "RECEIVED", "DECODED", "MED", "P90",
+                   "P95", "P99", "304"]
+        deco = indent + " ".join([BaseRst.fmt_deco] * len(headers))
+        self.append(deco)
+        self.append(indent + " ".join(["%18s" % h for h in headers]))
+        self.append(deco)
+        for stat in rows:
+            sizes = stat.getSizes()
+            count = float(stat.bytes_count)
+            self.append(indent + ' '.join([
+                BaseRst.fmt_int % stat.cvus,
+                BaseRst.fmt_int % (stat.sent / count),
+                BaseRst.fmt_int % (stat.received / count),
+                BaseRst.fmt_int % (stat.decoded / count),
+                BaseRst.fmt_int % sizes.perc50,
+                BaseRst.fmt_int % sizes.perc90,
+                BaseRst.fmt_int % sizes.perc95,
+                BaseRst.fmt_int % sizes.perc99,
+                BaseRst.fmt_int % stat.not_modified]))
+        self.append(deco)
+        self.append('')
 
     def renderPageDetail(self, cycle_r):
         """Render a page detail."""
@@ -570,6 +810,9 @@ class RenderRst:
         self.append(LI + ' Request: a single GET/POST/redirect/XML-RPC request.')
         self.append(LI + ' Page: a request with redirects and resource'
                     ' links (image, css, js) for an HTML page.')
+        if self.config.get('profile'):
+            self.append(LI + ' TIME: Start of a window of the load profile'
+                        ' in seconds.')
         self.append(LI + ' STPS: Successful tests per second.')
         self.append(LI + ' SPPS: Successful pages per second.')
         self.append(LI + ' RPS: Requests per second, successful or not.')
@@ -586,6 +829,35 @@ class RenderRst:
                     ' of pages or requests are delivered.')
         self.append(LI + ' P95: 95th percentile, response time where 95 percent'
                     ' of pages or requests are delivered.')
+        self.append(LI + ' P99, P99.9, P99.99: tail percentiles, response time'
+                    ' where 99, 99.9 and 99.99 percent of pages or requests'
+                    ' are delivered.')
+        if BaseRst.with_corrected:
+            self.append(LI + ' cP95, cP99, cP99.9: percentiles corrected for'
+                        ' the coordinated omission, response time measured'
+                        ' from the scheduled start of the test instead of its'
+                        ' actual start.')
+        if [cycle for cycle in self.cycles
+            if 'injector' in self.stats[cycle]]:
+            self.append(LI + ' SLEEP LAG, START LAG: Average delay of the'
+                        ' sleeps and of the scheduled test starts of the'
+                        ' virtual users after their target, a busy injector'
+                        ' wakes them up late.')
+        if [cycle for cycle in self.cycles
+            if 'response' in self.stats[cycle] and
+            self.stats[cycle]['response'].hasBytes()]:
+            self.append(LI + ' SENT, RECEIVED: Bytes of the requests and of'
+                        ' the responses on the wire, headers included and'
+                        ' before the content decoding, DECODED: bytes of the'
+                        ' decoded bodies. 1 MB is 1048576 bytes. 304:'
+                        ' Number of Not Modified responses to the'
+                        ' conditional requests of the browser cache.')
+        if self.with_phases:
+            self.append(LI + ' DNS, CONNECT, TLS, TTFB, TRANSFER: Phases of'
+                        ' a request, the lookup of the host, the TCP connect'
+                        ' and the TLS handshake of a new connection, the'
+                        ' time to the first byte of the response and the'
+                        ' time to read its body.')
         self.append(LI + Apdex.description_para)
         self.append(LI + Apdex.rating_para)
         self.append('')
@@ -614,9 +886,13 @@ class RenderRst:
                               'The number of Successful **Pages** Per Second '
                               '(SPPS) over Concurrent Users (CUs).\n'
                               'Note: an XML-RPC call counts as a page.')
+        if self.config.get('profile'):
+            self.renderLoadProfile()
         self.renderCyclesStat('response', 'Request stats',
                               'The number of **Requests** Per Second (RPS) '
                               '(successful or not) over Concurrent Users (CUs).')
+        self.renderNetwork()
+        self.renderInjector()
         self.renderSlowestRequests(self.slowest_items)
         self.renderMonitors()
         self.renderPageDetail(cycle_r)
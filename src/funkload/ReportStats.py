@@ -22,6 +22,7 @@ $Id: ReportStats.py 24737 2005-08-31 09:00:16Z bdelbosc $
 from __future__ import absolute_import
 
 from .apdex import Apdex
+from .utils import PHASES
 
 
 class MonitorStat:
@@ -31,6 +32,62 @@ class MonitorStat:
             setattr(self, key, value)
 
 
+class InjectorStat:
+    """Collect the injector samples of a cycle."""
+    def __init__(self, cycle, cvus):
+        self.cycle = cycle
+        self.cvus = int(cvus)
+        self.count = 0
+        self.cpu_total = self.cpu_max = 0.0
+        self.sleeps = self.starts = 0
+        self.sleep_lag_total = self.sleep_lag_max = 0.0
+        self.start_lag_total = self.start_lag_max = 0.0
+        self.finalized = False
+
+    def add(self, cpu, sleeps, sleep_lag, sleep_lag_max, starts, start_lag,
+            start_lag_max):
+        """Add a sample, the lags are averages of the sample."""
+        self.count += 1
+        self.cpu_total += float(cpu)
+        self.cpu_max = max(self.cpu_max, float(cpu))
+        self.sleeps += int(sleeps)
+        self.sleep_lag_total += int(sleeps) * float(sleep_lag)
+        self.sleep_lag_max = max(self.sleep_lag_max, float(sleep_lag_max))
+        self.starts += int(starts)
+        self.start_lag_total += int(starts) * float(start_lag)
+        self.start_lag_max = max(self.start_lag_max, float(start_lag_max))
+        self.finalized = False
+
+    def merge(self, other):
+        """Add the samples of another injector."""
+        self.count += other.count
+        self.cpu_total += other.cpu_total
+        self.cpu_max = max(self.cpu_max, other.cpu_max)
+        self.sleeps += other.sleeps
+        self.sleep_lag_total += other.sleep_lag_total
+        self.sleep_lag_max = max(self.sleep_lag_max, other.sleep_lag_max)
+        self.starts += other.starts
+        self.start_lag_total += other.start_lag_total
+        self.start_lag_max = max(self.start_lag_max, other.start_lag_max)
+        self.finalized = False
+
+    def finalize(self):
+        """Compute the averages."""
+        if self.finalized:
+            return
+        self.cpu = self.count and self.cpu_total / self.count or 0.0
+        self.sleep_lag = self.sleeps and (
+            self.sleep_lag_total / self.sleeps) or 0.0
+        self.start_lag = self.starts and (
+            self.start_lag_total / self.starts) or 0.0
+        self.finalized = True
+
+    def lag(self):
+        """Return the worst average lag of the sleeps and test starts."""
+        self.finalize()
+        return max(self.sleep_lag, self.start_lag)
+
+
 class ErrorStat:
     """Collect Error or Failure stats."""
     def __init__(self, cycle, step, number, code, header, body, traceback):
@@ -45,6 +102,8 @@ class ErrorStat:
 
 class Percentiles:
     """ Calculate Percentiles with the given stepsize. """
+    # tail percentiles computed in addition to the stepsize ones
+    tails = ((99, "perc99"), (99.9, "perc999"), (99.99, "perc9999"))
 
     def __init__(self, stepsize=10, name="UNKNOWN", results=None):
         self.stepsize = stepsize
@@ -53,31 +112,42 @@ class Percentiles:
             self.results = []
         else:
             self.results = results
+        self._computed = None
 
     def addResult(self, newresult):
         """Add a new result."""
         self.results.append(newresult)
 
+    def merge(self, other):
+        """Add the results of other percentiles."""
+        self.results.extend(other.results)
+
+    def _percentiles(self):
+        """Return the list of (percentile, attribute name)."""
+        return ([(perc, "perc%02d" % perc)
+                 for perc in range(0, 100, self.stepsize)] +
+                list(self.tails))
+
     def calcPercentiles(self):
-        """Compute percentiles."""
+        """Compute percentiles, only when new results were added."""
         results = self.results
-        results.sort()
         len_results = len(results)
-        old_value = -1
-        for perc in range(0, 100, self.stepsize):
+        if self._computed == len_results:
+            return
+        results.sort()
+        for perc, name in self._percentiles():
             index = int(perc / 100.0 * len_results)
             try:
                 value = results[index]
             except IndexError:
                 value = -1.0
-            setattr(self, "perc%02d" % perc, float(value))
-            old_value = value
+            setattr(self, name, float(value))
+        self._computed = len_results
 
     def __str__(self):
         self.calcPercentiles()
         fmt_string = ["Percentiles: %s" % self.name]
-        for perc in range(0, 100, self.stepsize):
-            name = "perc%02d" % perc
+        for perc, name in self._percentiles():
             fmt_string.append("%s=%s" % (name, getattr(self, name)))
         return ", ".join(fmt_string)
 
@@ -86,6 +156,142 @@ class Percentiles:
             self.stepsize, self.name, self.results)
 
 
+class Histogram:
+    """Sparse log-linear histogram of durations in seconds.
+
+    Durations are rounded to the microsecond then counted in buckets whose
+    width is 1/128 of their lower bound, a value returned by getValue is
+    the middle of a bucket: the relative error is below 1/256 (0.4%)
+    plus half a microsecond. Memory depends on the range of the values,
+    not on their number, and histograms can be merged."""
+    sub_bits = 7
+    unit = 1000000.0                    # microseconds
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def bucket(self, value):
+        """Return the bucket of a duration."""
+        value = int(round(value * self.unit))
+        sub_count = 1 << self.sub_bits
+        if value < sub_count:
+            return max(value, 0)
+        shift = value.bit_length() - self.sub_bits - 1
+        return ((shift + 1) << self.sub_bits) + (value >> shift) - sub_count
+
+    def bucketValue(self, bucket):
+        """Return the duration in the middle of a bucket."""
+        sub_count = 1 << self.sub_bits
+        if bucket < sub_count:
+            return bucket / self.unit
+        shift = (bucket >> self.sub_bits) - 1
+        mantissa = (bucket & (sub_count - 1)) + sub_count
+        return ((mantissa << shift) + (1 << shift) / 2.0) / self.unit
+
+    def add(self, value, count=1):
+        """Record a duration."""
+        bucket = self.bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add the counts of another histogram."""
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        for value in (other.min, other.max):
+            if value is not None:
+                if self.min is None or value < self.min:
+                    self.min = value
+                if self.max is None or value > self.max:
+                    self.max = value
+
+    def getValues(self, ranks):
+        """Return the values at the sorted ranks (0 based)."""
+        values = []
+        buckets = sorted(self.counts.keys())
+        index = seen = 0
+        for rank in ranks:
+            while index < len(buckets) and (
+                seen + self.counts[buckets[index]] <= rank):
+                seen += self.counts[buckets[index]]
+                index += 1
+            if index >= len(buckets):
+                values.append(None)
+                continue
+            value = self.bucketValue(buckets[index])
+            values.append(min(max(value, self.min), self.max))
+        return values
+
+
+class HistogramPercentiles(Percentiles):
+    """Percentiles computed from a Histogram, see Histogram for the
+    error bound."""
+
+    def __init__(self, stepsize=10, name="UNKNOWN", results=None):
+        self.stepsize = stepsize
+        self.name = name
+        self.histogram = Histogram()
+        self._computed = None
+        for result in results or []:
+            self.addResult(result)
+
+    def addResult(self, newresult):
+        """Add a new result."""
+        self.histogram.add(newresult)
+
+    def merge(self, other):
+        """Add the results of other percentiles."""
+        self.histogram.merge(other.histogram)
+
+    def calcPercentiles(self):
+        """Compute percentiles, only when new results were added."""
+        len_results = self.histogram.count
+        if self._computed == len_results:
+            return
+        percs = self._percentiles()
+        values = self.histogram.getValues(
+            [int(perc / 100.0 * len_results) for perc, name in percs])
+        for (perc, name), value in zip(percs, values):
+            if value is None:
+                value = -1.0
+            setattr(self, name, float(value))
+        self._computed = len_results
+
+    def __repr__(self):
+        return "HistogramPercentiles(stepsize=%r, name=%r, count=%r)" % (
+            self.stepsize, self.name, self.histogram.count)
+
+
+# streaming mode keep a constant memory using histograms
+_streaming_mode = False
+
+
+def set_streaming_mode(value):
+    """Use constant memory stats."""
+    global _streaming_mode
+    _streaming_mode = value
+
+
+def is_streaming_mode():
+    """Is the streaming mode enabled ?"""
+    return _streaming_mode
+
+
+def new_percentiles(stepsize=10, name="UNKNOWN"):
+    """Return the percentiles of the current mode."""
+    if _streaming_mode:
+        return HistogramPercentiles(stepsize=stepsize, name=name)
+    return Percentiles(stepsize=stepsize, name=name)
+
+
 class ApdexStat:
     def __init__(self):
         self.apdex_satisfied = 0
@@ -102,12 +308,146 @@ class ApdexStat:
             self.apdex_frustrated += 1
         self.count += 1
 
+    def merge(self, other):
+        """Add the counts of another apdex stat."""
+        self.apdex_satisfied += other.apdex_satisfied
+        self.apdex_tolerating += other.apdex_tolerating
+        self.apdex_frustrated += other.apdex_frustrated
+        self.count += other.count
+
     def getScore(self):
         return Apdex.score(self.apdex_satisfied, self.apdex_tolerating,
                            self.apdex_frustrated)
 
 
-class AllResponseStat:
+class CorrectedStat:
+    """Percentiles of durations corrected for the coordinated omission.
+
+    A corrected duration is measured from the intended start of the
+    response, as scheduled by the arrival rate or the pacing, instead of
+    its actual start."""
+    corrected = None
+
+    def addCorrected(self, duration, date, intended):
+        """Add the corrected duration of a result."""
+        if self.corrected is None:
+            self.corrected = new_percentiles(stepsize=5,
+                                             name=self.percentiles.name)
+        self.corrected.addResult(float(duration) +
+                                 (float(date) - float(intended)))
+
+    def mergeCorrected(self, other):
+        """Add the corrected durations of another stat."""
+        if other.corrected is None:
+            return
+        if self.corrected is None:
+            self.corrected = other.corrected
+        else:
+            self.corrected.merge(other.corrected)
+
+
+class PhaseStat:
+    """Average duration of the phases of the responses.
+
+    Responses recorded without phases are not counted."""
+    phases = None
+    phases_count = 0
+
+    def addPhases(self, attrs):
+        """Add the phases of a response attributes."""
+        if attrs.get('ttfb') is None:
+            return
+        if self.phases is None:
+            self.phases = dict.fromkeys(PHASES, 0.0)
+        for phase in PHASES:
+            self.phases[phase] += float(attrs.get(phase, 0))
+        self.phases_count += 1
+
+    def mergePhases(self, other):
+        """Add the phases of another stat."""
+        if other.phases is None:
+            return
+        if self.phases is None:
+            self.phases = dict.fromkeys(PHASES, 0.0)
+        for phase in PHASES:
+            self.phases[phase] += other.phases[phase]
+        self.phases_count += other.phases_count
+
+    def getPhases(self):
+        """Return the average duration by phase or None."""
+        if not self.phases_count:
+            return None
+        return dict((phase, total / self.phases_count)
+                    for phase, total in self.phases.items())
+
+
+class ByteStat:
+    """Bytes sent and received by the responses.
+
+    received is the size on the wire: the status line, the headers and the
+    body before its content decoding, decoded is the size of the decoded
+    body, not_modified the number of 304 responses to the conditional
+    requests of the browser cache. Responses recorded without sizes are
+    not counted."""
+    bytes_count = 0
+    sent = received = decoded = 0
+    not_modified = 0
+    bytes_per_second = None             # second -> [sent, received]
+    sizes = None                        # percentiles of received
+
+    def _initBytes(self):
+        """Create the containers on the first sizes."""
+        self.bytes_per_second = {}
+        self.sizes = new_percentiles(stepsize=5, name='bytes')
+
+    def addBytes(self, attrs):
+        """Add the sizes of a response attributes."""
+        if attrs.get('received') is None:
+            return
+        if self.sizes is None:
+            self._initBytes()
+        sent = int(attrs.get('sent', 0))
+        received = int(attrs['received'])
+        self.bytes_count += 1
+        self.sent += sent
+        self.received += received
+        self.decoded += int(attrs.get('decoded', 0))
+        if attrs.get('code') == '304':
+            self.not_modified += 1
+        self.sizes.addResult(received)
+        second = self.bytes_per_second.setdefault(int(float(attrs['time'])),
+                                                  [0, 0])
+        second[0] += sent
+        second[1] += received
+
+    def mergeBytes(self, other):
+        """Add the sizes of another stat."""
+        if other.sizes is None:
+            return
+        if self.sizes is None:
+            self._initBytes()
+        self.bytes_count += other.bytes_count
+        self.sent += other.sent
+        self.received += other.received
+        self.decoded += other.decoded
+        self.not_modified += other.not_modified
+        self.sizes.merge(other.sizes)
+        for date_s, (sent, received) in other.bytes_per_second.items():
+            second = self.bytes_per_second.setdefault(date_s, [0, 0])
+            second[0] += sent
+            second[1] += received
+
+    def hasBytes(self):
+        """Return True if sizes were recorded."""
+        return bool(self.bytes_count)
+
+    def getSizes(self):
+        """Return the computed percentiles of the received sizes."""
+        self.sizes.calcPercentiles()
+        return self.sizes
+
+
+class AllResponseStat(CorrectedStat, ByteStat):
     """Collect stat for all response in a cycle."""
     def __init__(self, cycle, cycle_duration, cvus):
         self.cycle = cycle
@@ -126,11 +466,11 @@ class AllResponseStat:
         self.rps_min = 0
         self.rps_max = 0
         self.finalized = False
-        self.percentiles = Percentiles(stepsize=5, name=cycle)
+        self.percentiles = new_percentiles(stepsize=5, name=cycle)
         self.apdex = ApdexStat()
         self.apdex_score = None
 
-    def add(self, date, result, duration):
+    def add(self, date, result, duration, intended=None):
         """Add a new response to stat."""
         date_s = int(float(date))
         self.per_second[date_s] = self.per_second.setdefault(
@@ -147,6 +487,24 @@ class AllResponseStat:
         self.finalized = False
         self.percentiles.addResult(duration_f)
         self.apdex.add(duration_f)
+        if intended is not None:
+            self.addCorrected(duration_f, date, intended)
+
+    def merge(self, other):
+        """Add the responses of another stat of the same cycle."""
+        for date_s, count in other.per_second.items():
+            self.per_second[date_s] = self.per_second.get(date_s, 0) + count
+        self.count += other.count
+        self.success += other.success
+        self.error += other.error
+        self.max = max(self.max, other.max)
+        self.min = min(self.min, other.min)
+        self.total += other.total
+        self.percentiles.merge(other.percentiles)
+        self.apdex.merge(other.apdex)
+        self.mergeCorrected(other)
+        self.mergeBytes(other)
+        self.finalized = False
 
     def finalize(self):
         """Compute avg times."""
@@ -172,6 +530,8 @@ class AllResponseStat:
         self.rps_max = rps_max
         self.rps_min = rps_min
         self.percentiles.calcPercentiles()
+        if self.corrected is not None:
+            self.corrected.calcPercentiles()
         self.apdex_score = self.apdex.getScore()
         self.finalized = True
 
@@ -184,13 +544,25 @@ class SinglePageStat:
         self.date_s = None
         self.duration = 0.0
         self.result = 'Successful'
+        self.batch = False
+        self.date = self.intended = None
+
+    def addResponse(self, date, result, duration, batch_duration=None,
+                    intended=None):
+        """Add a response to a page.
 
-    def addResponse(self, date, result, duration):
-        """Add a response to a page."""
+        Resources fetched in parallel count once for the wall time of
+        their batch."""
         self.count += 1
         if self.date_s is None:
             self.date_s = int(float(date))
-        self.duration += float(duration)
+            self.date = date
+            self.intended = intended
+        if batch_duration is None:
+            self.duration += float(duration)
+        elif not self.batch:
+            self.batch = True
+            self.duration += float(batch_duration)
         if result != 'Successful':
             self.result = result
 
@@ -206,7 +578,8 @@ class PageStat(AllResponseStat):
         AllResponseStat.__init__(self, cycle, cycle_duration, cvus)
         self.threads = {}
 
-    def add(self, thread, step,  date, result, duration, rtype):
+    def add(self, thread, step,  date, result, duration, rtype,
+            batch_duration=None, intended=None):
         """Add a new response to stat."""
         thread = self.threads.setdefault(thread, {'count': 0,
                                                   'pages': {}})
@@ -215,6 +588,9 @@ class PageStat(AllResponseStat):
         else:
             new_page = False
         if new_page:
+            if _streaming_mode:
+                # the previous pages of the thread are complete
+                self._closePages(thread)
             thread['count'] += 1
             self.count += 1
         if not thread['count']:
@@ -222,29 +598,51 @@ class PageStat(AllResponseStat):
             return
         stat = thread['pages'].setdefault(thread['count'],
                                           SinglePageStat(step))
-        stat.addResponse(date, result, duration)
+        stat.addResponse(date, result, duration, batch_duration, intended)
         self.apdex.add(float(duration))
         self.finalized = False
 
+    def _addPage(self, page):
+        """Add a complete page to the stat."""
+        if str(page.result) == 'Successful':
+            if page.date_s:
+                count = self.per_second.setdefault(page.date_s, 0) + 1
+                self.per_second[page.date_s] = count
+            self.success += 1
+            self.total += page.duration
+            self.percentiles.addResult(page.duration)
+            if page.intended is not None:
+                self.addCorrected(page.duration, page.date, page.intended)
+        else:
+            self.error += 1
+            return
+        duration = page.duration
+        self.max = max(self.max, duration)
+        self.min = min(self.min, duration)
+
+    def _closePages(self, thread):
+        """Add the pages of a thread to the stat and forget them."""
+        for page in thread['pages'].values():
+            self._addPage(page)
+        thread['pages'] = {}
+
+    def closePages(self):
+        """Add the pages of all threads to the stat and forget them."""
+        for thread in self.threads.values():
+            self._closePages(thread)
+
+    def merge(self, other):
+        """Add the pages of another stat of the same cycle, the threads
+        are not merged: pages of both stats are closed."""
+        self.closePages()
+        other.closePages()
+        AllResponseStat.merge(self, other)
+
     def finalize(self):
         """Compute avg times."""
         if self.finalized:
             return
-        for thread in self.threads.keys():
-            for page in self.threads[thread]['pages'].values():
-                if str(page.result) == 'Successful':
-                    if page.date_s:
-                        count = self.per_second.setdefault(page.date_s, 0) + 1
-                        self.per_second[page.date_s] = count
-                    self.success += 1
-                    self.total += page.duration
-                    self.percentiles.addResult(page.duration)
-                else:
-                    self.error += 1
-                    continue
-                duration = page.duration
-                self.max = max(self.max, duration)
-                self.min = min(self.min, duration)
+        self.closePages()
         AllResponseStat.finalize(self)
         if self.cycle_duration:
             # override rps to srps
@@ -253,7 +651,7 @@ class PageStat(AllResponseStat):
         self.finalized = True
 
 
-class ResponseStat:
+class ResponseStat(CorrectedStat, PhaseStat, ByteStat):
     """Collect stat a specific response in a cycle."""
     def __init__(self, step, number, cvus):
         self.step = step
@@ -271,11 +669,12 @@ class ResponseStat:
         self.description = ''
         self.type = '?'
         self.finalized = False
-        self.percentiles = Percentiles(stepsize=5, name=step)
+        self.percentiles = new_percentiles(stepsize=5, name=step)
         self.apdex = ApdexStat()
         self.apdex_score = None
 
-    def add(self, rtype, result, url, duration, description=None):
+    def add(self, rtype, result, url, duration, description=None,
+            date=None, intended=None):
         """Add a new response to stat."""
         self.count += 1
         if result == 'Successful':
@@ -292,6 +691,28 @@ class ResponseStat:
             self.description = description
         self.finalized = False
         self.apdex.add(float(duration))
+        if intended is not None:
+            self.addCorrected(duration, date, intended)
+
+    def merge(self, other):
+        """Add the responses of another stat of the same step."""
+        self.count += other.count
+        self.success += other.success
+        self.error += other.error
+        self.max = max(self.max, other.max)
+        self.min = min(self.min, other.min)
+        self.total += other.total
+        self.percentiles.merge(other.percentiles)
+        self.apdex.merge(other.apdex)
+        self.mergeCorrected(other)
+        self.mergePhases(other)
+        self.mergeBytes(other)
+        if other.count:
+            self.url = other.url
+            self.type = other.type
+            if other.description:
+                self.description = other.description
+        self.finalized = False
 
     def finalize(self):
         """Compute avg times."""
@@ -303,11 +724,13 @@ class ResponseStat:
         if self.error:
             self.error_percent = 100.0 * self.error / float(self.count)
         self.percentiles.calcPercentiles()
+        if self.corrected is not None:
+            self.corrected.calcPercentiles()
         self.apdex_score = self.apdex.getScore()
         self.finalized = True
 
 
-class TestStat:
+class TestStat(CorrectedStat):
     """Collect test stat for a cycle.
 
     Stat on successful test case.
@@ -329,10 +752,10 @@ class TestStat:
         self.xmlrpc = 0
         self.tps = 0
         self.finalized = False
-        self.percentiles = Percentiles(stepsize=5, name=cycle)
+        self.percentiles = new_percentiles(stepsize=5, name=cycle)
 
     def add(self, result, pages, xmlrpc, redirects, images, links,
-            duration, traceback=None):
+            duration, traceback=None, date=None, intended=None):
         """Add a new response to stat."""
         self.finalized = False
         self.count += 1
@@ -352,6 +775,23 @@ class TestStat:
         self.images = max(self.images, int(images))
         self.links = max(self.links, int(links))
         self.percentiles.addResult(float(duration))
+        if intended is not None:
+            self.addCorrected(duration, date, intended)
+
+    def merge(self, other):
+        """Add the tests of another stat of the same cycle."""
+        self.count += other.count
+        self.success += other.success
+        self.error += other.error
+        self.traceback.extend(other.traceback)
+        self.max = max(self.max, other.max)
+        self.min = min(self.min, other.min)
+        self.total += other.total
+        for name in ('pages', 'xmlrpc', 'redirects', 'images', 'links'):
+            setattr(self, name, max(getattr(self, name), getattr(other, name)))
+        self.percentiles.merge(other.percentiles)
+        self.mergeCorrected(other)
+        self.finalized = False
 
     def finalize(self):
         """Compute avg times."""
@@ -365,4 +805,6 @@ class TestStat:
         if self.cycle_duration:
             self.tps = self.success / float(self.cycle_duration)
         self.percentiles.calcPercentiles()
+        if self.corrected is not None:
+            self.corrected.calcPercentiles()
         self.finalized = True
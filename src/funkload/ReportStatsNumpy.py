@@ -0,0 +1,271 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+"""Vectorized response statistics, requires numpy.
+
+The parser stores the responses of a cycle into typed columns, the
+AllResponseStat, PageStat and ResponseStat of the cycle are then computed
+with array operations. Sums are done in the order of the pure python
+stats so the report numbers are identical.
+"""
+from __future__ import absolute_import
+from array import array
+
+import numpy
+
+from .apdex import Apdex
+from .ReportStats import Percentiles, AllResponseStat, PageStat, ResponseStat
+from .ReportStats import ByteStat
+
+# flags column
+SUCCESS = 1
+NEW_PAGE = 2
+PAGE_TYPES = ('post', 'get', 'xmlrpc', 'put', 'delete', 'head')
+
+
+class NumpyPercentiles(Percentiles):
+    """Percentiles of a numpy array."""
+
+    def merge(self, other):
+        """Add the results of other percentiles."""
+        self.results = numpy.concatenate((self.results, other.results))
+
+    def calcPercentiles(self):
+        """Compute percentiles, only when new results were added."""
+        len_results = len(self.results)
+        if self._computed == len_results:
+            return
+        results = numpy.sort(self.results)
+        for perc, name in self._percentiles():
+            index = int(perc / 100.0 * len_results)
+            if index < len_results:
+                value = results[index]
+            else:
+                value = -1.0
+            setattr(self, name, float(value))
+        self._computed = len_results
+
+
+def _to_numpy(column, dtype):
+    """Return a numpy array sharing the memory of an array.array."""
+    if not len(column):
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.frombuffer(column, dtype=dtype)
+
+
+def _set_durations(stat, durations):
+    """Set min, max, total and percentiles of a stat.
+
+    durations are in the order of the pure python additions."""
+    if len(durations):
+        stat.max = max(stat.max, float(durations.max()))
+        stat.min = min(stat.min, float(durations.min()))
+        # cumsum adds sequentially, sum would use a pairwise summation
+        stat.total = float(numpy.cumsum(durations)[-1])
+    stat.percentiles = NumpyPercentiles(stepsize=5, name=stat.percentiles.name,
+                                        results=durations)
+
+
+def _set_corrected(stat, durations, lags):
+    """Set the corrected percentiles of the scheduled durations."""
+    scheduled = ~numpy.isnan(lags)
+    if scheduled.any():
+        stat.corrected = NumpyPercentiles(
+            stepsize=5, name=stat.percentiles.name,
+            results=durations[scheduled] + lags[scheduled])
+
+
+def _set_apdex(stat, durations):
+    """Count the apdex classes of the durations."""
+    satisfied = int((durations < Apdex.T).sum())
+    tolerating = int((durations < Apdex.T * 4).sum()) - satisfied
+    stat.apdex.apdex_satisfied = satisfied
+    stat.apdex.apdex_tolerating = tolerating
+    stat.apdex.apdex_frustrated = len(durations) - satisfied - tolerating
+    stat.apdex.count = len(durations)
+
+
+def _per_second(dates):
+    """Return the number of items per second."""
+    seconds, counts = numpy.unique(dates.astype(numpy.int64),
+                                   return_counts=True)
+    return dict(zip(seconds.tolist(), counts.tolist()))
+
+
+class ResponseColumns:
+    """Store the responses of a cycle into columns."""
+    def __init__(self, cycle, cycle_duration, cvus):
+        self.cycle = cycle
+        self.cycle_duration = cycle_duration
+        self.cvus = cvus
+        self.time = array('d')
+        self.duration = array('d')
+        self.batch_duration = array('d')
+        self.intended = array('d')
+        self.thread = array('i')
+        self.step = array('i')
+        self.flags = array('b')
+        self.threads = {}               # thread -> index
+        self.steps = {}                 # step.number -> index
+        self.step_stats = []            # ResponseStat by index
+        self.bytes = ByteStat()         # sizes of all the responses
+
+    def add(self, attrs):
+        """Add a response."""
+        self.time.append(float(attrs['time']))
+        self.duration.append(float(attrs['duration']))
+        batch_duration = attrs.get('batch_duration')
+        if batch_duration is None:
+            self.batch_duration.append(numpy.nan)
+        else:
+            self.batch_duration.append(float(batch_duration))
+        intended = attrs.get('intended')
+        if intended is None:
+            self.intended.append(numpy.nan)
+        else:
+            self.intended.append(float(intended))
+        # same insertion order than PageStat.threads
+        thread = self.threads.setdefault(attrs['thread'], len(self.threads))
+        self.thread.append(thread)
+        key = '%s.%s' % (attrs['step'], attrs['number'])
+        step = self.steps.get(key)
+        if step is None:
+            step = self.steps[key] = len(self.step_stats)
+            self.step_stats.append(ResponseStat(attrs['step'],
+                                                attrs['number'],
+                                                attrs['cvus']))
+        self.step.append(step)
+        stat = self.step_stats[step]
+        stat.url = attrs['url']
+        stat.type = attrs['type']
+        if attrs.get('description') is not None:
+            stat.description = attrs['description']
+        stat.addPhases(attrs)
+        stat.addBytes(attrs)
+        self.bytes.addBytes(attrs)
+        flags = 0
+        if attrs['result'] == 'Successful':
+            flags |= SUCCESS
+        if str(attrs['type']) in PAGE_TYPES:
+            flags |= NEW_PAGE
+        self.flags.append(flags)
+
+    def getStats(self):
+        """Return the finalized stats of the cycle."""
+        time = _to_numpy(self.time, numpy.float64)
+        duration = _to_numpy(self.duration, numpy.float64)
+        # delay of the start behind its schedule, nan when not scheduled
+        lag = time - _to_numpy(self.intended, numpy.float64)
+        flags = _to_numpy(self.flags, numpy.int8)
+        success = (flags & SUCCESS) > 0
+        # responses of each step in the order of the file
+        step = _to_numpy(self.step, numpy.int32)
+        order = numpy.argsort(step, kind='mergesort')
+        bounds = numpy.searchsorted(step[order],
+                                    numpy.arange(len(self.step_stats) + 1))
+        response_step = {}
+        for key, index in self.steps.items():
+            selected = order[bounds[index]:bounds[index + 1]]
+            response_step[key] = self.getResponseStat(
+                index, duration[selected], success[selected], lag[selected])
+        return {'response': self.getAllResponseStat(time, duration, success,
+                                                    lag),
+                'page': self.getPageStat(time, duration, flags, success,
+                                         lag),
+                'response_step': response_step}
+
+    def getAllResponseStat(self, time, duration, success, lag):
+        """Return the stat of all the responses."""
+        stat = AllResponseStat(self.cycle, self.cycle_duration, self.cvus)
+        stat.count = len(duration)
+        stat.success = int(success.sum())
+        stat.error = stat.count - stat.success
+        stat.per_second = _per_second(time)
+        stat.mergeBytes(self.bytes)
+        _set_durations(stat, duration)
+        _set_corrected(stat, duration, lag)
+        _set_apdex(stat, duration)
+        return stat
+
+    def getResponseStat(self, index, duration, success, lag):
+        """Return the stat of a step."""
+        stat = self.step_stats[index]
+        stat.count = len(duration)
+        stat.success = int(success.sum())
+        stat.error = stat.count - stat.success
+        _set_durations(stat, duration)
+        _set_corrected(stat, duration, lag)
+        _set_apdex(stat, duration)
+        return stat
+
+    def getPageStat(self, time, duration, flags, success, lag):
+        """Return the stat of pages, group responses like PageStat.add."""
+        stat = PageStat(self.cycle, self.cycle_duration, self.cvus)
+        # responses of each thread in the order of the file
+        thread = _to_numpy(self.thread, numpy.int32)
+        order = numpy.argsort(thread, kind='mergesort')
+        thread = thread[order]
+        new_page = (flags[order] & NEW_PAGE) > 0
+        stat.count = int(new_page.sum())
+        # page number of each response inside its thread
+        page_count = numpy.cumsum(new_page)
+        starts = numpy.flatnonzero(numpy.concatenate(
+            ([True], thread[1:] != thread[:-1])))
+        base = numpy.concatenate(([0], page_count[starts[1:] - 1]))
+        lengths = numpy.diff(numpy.concatenate((starts, [len(thread)])))
+        page_number = page_count - numpy.repeat(base, lengths)
+        # responses before the first page of a thread are ignored
+        keep = page_number > 0
+        kept = order[keep]
+        thread = thread[keep]
+        new_page = new_page[keep]
+        page_number = page_number[keep]
+        durations = duration[kept]
+        _set_apdex(stat, durations)
+        # group the responses by page
+        page_starts = numpy.flatnonzero(new_page)
+        page = numpy.cumsum(new_page) - 1
+        pages = len(page_starts)
+        page_success = numpy.bincount(page[~success[kept]],
+                                      minlength=pages) == 0
+        # resources fetched in parallel count once for their batch
+        batch = _to_numpy(self.batch_duration, numpy.float64)[kept]
+        in_batch = ~numpy.isnan(batch)
+        batch_count = numpy.cumsum(in_batch)
+        batch_base = batch_count[page_starts] - in_batch[page_starts]
+        first_in_batch = in_batch & (batch_count - batch_base[page] == 1)
+        contribution = numpy.where(in_batch,
+                                   numpy.where(first_in_batch, batch, 0.0),
+                                   durations)
+        page_duration = numpy.zeros(pages)
+        # add.at is unbuffered, the responses of a page are added in order
+        numpy.add.at(page_duration, page, contribution)
+        # pages in the order of PageStat.finalize: threads dict then number
+        rank = numpy.zeros(len(self.threads), dtype=numpy.int64)
+        for position, key in enumerate(self.threads):
+            rank[self.threads[key]] = position
+        page_order = numpy.lexsort((page_number[page_starts],
+                                    rank[thread[page_starts]]))
+        page_duration = page_duration[page_order]
+        page_success = page_success[page_order]
+        page_date = time[kept][page_starts][page_order]
+        # a page is late by the lag of its first response
+        page_lag = lag[kept][page_starts][page_order]
+        stat.success = int(page_success.sum())
+        stat.error = pages - stat.success
+        stat.per_second = _per_second(page_date[page_success])
+        _set_durations(stat, page_duration[page_success])
+        _set_corrected(stat, page_duration[page_success],
+                       page_lag[page_success])
+        return stat
@@ -0,0 +1,153 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+"""Buffered result sink.
+
+In bench mode each test case appends its result records to its own
+buffer, a single writer thread drains all the buffers and writes the
+records in batches. A test case waits when its buffer is full, these
+waits are counted as backpressure.
+"""
+from __future__ import absolute_import
+import os
+import threading
+import time
+from collections import deque
+
+
+class ResultBuffer(deque):
+    """Result records of a test case."""
+    closed = False
+
+
+class ResultSink:
+    """Drain result buffers using a writer thread."""
+    def __init__(self, write, size, interval=0.1):
+        self.write = write
+        self.size = size
+        self.interval = interval
+        self.buffers = []
+        self.backpressure = 0
+        self.written = 0
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.drain_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self.run,
+                                       name='FunkLoadResultSink')
+        self.thread.setDaemon(1)
+        self.thread.start()
+
+    def buffer(self):
+        """Return a new buffer."""
+        buf = ResultBuffer()
+        self.lock.acquire()
+        try:
+            self.buffers.append(buf)
+        finally:
+            self.lock.release()
+        return buf
+
+    def append(self, buf, record):
+        """Add a record to a buffer, wait if the buffer is full."""
+        if len(buf) >= self.size:
+            self.lock.acquire()
+            self.backpressure += 1
+            self.lock.release()
+            self.wake.set()
+            while len(buf) >= self.size and self.running:
+                time.sleep(0.001)
+        buf.append(record)
+
+    def release(self, buf):
+        """The buffer will not receive new records."""
+        buf.closed = True
+
+    def run(self):
+        """Writer thread loop."""
+        while self.running:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.drain()
+
+    def drain(self):
+        """Write all the buffered records."""
+        self.drain_lock.acquire()
+        try:
+            for buf in self.buffers[:]:
+                records = []
+                while buf:
+                    records.append(buf.popleft())
+                if records:
+                    self.write(records)
+                    self.written += len(records)
+                if buf.closed and not buf:
+                    # deques are equal when their content is, remove
+                    # the buffer itself and not another empty one
+                    self.lock.acquire()
+                    self.buffers = [other for other in self.buffers
+                                    if other is not buf]
+                    self.lock.release()
+        finally:
+            self.drain_lock.release()
+
+    def close(self):
+        """Write the pending records and stop the writer thread."""
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+        self.drain()
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_result_sink(write, size):
+    """Return the result sink of the process."""
+    global _sink
+    _sink_lock.acquire()
+    try:
+        if _sink is None or _sink.pid != os.getpid():
+            # a forked worker process does not inherit the writer thread
+            _sink = ResultSink(write, size)
+    finally:
+        _sink_lock.release()
+    return _sink
+
+
+def get_result_backpressure():
+    """Return the number of waits on full buffers."""
+    if _sink is None:
+        return 0
+    return _sink.backpressure
+
+
+def flush_result_sink():
+    """Write the pending records of the result sink."""
+    if _sink is not None and _sink.pid == os.getpid():
+        _sink.drain()
+
+
+def close_result_sink():
+    """Write the pending records and stop the result sink."""
+    global _sink
+    _sink_lock.acquire()
+    try:
+        sink, _sink = _sink, None
+    finally:
+        _sink_lock.release()
+    if sink is not None and sink.pid == os.getpid():
+        sink.close()
@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import unittest
+from tempfile import mkdtemp
+from shutil import rmtree
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.BinaryResult import get_binary_writer, close_binary_writer
+from funkload.BinaryResult import is_binary_result, read_records
+from funkload.BinaryResult import record_attrs, binary_to_xml
+from funkload.ReportBuilder import FunkLoadXmlParser
+
+
+class TestBinaryResult(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'funkload.xml')
+        writer = get_binary_writer(self.path)
+        writer.writeXml('<funkload version="1.0" time="now">')
+        writer.writeXml('<config key="duration" value="10" />')
+        for thread in range(2):
+            writer.writeRecord('R', [
+                0, 2, thread, 'Suite', 'test_foo', 1, 1, 'get',
+                'Successful', '/foo?a=1&b=2', 200, u'\xe9t\xe9', 1.25,
+                0.5])
+        writer.writeRecord('T', [
+            0, 2, 1, 'Suite', 'test_foo', 1.25, 'Failure', 1, 0.75, 0.5,
+            1, 1, 0, 0, 0, 0], {'traceback': 'oops'})
+        writer.writeXml('</funkload>')
+        close_binary_writer(self.path)
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def test_read_records(self):
+        self.assertTrue(is_binary_result(self.path))
+        records = list(read_records(self.path))
+        self.assertEqual(len(records), 6)
+        name, attrs = record_attrs(*records[2])
+        self.assertEqual(name, 'response')
+        self.assertEqual(attrs['cycle'], '000')
+        self.assertEqual(attrs['thread'], '000')
+        self.assertEqual(attrs['url'], '/foo?a=1&b=2')
+        self.assertEqual(attrs['description'], u'\xe9t\xe9')
+        self.assertEqual(attrs['time'], str(1.25))
+        name, attrs = record_attrs(*records[4])
+        self.assertEqual(name, 'testResult')
+        self.assertEqual(attrs['steps'], '1')
+        self.assertEqual(attrs['traceback'], 'oops')
+
+    def test_same_stats_as_xml(self):
+        xml_path = os.path.join(self.tmp_dir, 'converted.xml')
+        binary_to_xml(self.path, xml_path)
+        self.assertFalse(is_binary_result(xml_path))
+        binary = FunkLoadXmlParser()
+        binary.parse(self.path)
+        xml = FunkLoadXmlParser()
+        xml.parse(xml_path)
+        self.assertEqual(binary.config, xml.config)
+        self.assertEqual(binary.stats.keys(), xml.stats.keys())
+        for stats in (binary.stats, xml.stats):
+            stats['000']['page'].finalize()
+        self.assertEqual(binary.stats['000']['page'].count,
+                         xml.stats['000']['page'].count)
+        self.assertEqual(binary.stats['000']['test'].error,
+                         xml.stats['000']['test'].error)
+
+
+if __name__ == '__main__':
+    unittest.main()
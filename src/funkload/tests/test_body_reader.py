@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import gzip
+import zlib
+import hashlib
+import unittest
+from StringIO import StringIO
+from mimetools import Message
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.PatchWebunit import BodyReader, accept_encoding
+
+
+def headers(text):
+    return Message(StringIO(text + '\r\n\r\n'))
+
+
+def gzipped(data):
+    buf = StringIO()
+    gz = gzip.GzipFile(fileobj=buf, mode='wb')
+    gz.write(data)
+    gz.close()
+    return buf.getvalue()
+
+
+class TestBodyReader(unittest.TestCase):
+    body = ''.join(['line %i\n' % i for i in range(20000)])
+
+    def retain(self, code, content_type, kbytes=2):
+        reader = BodyReader(kbytes * 1024, 'md5', [200])
+        reader.chunk_size = 1000
+        data = reader.read(StringIO(self.body), code,
+                           headers('Content-Type: ' + content_type))
+        self.assertEqual(reader.size, len(self.body))
+        self.assertEqual(reader.hexdigest,
+                         hashlib.md5(self.body).hexdigest())
+        return reader, data
+
+    def test_retention(self):
+        # html pages and error responses are kept whole
+        for code, content_type in ((200, 'text/html; charset=utf-8'),
+                                   (404, 'text/plain')):
+            reader, data = self.retain(code, content_type)
+            self.assertEqual(data, self.body)
+            self.failIf(reader.truncated)
+        reader, data = self.retain(200, 'application/octet-stream')
+        self.assertEqual(data, self.body[:2048])
+        self.assert_(reader.truncated)
+        reader, data = self.retain(200, 'text/plain', kbytes=0)
+        self.assertEqual(data, '')
+
+    def read(self, wire, encoding, limit=None, digest=None):
+        reader = BodyReader(limit, digest, [200], decode=True)
+        reader.chunk_size = 1000
+        data = reader.read(StringIO(wire), 200, headers(
+            'Content-Type: text/plain\r\nContent-Encoding: ' + encoding))
+        self.assertEqual(reader.size, len(wire))
+        self.assertEqual(reader.decoded_size, len(self.body))
+        return reader, data
+
+    def test_codings(self):
+        deflated = zlib.compress(self.body)
+        for wire, encoding in ((gzipped(self.body), 'gzip'),
+                               (deflated, 'deflate'),
+                               # raw deflate stream without zlib header
+                               (deflated[2:-4], 'deflate'),
+                               (zlib.compress(gzipped(self.body)),
+                                'gzip, deflate')):
+            reader, data = self.read(wire, encoding)
+            self.assertEqual(data, self.body, encoding)
+        # an unknown coding is not decoded
+        reader = BodyReader(None, None, [200], decode=True)
+        self.assertEqual(reader.read(StringIO('xyz'), 200, headers(
+            'Content-Encoding: compress')), 'xyz')
+
+    def test_decoded_retention(self):
+        reader, data = self.read(gzipped(self.body), 'gzip', limit=100,
+                                 digest='md5')
+        self.assertEqual(data, self.body[:100])
+        self.assert_(reader.truncated)
+        self.assertEqual(reader.hexdigest,
+                         hashlib.md5(self.body).hexdigest())
+
+    def test_accept_encoding(self):
+        self.assertEqual(accept_encoding('gzip;q=1.0, compress, deflate'),
+                         'gzip;q=1.0, deflate')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import unittest
+from StringIO import StringIO
+from mimetools import Message
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.BrowserCache import BrowserCache, freshness_lifetime
+
+
+class Response:
+    def __init__(self, code, headers):
+        self.code = code
+        self.headers = Message(StringIO(headers + '\r\n\r\n'))
+        self.body = 'body'
+
+
+DATE = 'Date: Sun, 06 Nov 1994 08:49:37 GMT\r\n'
+NOW = 784111777
+
+
+class TestBrowserCache(unittest.TestCase):
+
+    def lifetime(self, headers):
+        return freshness_lifetime(Response(200, headers).headers, NOW)
+
+    def test_lifetime(self):
+        self.assertEqual(self.lifetime('Cache-Control: public, max-age=60'),
+                         60)
+        self.assertEqual(self.lifetime('Cache-Control: max-age=60\r\n'
+                                       'Age: 20'), 40)
+        self.assertEqual(self.lifetime(DATE + 'Expires: Sun, 06 Nov 1994 '
+                                       '09:49:37 GMT'), 3600)
+        self.assertEqual(self.lifetime(DATE + 'Expires: 0'), 0)
+        # heuristic of a tenth of the age of the resource
+        self.assertEqual(self.lifetime(DATE + 'Last-Modified: Sun, 06 Nov '
+                                       '1994 07:49:37 GMT'), 360)
+        self.assertEqual(self.lifetime('Cache-Control: no-cache, '
+                                       'max-age=60'), 0)
+        self.assertEqual(self.lifetime('Cache-Control: no-store'), None)
+
+    def test_revalidate(self):
+        cache = BrowserCache()
+        url = 'http://example.com/a.css'
+        cache.store(url, Response(200, 'Cache-Control: max-age=10\r\n'
+                                  'ETag: "v1"'), NOW)
+        self.assertEqual(cache.getFresh(url, NOW + 5).body, 'body')
+        self.assertEqual(cache.getFresh(url, NOW + 10), None)
+        self.assertEqual(cache[url].conditionalHeaders(),
+                         [('If-None-Match', '"v1"')])
+        cache.refresh(url, Response(304, 'Cache-Control: max-age=100'),
+                      NOW + 10)
+        self.assert_(cache.getFresh(url, NOW + 100) is not None)
+        # a response without lifetime nor validator is not stored
+        cache.store(url, Response(200, ''), NOW)
+        self.assert_(url not in cache)
+        cache.store(url, Response(404, 'Cache-Control: max-age=10'), NOW)
+        self.assert_(url not in cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
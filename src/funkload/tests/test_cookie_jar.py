@@ -0,0 +1,76 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import unittest
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.CookieJar import CookieJar, parse_cookie_date
+
+
+class TestCookieJar(unittest.TestCase):
+
+    def test_dates(self):
+        expected = 784111777
+        for text in ('Sun, 06 Nov 1994 08:49:37 GMT',
+                     'Sunday, 06-Nov-94 08:49:37 GMT',
+                     'Sun Nov  6 08:49:37 1994',
+                     'Sun, 06-Nov-1994 08:49:37 GMT',
+                     '6 Nov 1994 08:49:37'):
+            self.assertEqual(parse_cookie_date(text), expected, text)
+        self.assertEqual(parse_cookie_date('Thu, 01 Jan 70 00:00:00 GMT'), 0)
+        self.assertEqual(parse_cookie_date('Sun, 06 Nov 1994'), None)
+        self.assertEqual(parse_cookie_date('Sun, 32 Nov 1994 08:49:37'), None)
+
+    def test_header(self):
+        jar = CookieJar()
+        now = 1000.0
+        jar.setCookie('www.example.com', '/app/page', 'a=1', now)
+        jar.setCookie('www.example.com', '/app/page',
+                      'b=2; Domain=.example.com; Path=/', now)
+        jar.setCookie('www.example.com', '/', 'c=3; Secure', now)
+        # other domains are refused or not sent
+        jar.setCookie('www.example.com', '/', 'd=4; Domain=other.com', now)
+        jar.setCookie('www.badexample.com', '/', 'e=5', now)
+        self.assertEqual(jar.getCookieHeader('www.example.com', '/app/x',
+                                             False, now),
+                         ('a=1; b=2', ['a', 'b']))
+        self.assertEqual(jar.getCookieHeader('static.example.com', '/app',
+                                             True, now), ('b=2', ['b']))
+        self.assertEqual(jar.getCookieHeader('www.example.com', '/',
+                                             True, now)[1], ['b', 'c'])
+        self.assertEqual(jar.getCookieHeader('www.example.com', '/apple',
+                                             False, now)[1], ['b'])
+        # the cached header is dropped when the jar changes
+        jar.setCookie('www.example.com', '/app/page', 'a=10', now)
+        self.assertEqual(jar.getCookieHeader('www.example.com', '/app/x',
+                                             False, now)[0], 'a=10; b=2')
+
+    def test_expire(self):
+        jar = CookieJar()
+        jar.setCookie('example.com', '/', 'a=1; Max-Age=10', 1000.0)
+        jar.setCookie('example.com', '/', 'b=2; Expires=Sun, 06 Nov 1994 '
+                      '08:49:37 GMT', 1000.0)
+        jar.setCookie('example.com', '/', 'c=deleted', 1000.0)
+        self.assertEqual(jar.getCookieHeader('example.com', '/', False,
+                                             1005.0), ('a=1; b=2', ['a', 'b']))
+        self.assertEqual(jar.getCookieHeader('example.com', '/', False,
+                                             1011.0), ('b=2', ['b']))
+        # a cookie in the past removes the stored one
+        jar.setCookie('example.com', '/', 'b=; Max-Age=0', 1011.0)
+        self.assertEqual(jar.getCookieHeader('example.com', '/', False,
+                                             1011.0), (None, []))
+
+    def test_webunit_dict(self):
+        jar = CookieJar()
+        jar.setCookie('example.com', '/', 'a=1', 1000.0)
+        copy = CookieJar(dict(jar))
+        self.assertEqual(copy['example.com']['/']['a'].value, '1')
+        self.assertEqual(copy.getCookieHeader('example.com', '/', False),
+                         ('a=1', ['a']))
+
+
+if __name__ == '__main__':
+    unittest.main()
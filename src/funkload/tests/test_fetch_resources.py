@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import unittest
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.PatchWebunit import fetch_resources, HTTPError
+from funkload.CookieJar import CookieJar
+
+
+class Response:
+    def __init__(self, url, code):
+        self.url = url
+        self.code = code
+
+
+class Session:
+    def __init__(self, codes):
+        self.codes = codes
+        self.images = {}
+        self.css = {}
+        self.history = []
+        self.cookies = CookieJar()
+
+    def fetch(self, url):
+        self.cookies.getCookieHeader('localhost', '/', False)
+        response = Response(url, self.codes[url])
+        if response.code != 200:
+            raise HTTPError(response)
+        return response
+
+
+class FakeTestCase:
+    _accept_invalid_links = False
+    in_bench_mode = True
+    step_success = True
+    test_status = 'Successful'
+    total_time = total_images = total_links = 0
+
+    def __init__(self):
+        self.logged = []
+
+    def logd(self, message):
+        pass
+    logdd = logd
+
+    def _log_response(self, response, rtype, description, time_start,
+                      time_stop, log_body=False, batch_duration=None):
+        self.logged.append((response.url, response.code, log_body))
+
+
+class TestFetchResources(unittest.TestCase):
+    codes = {'/a.png': 200, '/b.png': 404, '/c.css': 200, '/d.png': 500}
+    resources = [('image', '/a.png'), ('image', '/b.png'),
+                 ('link', '/c.css'), ('image', '/d.png')]
+
+    def test_log_errors(self):
+        session = Session(self.codes)
+        ftestcase = FakeTestCase()
+        try:
+            fetch_resources(session, self.resources, ftestcase, 3)
+        except HTTPError as error:
+            self.assertEqual(error.response.url, '/b.png')
+        else:
+            self.fail('no HTTPError raised')
+        # the raised error is logged by the caller, the later ones here
+        self.assertEqual(ftestcase.logged, [('/a.png', 200, False),
+                                            ('/c.css', 200, False),
+                                            ('/d.png', 500, True)])
+        self.assertEqual(ftestcase.test_status, 'Failure')
+        self.assertEqual(sorted(session.images), ['/a.png'])
+        self.assertEqual(session.history, [('image', '/a.png'),
+                                           ('link', '/c.css')])
+
+    def test_accept_invalid_links(self):
+        ftestcase = FakeTestCase()
+        ftestcase._accept_invalid_links = True
+        self.assertRaises(HTTPError, fetch_resources, Session(self.codes),
+                          self.resources, ftestcase, 3)
+        self.assertEqual(len(ftestcase.logged), 2)
+        self.assertEqual(ftestcase.test_status, 'Successful')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import random
+import unittest
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.ReportStats import Histogram, Percentiles, HistogramPercentiles
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_bucket_value(self):
+        histogram = Histogram()
+        for value in (0.0, 0.000001, 0.000127, 0.000128, 0.5, 1.5, 60.0):
+            bucket_value = histogram.bucketValue(histogram.bucket(value))
+            self.assertTrue(abs(bucket_value - value) <=
+                            value / 256.0 + 0.5e-6)
+
+    def test_percentiles_error_bound(self):
+        rand = random.Random(42)
+        values = [rand.expovariate(2.0) for i in range(5000)]
+        exact = Percentiles(stepsize=5, results=values[:])
+        approx = HistogramPercentiles(stepsize=5, results=values)
+        exact.calcPercentiles()
+        approx.calcPercentiles()
+        for perc in range(0, 100, 5):
+            name = "perc%02d" % perc
+            expected = getattr(exact, name)
+            self.assertTrue(abs(getattr(approx, name) - expected) <=
+                            expected / 256.0 + 0.5e-6, name)
+
+    def test_tail_percentiles(self):
+        values = [i / 1000.0 for i in range(1, 10001)]
+        exact = Percentiles(stepsize=10, results=values[:])
+        approx = HistogramPercentiles(stepsize=10, results=values)
+        exact.calcPercentiles()
+        approx.calcPercentiles()
+        self.assertEqual(exact.perc99, 9.901)
+        self.assertEqual(exact.perc999, 9.991)
+        self.assertTrue(9.999 <= exact.perc9999 <= 10.0)
+        for name in ('perc99', 'perc999', 'perc9999'):
+            expected = getattr(exact, name)
+            self.assertTrue(abs(getattr(approx, name) - expected) <=
+                            expected / 256.0 + 0.5e-6, name)
+
+    def test_calc_only_when_changed(self):
+        percentiles = Percentiles(stepsize=50, results=[0.3, 0.1])
+        percentiles.calcPercentiles()
+        self.assertEqual(percentiles.perc50, 0.3)
+        percentiles.addResult(0.2)
+        percentiles.addResult(0.4)
+        percentiles.calcPercentiles()
+        self.assertEqual(percentiles.perc50, 0.3)
+        self.assertEqual(percentiles.perc99, 0.4)
+
+    def test_merge(self):
+        one = HistogramPercentiles(stepsize=50, results=[0.1, 0.2])
+        two = HistogramPercentiles(stepsize=50, results=[0.3, 0.4])
+        one.merge(two)
+        one.calcPercentiles()
+        self.assertEqual(one.histogram.count, 4)
+        self.assertEqual(one.histogram.min, 0.1)
+        self.assertEqual(one.histogram.max, 0.4)
+        self.assertTrue(abs(one.perc50 - 0.3) < 0.3 / 256.0)
+
+    def test_empty(self):
+        percentiles = HistogramPercentiles(stepsize=50)
+        percentiles.calcPercentiles()
+        self.assertEqual(percentiles.perc00, -1.0)
+        self.assertEqual(percentiles.perc50, -1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import unittest
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.LiveStats import LiveStats, parse_abort_rule
+from funkload.FunkLoadHTTPServer import render_metrics
+
+
+class TestLiveStats(unittest.TestCase):
+
+    def complete(self, stats):
+        """Move the results to the previous second, a complete one."""
+        stats.seconds = dict((second - 1, values)
+                             for second, values in stats.seconds.items())
+
+    def test_windows(self):
+        stats = LiveStats()
+        for duration in (0.1, 0.2, 0.3, 0.4):
+            stats.addRequest(duration, True, 'test:1')
+        stats.addRequest(2.0, False, 'test:2')
+        stats.addTest(True)
+        stats.addTest(False)
+        self.complete(stats)
+        windows = stats.getWindows()
+        self.assertEqual(sorted(windows.keys()), ['10s', '1s', '60s'])
+        one = windows['10s']
+        self.assertEqual(one['requests'], 5)
+        self.assertEqual(one['errors'], 1)
+        self.assertEqual(one['error_percent'], 20.0)
+        self.assertEqual(one['tests'], 2)
+        self.assertEqual(one['test_errors'], 1)
+        self.assertAlmostEqual(one['p50'], 0.3, 2)
+        self.assertEqual(one['steps']['test:1']['requests'], 4)
+        self.assertEqual(one['rps'], 0.5)
+        self.assertEqual(stats.getStats()['requests'], 5)
+
+    def test_metrics(self):
+        stats = LiveStats()
+        stats.addRequest(0.5, True, 'test:1')
+        self.complete(stats)
+        text = render_metrics(3, stats.getWindows())
+        lines = text.splitlines()
+        self.assertEqual(lines[-1], '# EOF')
+        self.assert_('funkload_virtual_users 3' in lines)
+        self.assert_('funkload_requests_per_second{window="1s"} 1.0'
+                     in lines)
+        self.assert_('funkload_step_response_seconds{window="1s",'
+                     'step="test:1",quantile="0.5"} 0.5' in lines)
+        # a family is not split
+        types = [line for line in lines if line.startswith('# TYPE')]
+        self.assertEqual(len(types), len(set(types)))
+
+    def test_abort_rule(self):
+        rule = parse_abort_rule('error_percent', '> 50 for 30s')
+        self.assertEqual((rule.threshold, rule.period), (50.0, 30))
+        rule = parse_abort_rule('p95', '0.5s')
+        self.assertEqual((rule.threshold, rule.period), (0.5, 10))
+        self.assertRaises(ValueError, parse_abort_rule, 'p95', '> 1 in 3s')
+        self.assertRaises(ValueError, parse_abort_rule, 'foo', '1')
+        stats = LiveStats()
+        stats.addRequest(1.0, True, 'test:1')
+        self.complete(stats)
+        rule = parse_abort_rule('p95', '0.5 for 2s')
+        # the period is not recorded yet
+        self.assertEqual(rule.check(stats), None)
+        stats.start -= 2
+        self.assert_(rule.check(stats).startswith('p95 1.000 > 0.5'))
+        self.assertEqual(parse_abort_rule('p95', '2 for 2s').check(stats), None)
+        self.assertEqual(parse_abort_rule('error_percent', '1 for 1s'
+                                          ).check(stats), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import unittest
+from tempfile import mkstemp
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.LoadProfile import get_load_profile
+
+
+class TestLoadProfile(unittest.TestCase):
+
+    def test_ramp(self):
+        profile = get_load_profile('ramp:1:101', 100)
+        self.assertEqual(profile.cvus(0), 1)
+        self.assertEqual(profile.cvus(50), 51)
+        self.assertEqual(profile.cvus(100), 101)
+        self.assertEqual(profile.cvus(200), 101)
+        self.assertEqual(profile.windows(25), [14, 39, 64, 89])
+
+    def test_step(self):
+        profile = get_load_profile('step:10:20:30', 30)
+        self.assertEqual([profile.cvus(t) for t in (0, 9, 10, 25, 30)],
+                         [10, 10, 20, 30, 30])
+
+    def test_spike(self):
+        profile = get_load_profile('spike:10:100', 100)
+        self.assertEqual([profile.cvus(t) for t in (0, 50, 59, 60)],
+                         [10, 100, 100, 10])
+        profile = get_load_profile('spike:10:100:20:5', 100)
+        self.assertEqual([profile.cvus(t) for t in (19, 20, 25)],
+                         [10, 100, 10])
+
+    def test_sine(self):
+        profile = get_load_profile('sine:50:40', 60)
+        self.assertEqual([profile.cvus(t) for t in (0, 15, 30, 45)],
+                         [50, 90, 50, 10])
+        profile = get_load_profile('sine:10:40:60', 60)
+        self.assertEqual(profile.cvus(45), 0)
+
+    def test_csv(self):
+        fd, path = mkstemp(suffix='.csv')
+        os.write(fd, '# time,cvus\n0,10\n10,20\n30,0\n')
+        os.close(fd)
+        try:
+            profile = get_load_profile('csv:' + path, 60)
+        finally:
+            os.remove(path)
+        self.assertEqual([profile.cvus(t) for t in (0, 5, 10, 20, 40)],
+                         [10, 15, 20, 10, 0])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, get_load_profile, 'foo:1', 10)
+        self.assertRaises(ValueError, get_load_profile, 'ramp:1', 10)
+        self.assertRaises(ValueError, get_load_profile, 'ramp:a:b', 10)
+        self.assertRaises(ValueError, get_load_profile, 'step', 10)
+        # negative numbers of users
+        self.assertRaises(ValueError, get_load_profile, 'ramp:-2:4', 10)
+        self.assertRaises(ValueError, get_load_profile, 'step:1:-1', 10)
+        self.assertRaises(ValueError, get_load_profile, 'spike:-1:10', 10)
+        fd, path = mkstemp(suffix='.csv')
+        os.write(fd, '0,10\n10,-5\n')
+        os.close(fd)
+        try:
+            self.assertRaises(ValueError, get_load_profile, 'csv:' + path, 10)
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
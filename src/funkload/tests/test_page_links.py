@@ -0,0 +1,45 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import unittest
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.PageLinks import PageLinks
+
+PAGE = """<HTML><head><base href="http://example.com/app/">
+<link rel=stylesheet href='style.css'>
+<script src="main.js"></script>
+<script>document.write('<img src="written.png">');</script>
+<!-- <img src="commented.png"> -->
+</head><body>
+<IMG alt="a > b" SRC="logo.png?w=1&amp;h=2">
+<a href="/page1">Page <b>1</b></a> <a name="top">top</a>
+<A HREF=page2>two<iframe src="frame.html"></iframe>
+<script src=late.js>
+"""
+
+
+class TestPageLinks(unittest.TestCase):
+
+    def test_links(self):
+        links = PageLinks(PAGE)
+        self.assertEqual(links.base, 'http://example.com/app/')
+        self.assertEqual(links.resources, [('link', 'style.css'),
+                                           ('image', 'logo.png?w=1&h=2')])
+        self.assertEqual(links.scripts, ['main.js', 'late.js'])
+        self.assertEqual(links.iframes, ['frame.html'])
+        self.assertEqual(links.anchors[0], ('Page <b>1</b>', '/page1'))
+        self.assertEqual([href for text, href in links.anchors],
+                         ['/page1', 'page2'])
+
+    def test_empty(self):
+        links = PageLinks(None)
+        self.assertEqual((links.base, links.resources, links.anchors),
+                         (None, [], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
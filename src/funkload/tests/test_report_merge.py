@@ -0,0 +1,116 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import unittest
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.ReportStats import AllResponseStat, PageStat, ResponseStat
+from funkload.ReportStats import InjectorStat
+
+
+RESPONSES = [('000', 'get', 100.1, 'Successful', 0.5),
+             ('000', 'image', 100.2, 'Successful', 0.25),
+             ('001', 'get', 100.5, 'Failure', 1.5),
+             ('000', 'post', 101.3, 'Successful', 2.0),
+             ('001', 'get', 102.1, 'Successful', 0.75)]
+
+
+class TestReportMerge(unittest.TestCase):
+
+    def add(self, stats, responses):
+        response, page, step = stats
+        for thread, rtype, date, result, duration in responses:
+            response.add(date, result, duration)
+            page.add(thread, '001', date, result, duration, rtype)
+            step.add(rtype, result, '/', duration)
+
+    def new_stats(self):
+        return (AllResponseStat('000', 10, 2), PageStat('000', 10, 2),
+                ResponseStat('001', '001', 2))
+
+    def test_merge(self):
+        single = self.new_stats()
+        self.add(single, RESPONSES)
+        one = self.new_stats()
+        self.add(one, [r for r in RESPONSES if r[0] == '000'])
+        two = self.new_stats()
+        self.add(two, [r for r in RESPONSES if r[0] == '001'])
+        for stat, other, expected in zip(one, two, single):
+            stat.merge(other)
+            stat.finalize()
+            expected.finalize()
+            for name in ('count', 'success', 'error', 'min', 'max', 'avg',
+                         'rps', 'apdex_score'):
+                if hasattr(expected, name):
+                    self.assertEqual(getattr(stat, name),
+                                     getattr(expected, name), name)
+            self.assertEqual(stat.percentiles.perc50,
+                             expected.percentiles.perc50)
+        self.assertEqual(one[1].per_second, single[1].per_second)
+
+    def test_corrected(self):
+        stat = AllResponseStat('000', 10, 2)
+        stat.add(100.0, 'Successful', 0.5)
+        self.assertEqual(stat.corrected, None)
+        other = AllResponseStat('000', 10, 2)
+        # started 1.5s after its intended start
+        other.add(101.5, 'Successful', 0.5, 100.0)
+        stat.merge(other)
+        stat.finalize()
+        self.assertEqual(stat.percentiles.perc95, 0.5)
+        self.assertEqual(stat.corrected.perc95, 2.0)
+
+    def test_injector(self):
+        stat = InjectorStat('000', 2)
+        stat.add(50.0, 10, 0.01, 0.05, 0, 0.0, 0.0)
+        other = InjectorStat('000', 2)
+        other.add(90.0, 30, 0.03, 0.2, 10, 0.1, 0.4)
+        stat.merge(other)
+        stat.finalize()
+        self.assertEqual(stat.cpu, 70.0)
+        self.assertEqual(stat.cpu_max, 90.0)
+        self.assertAlmostEqual(stat.sleep_lag, 0.025)
+        self.assertEqual(stat.sleep_lag_max, 0.2)
+        self.assertAlmostEqual(stat.lag(), 0.1)
+
+    def test_phases(self):
+        stat = ResponseStat('001', '001', 1)
+        stat.addPhases({'dns': '0.01', 'connect': '0.02', 'tls': '0.03',
+                        'ttfb': '0.1', 'transfer': '0.2'})
+        # a response logged without phases
+        stat.addPhases({'duration': '1.0'})
+        other = ResponseStat('001', '001', 1)
+        self.assertEqual(other.getPhases(), None)
+        other.addPhases({'dns': '0', 'connect': '0', 'tls': '0',
+                         'ttfb': '0.3', 'transfer': '0.4'})
+        stat.merge(other)
+        phases = stat.getPhases()
+        self.assertAlmostEqual(phases['dns'], 0.005)
+        self.assertAlmostEqual(phases['ttfb'], 0.2)
+        self.assertAlmostEqual(phases['transfer'], 0.3)
+
+    def test_bytes(self):
+        stat = AllResponseStat('000', 10, 1)
+        stat.addBytes({'time': '100.1', 'sent': '100', 'received': '1000',
+                       'decoded': '3000'})
+        # a response logged without sizes
+        stat.addBytes({'time': '100.2'})
+        other = AllResponseStat('000', 10, 1)
+        self.assertFalse(other.hasBytes())
+        other.addBytes({'time': '100.5', 'sent': '200', 'received': '3000',
+                        'decoded': '3000'})
+        other.addBytes({'time': '101.0', 'sent': '300', 'received': '2000',
+                        'decoded': '2000'})
+        stat.merge(other)
+        self.assertEqual((stat.bytes_count, stat.sent, stat.received,
+                          stat.decoded), (3, 600, 6000, 8000))
+        self.assertEqual(stat.bytes_per_second, {100: [300, 4000],
+                                                 101: [300, 2000]})
+        self.assertEqual(stat.getSizes().perc50, 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
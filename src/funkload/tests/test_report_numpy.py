@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import random
+import unittest
+from tempfile import mkdtemp
+from shutil import rmtree
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.ReportBuilder import FunkLoadXmlParser, FunkLoadNumpyXmlParser
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+RESPONSE = ('<response cycle="%.3i" cvus="%.3i" thread="%.3i" suite="S" '
+            'name="test" step="%.3i" number="001" type="%s" result="%s" '
+            'url="/%s" code="200" description="" time="%s" duration="%s"'
+            '%s />\n')
+
+
+class TestReportNumpy(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'funkload.xml')
+        rand = random.Random(42)
+        f = open(self.path, 'w')
+        f.write('<funkload version="1.0" time="now">\n'
+                '<config key="duration" value="10" />\n')
+        date = 1000.0
+        for cycle, cvus in enumerate((2, 10)):
+            for i in range(2000):
+                rtype = rand.choice(('get', 'post', 'image', 'link'))
+                result = rand.random() < 0.05 and 'Failure' or 'Successful'
+                duration = rand.expovariate(2.0)
+                batch = ''
+                if rtype == 'image' and rand.random() < 0.5:
+                    batch = ' batch_duration="%s"' % (duration * 2)
+                date += rand.random() / 100
+                if cycle:
+                    # scheduled responses
+                    batch += ' intended="%s"' % (date - rand.random())
+                f.write(RESPONSE % (cycle, cvus, rand.randrange(cvus),
+                                    rand.randrange(5), rtype, result,
+                                    rtype, date, duration, batch))
+        f.write('</funkload>\n')
+        f.close()
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def assertSameStat(self, stat, other):
+        stat.finalize()
+        other.finalize()
+        for name in ('count', 'success', 'error', 'min', 'avg', 'max',
+                     'total', 'rps', 'rps_max', 'apdex_score'):
+            if hasattr(stat, name):
+                self.assertEqual(getattr(stat, name), getattr(other, name),
+                                 name)
+        for perc, name in stat.percentiles._percentiles():
+            self.assertEqual(getattr(stat.percentiles, name),
+                             getattr(other.percentiles, name), name)
+        self.assertEqual(stat.corrected is None, other.corrected is None)
+        if stat.corrected is not None:
+            for perc, name in stat.corrected._percentiles():
+                self.assertEqual(getattr(stat.corrected, name),
+                                 getattr(other.corrected, name), name)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_same_stats(self):
+        parser = FunkLoadXmlParser()
+        parser.parse(self.path)
+        numpy_parser = FunkLoadNumpyXmlParser()
+        numpy_parser.parse(self.path)
+        self.assertEqual(sorted(parser.stats), sorted(numpy_parser.stats))
+        for cycle, stats in parser.stats.items():
+            numpy_stats = numpy_parser.stats[cycle]
+            self.assertSameStat(stats['response'], numpy_stats['response'])
+            self.assertSameStat(stats['page'], numpy_stats['page'])
+            self.assertEqual(stats['page'].per_second,
+                             numpy_stats['page'].per_second)
+            self.assertEqual(sorted(stats['response_step']),
+                             sorted(numpy_stats['response_step']))
+            for step, stat in stats['response_step'].items():
+                self.assertSameStat(stat, numpy_stats['response_step'][step])
+
+
+if __name__ == '__main__':
+    unittest.main()
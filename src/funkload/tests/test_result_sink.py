@@ -0,0 +1,35 @@
+#! /usr/bin/env python
+
+import os
+import sys
+import unittest
+
+if os.path.realpath(os.curdir) == os.path.realpath(os.path.dirname(__file__)):
+    sys.path.append('../..')
+
+from funkload.ResultSink import ResultSink
+
+
+class TestResultSink(unittest.TestCase):
+
+    def test_release_empty_buffer(self):
+        written = []
+        sink = ResultSink(written.extend, 10, interval=60)
+        try:
+            running = sink.buffer()
+            released = sink.buffer()
+            # two empty buffers are equal deques, the running one is first
+            self.assertEqual(released, running)
+            sink.release(released)
+            sink.drain()
+            self.assertEqual(len(sink.buffers), 1)
+            self.assert_(sink.buffers[0] is running)
+            sink.append(running, 'record')
+            sink.drain()
+            self.assertEqual(written, ['record'])
+        finally:
+            sink.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,6 +24,7 @@ import os
 import sys
 import time
 import logging
+import threading
 from time import sleep
 from socket import error as SocketError
 from xmlrpclib import ServerProxy
@@ -32,12 +33,122 @@ import tarfile
 import tempfile
 
 
-def thread_sleep(seconds=0):
-    """Sleep seconds."""
+def thread_sleep(seconds=0, lag=True):
+    """Sleep seconds, the wake up delay is added to the sleep lag.
+
+    Use lag=False for the sleeps of the injector that are not sleeps of a
+    virtual user."""
     # looks like python >= 2.5 does not need a minimal sleep to let thread
     # working properly
     if seconds:
+        start = monotonic()
         sleep(seconds)
+        if lag:
+            _sleep_lag.add(monotonic() - start - seconds)
+
+
+# ------------------------------------------------------------
+# clock
+#
+def _monotonic_clock():
+    """Return a monotonic clock in seconds, durations measured with it are
+    not changed by the adjustments of the wall clock. Fall back on
+    time.time when the platform has none."""
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    if not sys.platform.startswith('linux'):
+        return time.time
+    try:
+        import ctypes
+        import ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1',
+                            use_errno=True)
+        clock_gettime = librt.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    except (OSError, AttributeError, ImportError):
+        return time.time
+    CLOCK_MONOTONIC = 1
+
+    def monotonic():
+        value = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(value)) != 0:
+            return time.time()
+        return value.tv_sec + value.tv_nsec * 1e-9
+    return monotonic
+
+monotonic = _monotonic_clock()
+
+# phases of a request, the attributes of the logged responses
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'transfer')
+
+
+class Stopwatch:
+    """Measure a duration with the monotonic clock.
+
+    start is the wall time of the start, stop returns the wall time of the
+    start plus the monotonic duration so timestamps and durations agree."""
+    def __init__(self):
+        self.start = time.time()
+        self._start = monotonic()
+
+    def elapsed(self):
+        """Return the duration since the start."""
+        return monotonic() - self._start
+
+    def stop(self):
+        """Return the wall time of the stop."""
+        return self.start + self.elapsed()
+
+
+# ------------------------------------------------------------
+# injector lag
+#
+class LagCounter:
+    """Count the delays of the virtual users after their targets, a busy
+    injector wakes up its threads late."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = self.max = 0.0
+
+    def add(self, lag):
+        """Add a delay in seconds."""
+        lag = max(lag, 0.0)
+        self.lock.acquire()
+        try:
+            self.count += 1
+            self.total += lag
+            if lag > self.max:
+                self.max = lag
+        finally:
+            self.lock.release()
+
+    def pop(self):
+        """Return the count, average and max delays then reset."""
+        self.lock.acquire()
+        try:
+            ret = (self.count, self.count and self.total / self.count or 0.0,
+                   self.max)
+            self.count = 0
+            self.total = self.max = 0.0
+        finally:
+            self.lock.release()
+        return ret
+
+_sleep_lag = LagCounter()
+_start_lag = LagCounter()
+
+def get_sleep_lag():
+    """Return the lag of the sleeps."""
+    return _sleep_lag
+
+def get_start_lag():
+    """Return the lag of the scheduled test starts."""
+    return _start_lag
 
 # ------------------------------------------------------------
 # semaphores
@@ -218,10 +329,16 @@ def xmlrpc_list_credentials(host, port, group=None):
 # ------------------------------------------------------------
 # misc
 #
+_version = None
+
 def get_version():
     """Retrun the FunkLoad package version."""
-    from pkg_resources import get_distribution
-    return get_distribution('funkload').version
+    global _version
+    if _version is None:
+        # looking up the distribution is slow, each test case needs it
+        from pkg_resources import get_distribution
+        _version = get_distribution('funkload').version
+    return _version
 
 
 _COLOR = {'green': "\x1b[32;01m",